@@ -11,6 +11,7 @@ https://docs.djangoproject.com/en/5.1/ref/settings/
 """
 
 import os
+import tempfile
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -95,6 +96,27 @@ DATABASES = {
 }
 
 
+# Caches
+# https://docs.djangoproject.com/en/5.1/topics/cache/
+#
+# "shared" holds discovery, statistics, footprint and geometry lookups for
+# all gunicorn workers (see watershed/shared_cache.py).
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'shared': {
+        'BACKEND': 'server.watershed.shared_cache.SizedFileBasedCache',
+        'LOCATION': os.environ.get("SHARED_CACHE_DIR") or os.path.join(tempfile.gettempdir(), 'watershed-cache'),
+        'TIMEOUT': 3600,
+        'OPTIONS': {
+            'MAX_BYTES': int(os.environ.get("SHARED_CACHE_MAX_MB") or 256) * 1024 * 1024,
+        },
+    },
+}
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
 
@@ -143,6 +165,10 @@ CORS_ALLOWED_ORIGINS = [
     'https://firewisewatersheds.org',
 ]
 
+# Quantization headers of raw-data tiles (see watershed/tiles/data.py) and
+# the data version used to stamp cacheable URLs (see watershed/versioning.py).
+CORS_EXPOSE_HEADERS = ['X-Tile-Dtype', 'X-Tile-Scale', 'X-Tile-Offset', 'X-Tile-Nodata', 'ETag', 'X-Data-Version']
+
 REST_FRAMEWORK = {
     'DEFAULT_SCHEMA_CLASS': 'drf_spectacular.openapi.AutoSchema',
 }
@@ -0,0 +1,194 @@
+"""
+Persistent catalog of discovered RHESSys products.
+
+The RHESSys discovery endpoints scrape WEPPcloud browse pages, which is slow
+and used to be repeated by every worker after a restart or cache expiry.
+Their results are stored in the ``DiscoveryCatalog`` table, one entry per
+runid and kind (spatial inputs or output maps), and served from there:
+
+  - a run seen for the first time is scanned within the request (bounded by
+    the fan-out deadline, see ``fanout.py``), once for all concurrent
+    requests of every worker (see ``singleflight.py``);
+  - an entry older than ``DISCOVERY_CATALOG_MAX_AGE`` seconds (default one
+    hour), or one cut short by the deadline, is still served while a
+    background thread re-scans it (stale-while-revalidate).  A refresh is
+    claimed in the database so only one worker runs it;
+  - ``python manage.py rebuild_discovery_catalog`` re-scans every run.
+
+A refresh that finds nothing for a run that had products keeps the old
+entry: an unreachable browse page looks the same as a run without data.
+"""
+
+from __future__ import annotations
+
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Any, Callable, Optional
+
+from django.db import DatabaseError, connections
+from django.db.models import Q
+from django.utils import timezone
+
+from server.watershed.fanout import get_fanout_config
+from server.watershed.loaders.config import _get_env_int
+from server.watershed.shared_cache import SharedCache
+from server.watershed.singleflight import single_flight
+
+logger = logging.getLogger("watershed.catalog")
+
+SPATIAL_INPUTS = "spatial"
+OUTPUT_MAPS = "outputs"
+
+# scan(runid, deadline) → (payload, complete); payload is None for a run
+# without products of that kind.
+Scan = Callable[[str, Optional[float]], tuple[Any, bool]]
+
+# A refresh claimed longer ago than this is presumed dead and re-claimable.
+_REFRESH_TIMEOUT = timedelta(minutes=10)
+
+# (kind, runid) → entry, so the table is not queried on every request.
+_entry_cache = SharedCache("catalog", ttl=60)
+
+_refreshing: set[tuple[str, str]] = set()
+_refresh_lock = threading.Lock()
+_refresh_executor: Optional[ThreadPoolExecutor] = None
+
+
+@dataclass(frozen=True)
+class CatalogEntry:
+    """Stored discovery result of one run."""
+    payload: Any
+    complete: bool
+    refreshed_at: datetime
+
+    def is_stale(self) -> bool:
+        max_age = _get_env_int("DISCOVERY_CATALOG_MAX_AGE", 3600)
+        return not self.complete or timezone.now() - self.refreshed_at > timedelta(seconds=max_age)
+
+
+def _load_entry(kind: str, runid: str) -> Optional[CatalogEntry]:
+    from server.watershed.models import DiscoveryCatalog
+
+    try:
+        row = DiscoveryCatalog.objects.filter(runid=runid, kind=kind).first()
+    except DatabaseError as exc:
+        logger.warning("Catalog lookup failed for %s %s: %s", kind, runid, exc)
+        return None
+    if row is None:
+        return None
+    return CatalogEntry(row.payload, row.complete, row.refreshed_at)
+
+
+def _store_entry(kind: str, runid: str, entry: CatalogEntry) -> None:
+    from server.watershed.models import DiscoveryCatalog
+
+    try:
+        DiscoveryCatalog.objects.update_or_create(
+            runid=runid,
+            kind=kind,
+            defaults={
+                "payload": entry.payload,
+                "complete": entry.complete,
+                "refreshed_at": entry.refreshed_at,
+                "refresh_started_at": None,
+            },
+        )
+    except DatabaseError as exc:
+        logger.warning("Could not store catalog for %s %s: %s", kind, runid, exc)
+
+
+def _claim_refresh(kind: str, runid: str, seen: CatalogEntry) -> bool:
+    """
+    Mark a refresh of the *seen* entry as started; False if another worker
+    already runs one or has stored a newer entry.
+    """
+    from server.watershed.models import DiscoveryCatalog
+
+    now = timezone.now()
+    try:
+        return DiscoveryCatalog.objects.filter(
+            runid=runid, kind=kind, refreshed_at=seen.refreshed_at,
+        ).filter(
+            Q(refresh_started_at__isnull=True) | Q(refresh_started_at__lt=now - _REFRESH_TIMEOUT),
+        ).update(refresh_started_at=now) > 0
+    except DatabaseError as exc:
+        logger.warning("Could not claim catalog refresh for %s %s: %s", kind, runid, exc)
+        return False
+
+
+def refresh_catalog(kind: str, runid: str, scan: Scan, deadline: Optional[float] = None) -> CatalogEntry:
+    """Scan a run now, store the result and return it."""
+    payload, complete = scan(runid, deadline)
+    if payload is None:
+        previous = _load_entry(kind, runid)
+        if previous is not None and previous.payload is not None:
+            logger.warning("Discovery found no %s for %s; keeping the previous catalog", kind, runid)
+            payload = previous.payload
+
+    entry = CatalogEntry(payload, complete, timezone.now())
+    _store_entry(kind, runid, entry)
+    _entry_cache.set((kind, runid), entry)
+    return entry
+
+
+def _refresh_in_background(kind: str, runid: str, scan: Scan) -> None:
+    try:
+        refresh_catalog(kind, runid, scan)
+    except Exception:
+        logger.exception("Catalog refresh failed for %s %s", kind, runid)
+    finally:
+        with _refresh_lock:
+            _refreshing.discard((kind, runid))
+        connections.close_all()
+
+
+def _schedule_refresh(kind: str, runid: str, scan: Scan, seen: CatalogEntry) -> None:
+    global _refresh_executor
+    key = (kind, runid)
+    with _refresh_lock:
+        if key in _refreshing:
+            return
+        _refreshing.add(key)
+        if _refresh_executor is None:
+            # Separate from the fan-out pool: refreshes fan out themselves.
+            _refresh_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="catalog")
+
+    if not _claim_refresh(kind, runid, seen):
+        # Re-read the table next time: another worker may have refreshed it.
+        _entry_cache.delete(key)
+        with _refresh_lock:
+            _refreshing.discard(key)
+        return
+    _refresh_executor.submit(_refresh_in_background, kind, runid, scan)
+
+
+def get_catalog(kind: str, runid: str, scan: Scan) -> Any:
+    """
+    Return the discovered products of *kind* for a run.
+
+    Serves the stored entry, refreshing it in the background when stale;
+    a run without an entry is scanned within the request deadline.
+    """
+    key = (kind, runid)
+    entry = _entry_cache.get(key) or _load_entry(kind, runid)
+    if entry is None:
+        entry = single_flight(
+            f"catalog:{kind}:{runid}",
+            lambda: refresh_catalog(kind, runid, scan, deadline=get_fanout_config().deadline()),
+            lookup=lambda: _load_entry(kind, runid),
+        )
+        _entry_cache.set(key, entry)
+        return entry.payload
+
+    _entry_cache.set(key, entry)
+    if entry.is_stale():
+        _schedule_refresh(kind, runid, scan, entry)
+    return entry.payload
+
+
+def clear_catalog_cache() -> None:
+    """Drop catalog entries kept in memory (useful for testing)."""
+    _entry_cache.clear()
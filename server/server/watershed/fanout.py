@@ -0,0 +1,209 @@
+"""
+Bounded concurrent fan-out of blocking remote operations.
+
+Discovery endpoints probe many WEPPcloud browse pages and raster statistics
+in one request.  ``fan_out`` runs such calls on a shared, bounded thread pool
+instead of one after another, with:
+
+  - a per-host concurrency limit, so one request cannot open dozens of
+    connections to the same upstream server (local files count as one host);
+  - an optional overall deadline: calls still queued or waiting for their
+    host when it passes are cancelled, and the result is flagged incomplete
+    instead of holding the request open.  Calls already running finish in
+    the background, so their side effects (recorded revisions, stored
+    statistics) still benefit the next request.
+
+Settings come from the environment:
+
+  - ``FANOUT_MAX_WORKERS`` (default 16): threads shared by all requests of a
+    worker process
+  - ``FANOUT_PER_HOST`` (default 4): concurrent calls per host
+  - ``FANOUT_DEADLINE_SECONDS`` (default 20): deadline used by discovery
+    endpoints (0 waits for every call)
+"""
+
+from __future__ import annotations
+
+import logging
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+from typing import Callable, Generic, Hashable, Iterable, Optional, TypeVar
+from urllib.parse import urlsplit
+
+from django.db import connections
+
+from server.watershed.loaders.config import _get_env_int
+
+logger = logging.getLogger("watershed.fanout")
+
+K = TypeVar("K", bound=Hashable)
+V = TypeVar("V")
+
+LOCAL_HOST = "local"
+
+
+@dataclass
+class FanoutConfig:
+    """
+    Configuration for concurrent fan-out of remote operations.
+
+    Attributes:
+        max_workers: Threads shared by all fan-outs in a worker process
+        per_host: Maximum concurrent calls to one host
+        deadline_seconds: Overall deadline of a discovery request (0 disables)
+    """
+    max_workers: int = 16
+    per_host: int = 4
+    deadline_seconds: int = 20
+
+    @classmethod
+    def from_environment(cls) -> "FanoutConfig":
+        """Create config from environment variables."""
+        return cls(
+            max_workers=max(1, _get_env_int("FANOUT_MAX_WORKERS", cls.max_workers)),
+            per_host=max(1, _get_env_int("FANOUT_PER_HOST", cls.per_host)),
+            deadline_seconds=_get_env_int("FANOUT_DEADLINE_SECONDS", cls.deadline_seconds),
+        )
+
+    def deadline(self) -> Optional[float]:
+        """Return the deadline of an operation starting now, as a ``time.monotonic()`` value."""
+        if self.deadline_seconds <= 0:
+            return None
+        return time.monotonic() + self.deadline_seconds
+
+
+@dataclass
+class FanoutResult(Generic[K, V]):
+    """
+    Results of a fan-out by key.
+
+    ``complete`` is False when the deadline passed before every call
+    finished; the missing keys are in ``pending``.  Calls that raised are
+    logged and left out of ``results`` without affecting ``complete``.
+    """
+    results: dict[K, V] = field(default_factory=dict)
+    pending: list[K] = field(default_factory=list)
+
+    @property
+    def complete(self) -> bool:
+        return not self.pending
+
+
+class DeadlineExceeded(Exception):
+    """Raised inside a fan-out call that could not start before the deadline."""
+
+
+def host_of(source: str) -> str:
+    """Return the host a URL points to, or ``LOCAL_HOST`` for a local path."""
+    if "://" not in source:
+        return LOCAL_HOST
+    return urlsplit(source).netloc.lower()
+
+
+_config: Optional[FanoutConfig] = None
+_executor: Optional[ThreadPoolExecutor] = None
+_host_slots: dict[str, threading.BoundedSemaphore] = {}
+_lock = threading.Lock()
+
+
+def get_fanout_config() -> FanoutConfig:
+    """
+    Get the default fan-out configuration.
+
+    Lazily initializes from environment on first call.
+    """
+    global _config
+    if _config is None:
+        _config = FanoutConfig.from_environment()
+    return _config
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    with _lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=get_fanout_config().max_workers,
+                thread_name_prefix="fanout",
+            )
+        return _executor
+
+
+def _host_slot(host: str) -> threading.BoundedSemaphore:
+    with _lock:
+        slot = _host_slots.get(host)
+        if slot is None:
+            slot = _host_slots[host] = threading.BoundedSemaphore(get_fanout_config().per_host)
+        return slot
+
+
+def _remaining(deadline: Optional[float]) -> Optional[float]:
+    if deadline is None:
+        return None
+    return max(0.0, deadline - time.monotonic())
+
+
+def _run(host: str, fn: Callable[[], V], deadline: Optional[float]) -> V:
+    slot = _host_slot(host)
+    remaining = _remaining(deadline)
+    if not slot.acquire(timeout=remaining):
+        raise DeadlineExceeded(host)
+    try:
+        return fn()
+    finally:
+        slot.release()
+        # Database connections are per thread; don't leave them open in the pool.
+        connections.close_all()
+
+
+def fan_out(
+    calls: Iterable[tuple[K, str, Callable[[], V]]],
+    deadline: Optional[float] = None,
+) -> FanoutResult[K, V]:
+    """
+    Run ``(key, source, fn)`` calls concurrently and collect ``fn()`` by key.
+
+    *source* is the URL or path the call reads, used for the per-host limit.
+    *deadline* is a ``time.monotonic()`` value; None waits for every call.
+    """
+    executor = _get_executor()
+    futures: dict[Future, K] = {
+        executor.submit(_run, host_of(source), fn, deadline): key
+        for key, source, fn in calls
+    }
+    result: FanoutResult[K, V] = FanoutResult()
+
+    not_done = set(futures)
+    while not_done:
+        remaining = _remaining(deadline)
+        if remaining == 0:
+            break
+        done, not_done = wait(not_done, timeout=remaining, return_when=FIRST_COMPLETED)
+        for future in done:
+            key = futures[future]
+            try:
+                result.results[key] = future.result()
+            except DeadlineExceeded:
+                result.pending.append(key)
+            except Exception as exc:
+                logger.warning("Fan-out call %r failed: %s", key, exc)
+
+    for future in not_done:
+        future.cancel()
+        result.pending.append(futures[future])
+    if result.pending:
+        logger.info("Fan-out deadline passed with %d of %d calls unfinished", len(result.pending), len(futures))
+    return result
+
+
+def reset_fanout() -> None:
+    """Reset the configuration, thread pool and host limits (useful for testing)."""
+    global _config, _executor
+    with _lock:
+        if _executor is not None:
+            _executor.shutdown(wait=False, cancel_futures=True)
+        _config = None
+        _executor = None
+        _host_slots.clear()
@@ -0,0 +1,109 @@
+"""
+Viewport, attribute and page filtering for the GeoJSON list endpoints.
+
+Query parameters (all optional, combinable):
+
+  - ``bbox=west,south,east,north`` in EPSG:4326: only features whose
+    geometry intersects the box.  ``ST_Intersects`` first checks ``&&``
+    against the GiST index of the geometry column, so the cost grows with
+    what is on screen rather than with the table.
+  - attribute filters: ``<field>=<value>`` for the fields a view allows;
+    repeating a parameter matches any of its values.
+  - ``limit`` / ``offset``: a page of features in a stable order.  The
+    FeatureCollection then also carries ``numberMatched``,
+    ``numberReturned`` and, when more features remain, a ``next`` link
+    (as in OGC API - Features).
+
+Without parameters every feature is returned, as before.
+"""
+
+from dataclasses import dataclass
+from typing import Iterable, Optional
+
+from django.contrib.gis.geos import Polygon
+from rest_framework.exceptions import ValidationError
+
+# Largest page a client can request.
+MAX_LIMIT = 5000
+
+
+@dataclass
+class Page:
+    """A requested page of a feature collection."""
+    limit: int
+    offset: int = 0
+
+
+def parse_bbox(value: str) -> Polygon:
+    """Parse ``west,south,east,north`` degrees into an EPSG:4326 polygon."""
+    try:
+        west, south, east, north = (float(v) for v in value.split(","))
+    except ValueError:
+        raise ValidationError({"bbox": "Expected four numbers: west,south,east,north."})
+    if not (-180 <= west < east <= 180 and -90 <= south < north <= 90):
+        raise ValidationError({"bbox": "Bounds must be ordered west<east, south<north and lie within EPSG:4326."})
+    bbox = Polygon.from_bbox((west, south, east, north))
+    bbox.srid = 4326
+    return bbox
+
+
+def _non_negative_int(params, name: str) -> Optional[int]:
+    value = params.get(name)
+    if value is None:
+        return None
+    try:
+        number = int(value)
+    except ValueError:
+        number = -1
+    if number < 0:
+        raise ValidationError({name: "Expected a non-negative integer."})
+    return number
+
+
+def parse_page(params) -> Optional[Page]:
+    """Return the requested page, or None when ``limit`` is not given."""
+    limit = _non_negative_int(params, "limit")
+    offset = _non_negative_int(params, "offset") or 0
+    if limit is None:
+        return None
+    return Page(min(max(limit, 1), MAX_LIMIT), offset)
+
+
+def filter_features(queryset, params, geo_field: str = "geom", attributes: Iterable[str] = ()):
+    """Apply the ``bbox`` and attribute filters in *params* to *queryset*."""
+    bbox = params.get("bbox")
+    if bbox:
+        queryset = queryset.filter(**{f"{geo_field}__intersects": parse_bbox(bbox)})
+
+    for name in attributes:
+        values = params.getlist(name)
+        try:
+            if len(values) == 1:
+                queryset = queryset.filter(**{name: values[0]})
+            elif values:
+                queryset = queryset.filter(**{f"{name}__in": values})
+        except ValueError:
+            raise ValidationError({name: f"Invalid value for {name}."})
+    return queryset
+
+
+def paginate(request, queryset, page: Page, order_by: str):
+    """
+    Slice *queryset* to *page* and return ``(queryset, members)`` where
+    *members* are the extra FeatureCollection members describing the page.
+    """
+    matched = queryset.count()
+    rows = queryset.order_by(order_by)[page.offset:page.offset + page.limit]
+    returned = max(0, min(page.limit, matched - page.offset))
+    members = {"numberMatched": matched, "numberReturned": returned}
+
+    if page.offset + returned < matched:
+        params = request.GET.copy()
+        params["offset"] = str(page.offset + returned)
+        params["limit"] = str(page.limit)
+        members["links"] = [{
+            "rel": "next",
+            "type": "application/geo+json",
+            "href": request.build_absolute_uri(f"{request.path}?{params.urlencode()}"),
+        }]
+    return rows, members
@@ -3,17 +3,119 @@ Utility for high-performance GeoJSON FeatureCollection generation.
 
 Uses PostGIS ST_AsGeoJSON to serialize geometries directly in the database,
 bypassing Python GEOS -> GeoJSON conversion overhead.
+
+A collection is either built in memory (:func:`geojson_response`) or
+streamed (:func:`geojson_stream_response`): rows are read through a
+server-side cursor ``chunk_size`` at a time and sent as they are
+serialized, optionally gzip-compressed on the fly, so the first byte leaves
+after the first rows and a worker holds one chunk rather than the whole
+collection.  Streaming is enabled with ``GEOJSON_STREAM=true``.
+
+With ``GEOJSON_ENGINE=postgres`` a buffered collection is assembled by
+PostgreSQL instead (:func:`geojson_aggregate_response`): one query returns
+the text of the whole feature array (``json_build_object`` per row joined
+with ``string_agg``), and Python only adds the collection wrapper.  Compare
+the engines with ``python manage.py benchmark_geojson``.
 """
 
 import json
+import logging
+import re
+from dataclasses import dataclass
+from typing import Optional
 
 from django.contrib.gis.db.models.functions import AsGeoJSON
-from django.http import HttpResponse, JsonResponse
+from django.db import connections
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
+from django.utils.cache import patch_vary_headers
+from django.utils.text import compress_sequence
+
+from server.watershed.loaders.config import _get_env_int, _get_env_str
 
+logger = logging.getLogger("watershed.geojson")
 
 # 6 decimal places is sub-meter precision in WGS84 and trims payload size.
 DEFAULT_PRECISION = 6
 
+PYTHON_ENGINE = "python"
+POSTGRES_ENGINE = "postgres"
+ENGINES = (PYTHON_ENGINE, POSTGRES_ENGINE)
+
+# Rows fetched per round-trip of the server-side cursor when streaming.
+DEFAULT_CHUNK_SIZE = 500
+
+# Serialized features are sent in pieces of about this many characters.
+_STREAM_BUFFER = 64 * 1024
+
+_ACCEPTS_GZIP = re.compile(r"\bgzip\b")
+
+
+def accepts_gzip(request) -> bool:
+    """Whether *request* accepts a gzip-encoded response."""
+    return bool(_ACCEPTS_GZIP.search(request.headers.get("Accept-Encoding", "")))
+
+
+@dataclass
+class GeoJSONConfig:
+    """
+    Configuration of FeatureCollection generation.
+
+    Attributes:
+        engine: ``python`` serializes features row by row; ``postgres``
+            builds the whole feature array in the database
+        stream: Stream the list endpoints instead of building them in memory
+            (takes precedence over *engine*)
+        chunk_size: Rows fetched per server-side cursor round-trip
+        gzip: Compress streamed responses for clients that accept gzip
+        precomputed: Serve unfiltered collections stored by the loader
+            (see ``precomputed.py``)
+    """
+    engine: str = PYTHON_ENGINE
+    stream: bool = False
+    chunk_size: int = DEFAULT_CHUNK_SIZE
+    gzip: bool = True
+    precomputed: bool = True
+
+    @classmethod
+    def from_environment(cls) -> "GeoJSONConfig":
+        """Create config from environment variables."""
+        engine = _get_env_str("GEOJSON_ENGINE", cls.engine).lower()
+        if engine not in ENGINES:
+            logger.warning("Unknown GEOJSON_ENGINE=%r; using %s", engine, cls.engine)
+            engine = cls.engine
+        return cls(
+            engine=engine,
+            stream=_get_env_str("GEOJSON_STREAM", "false").lower() in ("true", "1", "yes"),
+            chunk_size=max(1, _get_env_int("GEOJSON_STREAM_CHUNK_SIZE", cls.chunk_size)),
+            gzip=_get_env_str("GEOJSON_STREAM_GZIP", "true").lower() in ("true", "1", "yes"),
+            precomputed=_get_env_str("GEOJSON_PRECOMPUTED", "true").lower() in ("true", "1", "yes"),
+        )
+
+    def compress_for(self, request) -> bool:
+        """Whether a streamed response to *request* should be gzip-encoded."""
+        return self.gzip and accepts_gzip(request)
+
+
+_config: Optional[GeoJSONConfig] = None
+
+
+def get_geojson_config() -> GeoJSONConfig:
+    """
+    Get the GeoJSON configuration.
+
+    Lazily initializes from environment on first call.
+    """
+    global _config
+    if _config is None:
+        _config = GeoJSONConfig.from_environment()
+    return _config
+
+
+def reset_geojson_config() -> None:
+    """Reset the GeoJSON configuration (useful for testing)."""
+    global _config
+    _config = None
+
 
 def _json_default(obj):
     """Handle non-JSON-native scalar values such as datetimes."""
@@ -41,6 +143,30 @@ def _annotated_rows(queryset, geo_field, id_field, properties, precision):
     ).values(*list(set([id_field] + list(properties) + ["_geojson"])))
 
 
+def _default_properties(meta, geo_field, exclude):
+    """Concrete non-geometry fields of a model, minus *exclude*."""
+    exclude = set(exclude or ())
+    exclude.add(geo_field)
+    geo_field_names = {
+        f.name for f in meta.get_fields() if hasattr(f, "geom_type")
+    }
+    return [
+        f.name
+        for f in meta.get_fields()
+        if hasattr(f, "column")
+        and f.name not in exclude
+        and f.name not in geo_field_names
+    ]
+
+
+def _collection_head(members):
+    """Opening of a FeatureCollection up to and including ``"features":[``."""
+    head = '{"type":"FeatureCollection",'
+    if members:
+        head += json.dumps(members, default=_json_default)[1:-1] + ","
+    return head + '"features":['
+
+
 def geojson_response(
     queryset,
     geo_field="geom",
@@ -48,25 +174,16 @@ def geojson_response(
     properties=None,
     exclude=None,
     precision=DEFAULT_PRECISION,
+    members=None,
 ):
-    """Build a GeoJSON FeatureCollection with geometry serialization in PostGIS."""
-    model = queryset.model
-    meta = model._meta
-    exclude = set(exclude or ())
-    exclude.add(geo_field)
+    """
+    Build a GeoJSON FeatureCollection with geometry serialization in PostGIS.
 
+    *members* are extra top-level members (e.g. paging information).
+    """
+    meta = queryset.model._meta
     if properties is None:
-        geo_field_names = {
-            f.name for f in meta.get_fields() if hasattr(f, "geom_type")
-        }
-        properties = [
-            f.name
-            for f in meta.get_fields()
-            if hasattr(f, "column")
-            and f.name not in exclude
-            and f.name not in geo_field_names
-        ]
-
+        properties = _default_properties(meta, geo_field, exclude)
     if id_field is None:
         id_field = meta.pk.name
 
@@ -76,36 +193,131 @@ def geojson_response(
     for row in rows:
         feature_strings.append(_feature_json(row, id_field))
 
-    body = '{"type":"FeatureCollection","features":[' + ",".join(feature_strings) + "]}"
+    body = _collection_head(members) + ",".join(feature_strings) + "]}"
     return HttpResponse(body, content_type="application/json")
 
 
-def geojson_feature_response(
+def _aggregate_features(rows, id_field, properties):
+    """
+    Return the comma-separated Feature texts of annotated values() *rows*,
+    built in one query, or ``""`` when there are none.
+    """
+    meta = rows.model._meta
+    connection = connections[rows.db]
+    quote = connection.ops.quote_name
+
+    def column(name):
+        return "t." + quote(meta.get_field(name).column)
+
+    property_args = ", ".join(f"%s::text, {column(name)}" for name in properties)
+    feature = (
+        f"json_build_object('id', {column(id_field)}, 'type', 'Feature', "
+        f"'properties', json_build_object({property_args}), "
+        f"'geometry', t._geojson::json)"
+    )
+    sql, params = rows.query.sql_with_params()
+    # An aggregate need not keep the order of its input, so the rows are
+    # numbered as the ordered query returns them and aggregated by number.
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"SELECT string_agg(f.feature, ',' ORDER BY f.n) FROM ("
+            f"SELECT {feature}::text AS feature, row_number() OVER () AS n FROM ({sql}) AS t"
+            f") AS f",
+            [*properties, *params],
+        )
+        row = cursor.fetchone()
+    return row[0] if row and row[0] is not None else ""
+
+
+def geojson_aggregate_response(
     queryset,
     geo_field="geom",
     id_field=None,
     properties=None,
     exclude=None,
     precision=DEFAULT_PRECISION,
+    members=None,
 ):
-    """Build a single GeoJSON Feature response or return 404 when missing."""
-    model = queryset.model
-    meta = model._meta
-    exclude = set(exclude or ())
-    exclude.add(geo_field)
+    """
+    Build the same FeatureCollection as :func:`geojson_response` with the
+    features serialized by PostgreSQL in a single round-trip.
+    """
+    meta = queryset.model._meta
+    if properties is None:
+        properties = _default_properties(meta, geo_field, exclude)
+    if id_field is None:
+        id_field = meta.pk.name
+
+    rows = _annotated_rows(queryset, geo_field, id_field, properties, precision)
+    body = _collection_head(members) + _aggregate_features(rows, id_field, list(properties)) + "]}"
+    return HttpResponse(body, content_type="application/json")
+
+
+def _stream_collection(rows, id_field, members):
+    """Yield a FeatureCollection in pieces of about ``_STREAM_BUFFER`` characters."""
+    buffer = [_collection_head(members)]
+    size = 0
+    separator = ""
+    for row in rows:
+        feature = _feature_json(row, id_field)
+        buffer.append(separator + feature)
+        separator = ","
+        size += len(feature)
+        if size >= _STREAM_BUFFER:
+            yield "".join(buffer).encode()
+            buffer, size = [], 0
+    buffer.append("]}")
+    yield "".join(buffer).encode()
+
+
+def geojson_stream_response(
+    queryset,
+    geo_field="geom",
+    id_field=None,
+    properties=None,
+    exclude=None,
+    precision=DEFAULT_PRECISION,
+    members=None,
+    chunk_size=DEFAULT_CHUNK_SIZE,
+    compress=False,
+):
+    """
+    Stream a GeoJSON FeatureCollection (see :func:`geojson_response`).
 
+    Rows are read with a server-side cursor, *chunk_size* at a time.  With
+    *compress* the body is gzip-encoded as it is produced; the caller
+    decides whether the client accepts it.
+    """
+    meta = queryset.model._meta
     if properties is None:
-        geo_field_names = {
-            f.name for f in meta.get_fields() if hasattr(f, "geom_type")
-        }
-        properties = [
-            f.name
-            for f in meta.get_fields()
-            if hasattr(f, "column")
-            and f.name not in exclude
-            and f.name not in geo_field_names
-        ]
+        properties = _default_properties(meta, geo_field, exclude)
+    if id_field is None:
+        id_field = meta.pk.name
 
+    rows = _annotated_rows(queryset, geo_field, id_field, properties, precision)
+    body = _stream_collection(rows.iterator(chunk_size=chunk_size), id_field, members)
+    if compress:
+        body = compress_sequence(body)
+
+    response = StreamingHttpResponse(body, content_type="application/json")
+    if compress:
+        response["Content-Encoding"] = "gzip"
+    patch_vary_headers(response, ("Accept-Encoding",))
+    return response
+
+
+def geojson_feature_response(
+    queryset,
+    geo_field="geom",
+    id_field=None,
+    properties=None,
+    exclude=None,
+    precision=DEFAULT_PRECISION,
+):
+    """Build a single GeoJSON Feature response or return 404 when missing."""
+    meta = queryset.model._meta
+    if properties is None:
+        properties = _default_properties(meta, geo_field, exclude)
     if id_field is None:
         id_field = meta.pk.name
 
@@ -0,0 +1,92 @@
+"""
+Multi-resolution watershed geometries.
+
+Each watershed boundary is stored at several levels of detail, computed by
+the loader with ``ST_SimplifyPreserveTopology`` (see ``load.py``):
+
+    field             tolerance (°)                  GeoJSON decimals
+    geom_coarse       0.02   (national overview)     3
+    geom_medium       0.005  (state / region)        3
+    simplified_geom   GEOMETRY_SIMPLIFY_TOLERANCE    5
+    geom              full resolution                6
+
+A client asks for the detail it can display with ``?zoom=<web map zoom>``
+(the coarsest level whose tolerance is below one screen pixel) or
+``?tolerance=<degrees>`` (the coarsest level at least that precise), and
+coordinates are written with just enough decimals for that level.  A level
+that has not been computed yet falls back to the full geometry.
+"""
+
+from dataclasses import dataclass
+from typing import Optional
+
+from django.contrib.gis.db.models import GeometryField
+from django.db.models.functions import Coalesce
+
+from server.watershed.geojson import DEFAULT_PRECISION
+from server.watershed.loaders.config import LoaderConfig, get_config
+
+# One 256-pixel web map tile spans 360 / 2**zoom degrees of longitude.
+_TILE_PIXELS = 256
+
+
+@dataclass(frozen=True)
+class GeometryLevel:
+    """One stored level of detail of the watershed boundaries."""
+    field: str
+    tolerance: float
+    precision: int
+
+    @property
+    def expression(self):
+        """Geometry of this level, or the full geometry where it is missing."""
+        if self.field == FULL.field:
+            return self.field
+        return Coalesce(self.field, FULL.field, output_field=GeometryField(srid=4326))
+
+
+FULL = GeometryLevel("geom", 0.0, DEFAULT_PRECISION)
+
+
+def geometry_levels(config: Optional[LoaderConfig] = None) -> tuple[GeometryLevel, ...]:
+    """Stored levels from coarsest to full resolution."""
+    cfg = config or get_config()
+    return (
+        GeometryLevel("geom_coarse", 0.02, 3),
+        GeometryLevel("geom_medium", 0.005, 3),
+        GeometryLevel("simplified_geom", cfg.geometry.simplify_tolerance, 5),
+        FULL,
+    )
+
+
+def level_for_tolerance(tolerance: float) -> GeometryLevel:
+    """Return the coarsest level simplified by at most *tolerance* degrees."""
+    for level in geometry_levels():
+        if level.tolerance <= tolerance:
+            return level
+    return FULL
+
+
+def level_for_zoom(zoom: int) -> GeometryLevel:
+    """Return the coarsest level indistinguishable from full detail at *zoom*."""
+    return level_for_tolerance(360 / _TILE_PIXELS / 2 ** zoom)
+
+
+def level_from_query(params) -> Optional[GeometryLevel]:
+    """
+    Pick a level from ``zoom`` or ``tolerance`` query parameters, or None
+    when neither is given (or parses).
+    """
+    zoom = params.get("zoom")
+    if zoom is not None:
+        try:
+            return level_for_zoom(max(0, int(zoom)))
+        except (ValueError, OverflowError):
+            pass
+    tolerance = params.get("tolerance")
+    if tolerance is not None:
+        try:
+            return level_for_tolerance(float(tolerance))
+        except ValueError:
+            pass
+    return None
@@ -2,7 +2,9 @@
 Main entry point for watershed data loading.
 
 This module orchestrates the data loading pipeline and handles
-geometry simplification after data is loaded.
+geometry simplification (the levels of detail in ``geometry_levels.py``)
+and the precomputed GeoJSON collections after data is loaded, then bumps
+the data generation once everything served is in place.
 
 The loader automatically discovers available watershed data from the API,
 eliminating the need for manual manifest maintenance, and loads data into
@@ -14,9 +16,12 @@ from typing import Optional
 
 from django.db import connection
 
+from server.watershed.geometry_levels import FULL, geometry_levels
 from server.watershed.loaders.loader import load_with_discovery
 from server.watershed.loaders.config import LoaderConfig, get_config
+from server.watershed.precomputed import build_blobs
 from server.watershed.utils.logging import configure_logging
+from server.watershed.versioning import bump_generation
 
 logger = logging.getLogger("watershed.loader")
 
@@ -27,7 +32,8 @@ def run(
     config: Optional[LoaderConfig] = None,
 ) -> dict:
     """
-    Load watershed data and update simplified geometries.
+    Load watershed data, update the simplified geometry levels and store the
+    precomputed GeoJSON collections of the loaded runs.
     
     This is the main entry point for the data loading pipeline. It automatically
     discovers available watershed data from the API and loads it into the database.
@@ -53,18 +59,35 @@ def run(
     logger.info("Starting watershed data loading...")
     result = load_with_discovery(verbose=verbose, runids=runids, config=cfg)
 
-    # Update the simplified_geom field using PostGIS simplify
+    # Update the simplified geometry levels using PostGIS simplify
     # (more efficient than using GEOS simplify in the application)
     logger.info("Simplifying watershed geometries...")
+    levels = [level for level in geometry_levels(cfg) if level.field != FULL.field]
+    assignments = ", ".join(
+        f"{level.field} = ST_SimplifyPreserveTopology(geom, %s)" for level in levels
+    )
     with connection.cursor() as cursor:
         cursor.execute(
-            """
+            f"""
             UPDATE watershed_watershed
-            SET simplified_geom = ST_SimplifyPreserveTopology(geom, %s)
+            SET {assignments}
             WHERE geom IS NOT NULL;
             """,
-            [cfg.geometry.simplify_tolerance]
+            [level.tolerance for level in levels]
         )
+
+    # Store the final GeoJSON of the unfiltered list endpoints (see precomputed.py)
+    logger.info("Precomputing GeoJSON collections...")
+    blobs = build_blobs(runids)
+    logger.info(
+        "Precomputed GeoJSON: %d written, %d unchanged, %d removed",
+        blobs.written, blobs.unchanged, blobs.removed,
+    )
+
+    # Invalidate cached GeoJSON/tile responses (see versioning.py) only now:
+    # a response versioned with the new generation is cached as immutable,
+    # so it must not be built from the old simplified geometry or blobs.
+    result["generation"] = bump_generation()
     
     logger.info("Watershed data loading complete")
     return result
\ No newline at end of file
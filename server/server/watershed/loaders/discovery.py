@@ -18,6 +18,7 @@ from typing import Iterator, Optional
 from pathlib import Path
 from .config import LoaderConfig, BatchConfig, StandaloneRunConfig, get_config
 from .exceptions import DataSourceError
+from server.watershed import upstream
 
 logger = logging.getLogger("watershed.loader")
 
@@ -163,7 +164,7 @@ class WatershedDataDiscovery:
             headers["Authorization"] = f"Bearer {self.jwt_token}"
         
         try:
-            response = requests.get(self.watersheds_url, headers=headers, timeout=30)
+            response = upstream.get(self.watersheds_url, headers=headers)
             response.raise_for_status()
             data = response.json()
         except requests.RequestException as e:
@@ -276,7 +277,7 @@ class WatershedDataDiscovery:
         if source.has_local_cache():
             return True
         try:
-            response = requests.head(source.url, timeout=timeout)
+            response = upstream.head(source.url, timeout=timeout)
             return response.status_code == 200
         except requests.RequestException:
             return False
@@ -6,7 +6,6 @@ or remote URLs. For testing, mock implementations can be injected instead.
 """
 
 import logging
-import requests
 import pandas as pd
 from io import BytesIO
 from pathlib import Path
@@ -17,6 +16,7 @@ from django.contrib.gis.gdal import DataSource as GDALDataSource
 from .config import LoaderConfig, get_config
 from .exceptions import DataSourceError
 from .protocols import DataSourceReader
+from server.watershed import upstream
 from server.watershed.utils.retry import with_retry
 
 logger = logging.getLogger("watershed.loader")
@@ -73,7 +73,7 @@ class RemoteDataSourceReader:
             base_delay=self.config.retry.base_delay_seconds,
         )
         def fetch() -> GDALDataSource:
-            response = requests.get(url, headers=headers, timeout=60)
+            response = upstream.get(url, headers=headers)
             response.raise_for_status()
             return GDALDataSource(response.text)
         
@@ -112,7 +112,7 @@ class RemoteDataSourceReader:
             base_delay=self.config.retry.base_delay_seconds,
         )
         def fetch() -> pd.DataFrame:
-            response = requests.get(url)
+            response = upstream.get(url)
             response.raise_for_status()
             return pd.read_parquet(BytesIO(response.content))
         
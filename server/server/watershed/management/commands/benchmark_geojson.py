@@ -0,0 +1,111 @@
+"""
+Django management command for benchmarking FeatureCollection generation.
+
+Compares the ``python`` engine of ``geojson.py`` (rows fetched with
+``ST_AsGeoJSON`` geometry, properties serialized per row in Python) against
+the ``postgres`` engine (the whole feature array built by PostgreSQL with
+``json_build_object`` and ``string_agg``) on the watersheds with the most
+subcatchments, using the properties the API serves.  Times are wall-clock
+milliseconds per response, averaged over ``--iterations`` after a warm-up;
+both engines are checked to produce the same collection.
+
+Usage:
+    python manage.py benchmark_geojson
+    python manage.py benchmark_geojson --runs 5 --iterations 20
+    python manage.py benchmark_geojson --runid <runid> --layer channels
+"""
+
+import json
+import time
+
+from django.core.management.base import BaseCommand
+from django.db.models import Count
+
+from server.watershed.geojson import geojson_aggregate_response, geojson_response
+from server.watershed.models import Channel, Subcatchment, Watershed
+from server.watershed.views import CHANNEL_PROPERTIES, SUBCATCHMENT_PROPERTIES
+
+_LAYERS = {
+    "subcatchments": (Subcatchment, SUBCATCHMENT_PROPERTIES, "subcatchment"),
+    "channels": (Channel, CHANNEL_PROPERTIES, "channel"),
+}
+
+
+def _wall_time(fn, iterations):
+    fn()  # warm-up
+    start = time.perf_counter()
+    for _ in range(iterations):
+        fn()
+    return (time.perf_counter() - start) / iterations
+
+
+class Command(BaseCommand):
+    help = 'Benchmark GeoJSON FeatureCollection generation in Python against PostgreSQL json aggregation.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--layer',
+            choices=sorted(_LAYERS),
+            default='subcatchments',
+            help='Layer to serialize (default: subcatchments)',
+        )
+        parser.add_argument(
+            '--runs',
+            type=int,
+            default=3,
+            help='Benchmark the watersheds with the most features of the layer (default: 3)',
+        )
+        parser.add_argument(
+            '--runid',
+            action='append',
+            default=[],
+            help='Benchmark these watersheds instead (repeatable)',
+        )
+        parser.add_argument(
+            '--iterations',
+            type=int,
+            default=10,
+            help='Responses built per measurement (default: 10)',
+        )
+
+    def handle(self, *args, **options):
+        model, properties, related_name = _LAYERS[options['layer']]
+        iterations = max(1, options['iterations'])
+
+        runids = options['runid']
+        if not runids:
+            runids = list(
+                Watershed.objects
+                .annotate(features=Count(related_name))
+                .order_by('-features')
+                .values_list('runid', flat=True)[:options['runs']]
+            )
+        if not runids:
+            self.stdout.write(self.style.WARNING('No watersheds loaded; nothing to benchmark.'))
+            return
+
+        self.stdout.write(f"==> {options['layer']}, {iterations} responses per engine")
+        header = (
+            f"{'runid':<36} {'features':>9} {'python ms':>10} {'postgres ms':>12}"
+            f" {'speedup':>8} {'python KB':>10} {'postgres KB':>12}"
+        )
+        self.stdout.write(header)
+        self.stdout.write("-" * len(header))
+
+        for runid in runids:
+            queryset = model.objects.filter(watershed_id=runid).order_by('id')
+            kwargs = {'geo_field': 'geom', 'properties': properties}
+
+            python = geojson_response(queryset, **kwargs).content
+            postgres = geojson_aggregate_response(queryset, **kwargs).content
+            features = json.loads(python)['features']
+            if json.loads(postgres)['features'] != features:
+                self.stdout.write(self.style.ERROR(f"{runid}: the engines produced different collections"))
+                continue
+
+            before = _wall_time(lambda: geojson_response(queryset, **kwargs), iterations) * 1000
+            after = _wall_time(lambda: geojson_aggregate_response(queryset, **kwargs), iterations) * 1000
+            self.stdout.write(
+                f"{runid:<36} {len(features):>9} {before:>10.1f} {after:>12.1f} {before / after:>7.1f}x"
+                f" {len(python) / 1024:>10.0f} {len(postgres) / 1024:>12.0f}"
+            )
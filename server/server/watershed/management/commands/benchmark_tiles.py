@@ -0,0 +1,226 @@
+"""
+Django management command for benchmarking tile colorization.
+
+Compares the per-tile CPU time of the lookup-table engine in
+``tiles/render.py`` against the previous rendering path (rio-tiler
+``rescale()`` + ``render(colormap=dict)``) on synthetic 256×256 tiles that
+mimic each layer type, with 20% nodata.  Times are CPU milliseconds
+(``time.process_time``) averaged over ``--iterations`` tiles; the engine is
+reported both for colorization alone and including the PNG encode, and
+encoded tile sizes are listed alongside.
+
+A second section compares reading a block of ``--metatile`` × ``--metatile``
+tiles one ``Reader.tile`` call at a time against a single metatile read
+(``tiles/raw.py``) from a synthetic local GeoTIFF, in wall-clock time.
+
+Usage:
+    python manage.py benchmark_tiles
+    python manage.py benchmark_tiles --iterations 500
+    python manage.py benchmark_tiles --metatile 8
+"""
+
+import tempfile
+import time
+from pathlib import Path
+
+import morecantile
+import numpy as np
+from django.core.management.base import BaseCommand
+from rio_tiler.io import Reader
+from rio_tiler.models import ImageData
+
+from server.watershed.rhessys_outputs.colormap import build_diverging_colormap, build_sequential_colormap
+from server.watershed.rhessys_outputs.tile import get_colorizer as get_output_colorizer
+from server.watershed.rhessys_spatial.colormap import (
+    STREAM_COLORMAP,
+    build_categorical_colormap,
+    build_continuous_colormap,
+)
+from server.watershed.rhessys_spatial.tile import get_colorizer as get_spatial_colorizer
+from server.watershed.sbs_raster.color_map import ColorMode, get_render_colormap
+from server.watershed.sbs_raster.tile import get_colorizer as get_sbs_colorizer
+from server.watershed.tiles.raw import read_metatile
+
+_TILE = 256
+_CATEGORIES = [3, 6, 8, 9, 10, 12, 13]
+
+
+def _masked(values, rng):
+    mask = rng.random(values.shape) < 0.2
+    return np.ma.MaskedArray(values[np.newaxis], mask=mask[np.newaxis])
+
+
+def _cases(rng):
+    """Return ``[(name, array, legacy_render, engine_colorizer)]``."""
+    shape = (_TILE, _TILE)
+    cont = rng.normal(0.5, 0.2, shape).astype(np.float32)
+    change = rng.normal(0.0, 0.3, shape).astype(np.float32)
+    elev = rng.integers(800, 2400, shape).astype(np.int16)
+
+    def legacy_categorical(colormap_factory):
+        return lambda img: img.render(colormap=colormap_factory())
+
+    def legacy_continuous(colormap_factory, lo, hi):
+        def render(img):
+            rescaled = img.rescale(in_range=((lo, hi),), out_range=((0, 255),))
+            return rescaled.render(colormap=colormap_factory())
+        return render
+
+    return [
+        (
+            "sbs (categorical, uint8)",
+            _masked(rng.integers(0, 4, shape).astype(np.uint8), rng),
+            legacy_categorical(lambda: get_render_colormap(ColorMode.LEGACY)),
+            get_sbs_colorizer(ColorMode.LEGACY),
+        ),
+        (
+            "spatial categorical (uint8)",
+            _masked(rng.choice(_CATEGORIES, shape).astype(np.uint8), rng),
+            legacy_categorical(lambda: build_categorical_colormap(_CATEGORIES)),
+            get_spatial_colorizer("categorical", 0.0, 1.0, tuple(_CATEGORIES), False),
+        ),
+        (
+            "spatial stream (uint8)",
+            _masked((rng.random(shape) < 0.05).astype(np.uint8), rng),
+            legacy_categorical(lambda: STREAM_COLORMAP),
+            get_spatial_colorizer("stream", 0.0, 1.0, None, False),
+        ),
+        (
+            "spatial continuous (float32)",
+            _masked(cont, rng),
+            legacy_continuous(lambda: build_continuous_colormap(False), 0.0, 1.0),
+            get_spatial_colorizer("continuous", 0.0, 1.0, None, False),
+        ),
+        (
+            "spatial continuous (int16)",
+            _masked(elev, rng),
+            legacy_continuous(lambda: build_continuous_colormap(False), 800.0, 2400.0),
+            get_spatial_colorizer("continuous", 800.0, 2400.0, None, False),
+        ),
+        (
+            "outputs sequential (float32)",
+            _masked(cont, rng),
+            legacy_continuous(build_sequential_colormap, 0.0, 1.0),
+            get_output_colorizer(False, 0.0, 1.0),
+        ),
+        (
+            "outputs diverging (float32)",
+            _masked(change, rng),
+            legacy_continuous(build_diverging_colormap, -1.0, 1.0),
+            get_output_colorizer(True, -1.0, 1.0),
+        ),
+    ]
+
+
+def _write_raster(path: Path, rng) -> tuple[float, float]:
+    """Write a 4096×4096 float32 UTM GeoTIFF; return its (lon, lat) centre."""
+    import rasterio
+    from rasterio.transform import from_origin
+    from rasterio.warp import transform
+
+    size = 4096
+    data = rng.normal(0.5, 0.2, (size, size)).astype(np.float32)
+    profile = dict(
+        driver="GTiff", width=size, height=size, count=1, dtype="float32",
+        crs="EPSG:32611", transform=from_origin(500_000, 5_200_000, 10, 10),
+        nodata=-9999, tiled=True, blockxsize=512, blockysize=512, compress="deflate",
+    )
+    with rasterio.open(path, "w", **profile) as dst:
+        dst.write(data, 1)
+    lon, lat = transform("EPSG:32611", "EPSG:4326", [500_000 + size * 5], [5_200_000 - size * 5])
+    return lon[0], lat[0]
+
+
+def _wall_time(fn, iterations):
+    fn()  # warm-up
+    start = time.perf_counter()
+    for _ in range(iterations):
+        fn()
+    return (time.perf_counter() - start) / iterations
+
+
+def _cpu_per_tile(fn, iterations):
+    fn()  # warm-up
+    start = time.process_time()
+    for _ in range(iterations):
+        fn()
+    return (time.process_time() - start) / iterations
+
+
+class Command(BaseCommand):
+    help = 'Benchmark per-tile CPU time of the LUT colorization engine against the previous path.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--iterations',
+            type=int,
+            default=200,
+            help='Tiles rendered per measurement (default: 200)',
+        )
+        parser.add_argument('--seed', type=int, default=0, help='Random seed for synthetic tiles')
+        parser.add_argument(
+            '--metatile',
+            type=int,
+            default=4,
+            help='Metatile size to benchmark (default: 4, 0 to skip)',
+        )
+        parser.add_argument(
+            '--metatile-zoom',
+            type=int,
+            default=14,
+            help='Zoom level of the metatile benchmark (default: 14)',
+        )
+
+    def handle(self, *args, **options):
+        iterations = options['iterations']
+        rng = np.random.default_rng(options['seed'])
+
+        self.stdout.write(f"==> {iterations} synthetic {_TILE}x{_TILE} tiles per case, 20% nodata")
+        header = (
+            f"{'case':<32} {'previous ms':>12} {'colorize ms':>12} {'speedup':>8}"
+            f" {'total ms':>9} {'speedup':>8} {'bytes':>15}"
+        )
+        self.stdout.write(header)
+        self.stdout.write("-" * len(header))
+
+        for name, array, legacy, colorizer in _cases(rng):
+            # rescale() mutates the image, so each tile starts from a copy,
+            # like a freshly read tile would.
+            before = _cpu_per_tile(lambda: legacy(ImageData(array.copy())), iterations) * 1000
+            colorize = _cpu_per_tile(lambda: colorizer.colorize(array), iterations) * 1000
+            total = _cpu_per_tile(lambda: colorizer.render(array), iterations) * 1000
+            sizes = f"{len(legacy(ImageData(array.copy())))}->{len(colorizer.render(array))}"
+            self.stdout.write(
+                f"{name:<32} {before:>12.3f} {colorize:>12.3f} {before / colorize:>7.1f}x"
+                f" {total:>9.3f} {before / total:>7.1f}x {sizes:>15}"
+            )
+
+        if options['metatile'] > 1:
+            self._benchmark_metatile(options['metatile'], options['metatile_zoom'], iterations, rng)
+
+    def _benchmark_metatile(self, size, z, iterations, rng):
+        iterations = max(1, iterations // 10)
+        with tempfile.TemporaryDirectory() as tmp:
+            path = Path(tmp) / 'metatile.tif'
+            lon, lat = _write_raster(path, rng)
+            centre = morecantile.tms.get('WebMercatorQuad').tile(lon, lat, z)
+            x0, y0 = centre.x - centre.x % size, centre.y - centre.y % size
+            block = [(x, y) for y in range(y0, y0 + size) for x in range(x0, x0 + size)]
+
+            with Reader(str(path)) as src:
+                def per_tile():
+                    return [src.tile(x, y, z, tilesize=_TILE).array for x, y in block]
+
+                def metatile():
+                    return read_metatile(src, z, x0, y0, size)
+
+                before = _wall_time(per_tile, iterations) * 1000
+                after = _wall_time(metatile, iterations) * 1000
+
+        self.stdout.write("")
+        self.stdout.write(
+            f"==> {size}x{size} metatile at z{z}, local 4096x4096 float32 GeoTIFF, {iterations} runs"
+        )
+        self.stdout.write(f"{'per-tile reads':<32} {before:>12.3f} ms/block {before / len(block):>9.3f} ms/tile")
+        self.stdout.write(f"{'metatile read':<32} {after:>12.3f} ms/block {after / len(block):>9.3f} ms/tile")
+        self.stdout.write(f"{'speedup':<32} {before / after:>11.1f}x")
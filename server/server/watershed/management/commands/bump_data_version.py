@@ -0,0 +1,23 @@
+"""
+Django management command for invalidating cached API responses.
+
+Bumps the data generation that ETags and version-stamped URLs are derived
+from (see ``server/watershed/versioning.py``).  The loader and
+``mirror_rasters`` do this automatically; run it by hand after changing data
+outside them or after a deploy that changes how tiles are rendered.
+
+Usage:
+    python manage.py bump_data_version
+"""
+
+from django.core.management.base import BaseCommand
+
+from server.watershed.versioning import bump_generation
+
+
+class Command(BaseCommand):
+    help = 'Bump the data generation so clients revalidate cached GeoJSON and tiles.'
+
+    def handle(self, *args, **options):
+        generation = bump_generation()
+        self.stdout.write(self.style.SUCCESS(f"==> Data generation is now {generation}"))
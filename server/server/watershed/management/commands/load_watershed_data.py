@@ -2,6 +2,7 @@ from django.core.management.base import BaseCommand, CommandError
 from django.db import transaction
 from server.watershed.models import Watershed, Subcatchment, Channel
 from server.watershed.load import run
+from server.watershed.precomputed import clear_blobs
 from server.watershed.constants import DEV_RUNIDS
 
 
@@ -67,6 +68,7 @@ class Command(BaseCommand):
                 Channel.objects.all().delete()
                 Subcatchment.objects.all().delete()
                 Watershed.objects.all().delete()
+                clear_blobs()
             self.stdout.write(
                 self.style.SUCCESS('Existing data cleared')
             )
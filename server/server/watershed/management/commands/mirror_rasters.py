@@ -0,0 +1,145 @@
+"""
+Django management command for mirroring tile-served rasters locally as COGs.
+
+Fetches the SBS map, registered RHESSys spatial inputs and RHESSys output
+maps for each watershed into ``LOADER_DATA_DIR/rasters`` and rewrites them
+as Cloud-Optimized GeoTIFFs.  Tile views read the local copy when present.
+Each raster's valid-data footprint is recorded in ``RasterFootprint`` so
+tiles outside it are answered without opening the file, and its upstream
+revision in ``RasterRevision``; the cached tiles of every raster that changed
+are dropped and the data generation is bumped so clients revalidate.  Statistics of output maps are
+computed into ``RasterStatistics`` so no tile request has to scan them.
+
+Usage:
+    # Mirror the development subset
+    python manage.py mirror_rasters --dev
+
+    # Mirror specific watersheds by runid
+    python manage.py mirror_rasters --runids 'batch;;nasa-roses-2026-sbs;;OR-20' 'aversive-forestry'
+
+    # Mirror every watershed in the database, re-fetching unchanged rasters
+    python manage.py mirror_rasters --all --force
+"""
+
+import requests
+from django.core.management.base import BaseCommand, CommandError
+
+from server.watershed.constants import DEV_RUNIDS
+from server.watershed.models import Watershed
+from server.watershed.rhessys_outputs.discovery import MAPS_SUBPATH
+from server.watershed.tiles.footprint import has_footprint, record_footprint
+from server.watershed.tiles.layers import invalidate_raster
+from server.watershed.tiles.mirror import list_mirror_targets, mirror_raster, mirror_root, read_revision
+from server.watershed.tiles.stats import get_raster_stats
+from server.watershed.versioning import bump_generation, record_raster_revision
+
+
+class Command(BaseCommand):
+    help = 'Mirror tile-served rasters from WEPPcloud as local Cloud-Optimized GeoTIFFs.'
+
+    def add_arguments(self, parser):
+        group = parser.add_mutually_exclusive_group(required=True)
+        group.add_argument(
+            '--dev',
+            action='store_true',
+            help='Mirror development subset only',
+        )
+        group.add_argument(
+            '--runids',
+            nargs='+',
+            metavar='RUNID',
+            help='Mirror only specified watersheds by runid (space-separated)',
+        )
+        group.add_argument(
+            '--all',
+            action='store_true',
+            help='Mirror every watershed currently in the database',
+        )
+        parser.add_argument(
+            '--force',
+            action='store_true',
+            help='Re-download rasters even if the upstream revision is unchanged',
+        )
+
+    def handle(self, *args, **options):
+        if options['dev']:
+            runids = DEV_RUNIDS
+        elif options['runids']:
+            runids = options['runids']
+        else:
+            runids = list(Watershed.objects.values_list('runid', flat=True).order_by('runid'))
+
+        self.stdout.write(f"==> Mirroring rasters for {len(runids)} watershed(s) to: {mirror_root()}")
+
+        counts = {"mirrored": 0, "unchanged": 0, "missing": 0, "error": 0}
+        total_bytes = 0
+        changed = False
+
+        try:
+            with requests.Session() as session:
+                for runid in runids:
+                    self.stdout.write(f"\n==> {runid}")
+                    for rel_path, resampling in list_mirror_targets(runid):
+                        result = mirror_raster(
+                            runid, rel_path, session,
+                            resampling=resampling, force=options['force'],
+                        )
+                        counts[result.status] += 1
+                        total_bytes += result.bytes
+                        self._report(result)
+                        self._index_footprint(result)
+                        self._index_statistics(result)
+                        if result.status in ("mirrored", "unchanged"):
+                            revised = record_raster_revision(
+                                runid, rel_path, read_revision(runid, rel_path),
+                            )
+                            if revised or result.status == "mirrored":
+                                # Tiles of the previous bytes must not be
+                                # served under the new version.
+                                invalidate_raster(runid, rel_path)
+                                changed = True
+                if changed:
+                    bump_generation()
+        except Exception as e:
+            raise CommandError(f"Mirroring failed: {e}")
+
+        self.stdout.write("\n" + "=" * 60)
+        self.stdout.write("==> Mirror Summary:")
+        self.stdout.write(self.style.SUCCESS(
+            f"    ✓ Mirrored: {counts['mirrored']}  Unchanged: {counts['unchanged']}"
+        ))
+        self.stdout.write(f"    - Not available upstream: {counts['missing']}")
+        if counts['error']:
+            self.stdout.write(self.style.ERROR(f"    ✗ Errors: {counts['error']}"))
+        self.stdout.write(
+            f"    Local mirror size: {total_bytes:,} bytes ({total_bytes / (1024*1024):.2f} MB)"
+        )
+
+    def _index_footprint(self, result):
+        """Record the raster footprint for new rasters and ones not yet indexed."""
+        if result.status == "mirrored" or (
+            result.status == "unchanged" and not has_footprint(result.runid, result.rel_path)
+        ):
+            try:
+                record_footprint(result.runid, result.rel_path, str(result.path))
+            except Exception as e:
+                self.stdout.write(self.style.WARNING(f"      footprint not recorded: {e}"))
+
+    def _index_statistics(self, result):
+        """Fill the statistics store for output maps (a no-op when already stored)."""
+        if result.path is None or not result.rel_path.startswith(f"{MAPS_SUBPATH}/"):
+            return
+        try:
+            get_raster_stats(str(result.path))
+        except Exception as e:
+            self.stdout.write(self.style.WARNING(f"      statistics not recorded: {e}"))
+
+    def _report(self, result):
+        if result.status == "mirrored":
+            self.stdout.write(self.style.SUCCESS(f"    ✓ {result.rel_path} ({result.bytes:,} bytes)"))
+        elif result.status == "unchanged":
+            self.stdout.write(f"    - {result.rel_path} (unchanged)")
+        elif result.status == "missing":
+            self.stdout.write(f"    - {result.rel_path} (not available upstream)")
+        else:
+            self.stdout.write(self.style.ERROR(f"    ✗ {result.rel_path}: {result.detail}"))
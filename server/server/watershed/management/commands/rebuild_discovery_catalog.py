@@ -0,0 +1,81 @@
+"""
+Django management command for rebuilding the RHESSys discovery catalog.
+
+Re-scans the WEPPcloud browse pages of each watershed for RHESSys spatial
+inputs and output maps and stores the results in ``DiscoveryCatalog`` (see
+``server/watershed/catalog.py``), so no API request has to wait on a scan.
+Scans run without the request deadline and also fill the raster statistics
+of every output map.
+
+Usage:
+    # Rebuild the catalog of every watershed in the database
+    python manage.py rebuild_discovery_catalog --all
+
+    # Rebuild specific watersheds by runid
+    python manage.py rebuild_discovery_catalog --runids 'batch;;nasa-roses-2026-sbs;;OR-20' 'aversive-forestry'
+"""
+
+from django.core.management.base import BaseCommand
+
+from server.watershed.catalog import OUTPUT_MAPS, SPATIAL_INPUTS, refresh_catalog
+from server.watershed.constants import DEV_RUNIDS
+from server.watershed.models import Watershed
+from server.watershed.rhessys_outputs.discovery import scan_output_maps
+from server.watershed.rhessys_spatial.discovery import scan_spatial_inputs
+
+_SCANS = (
+    (SPATIAL_INPUTS, scan_spatial_inputs),
+    (OUTPUT_MAPS, scan_output_maps),
+)
+
+
+class Command(BaseCommand):
+    help = 'Re-scan WEPPcloud for RHESSys spatial inputs and output maps of each watershed.'
+
+    def add_arguments(self, parser):
+        group = parser.add_mutually_exclusive_group(required=True)
+        group.add_argument(
+            '--dev',
+            action='store_true',
+            help='Rebuild the development subset only',
+        )
+        group.add_argument(
+            '--runids',
+            nargs='+',
+            metavar='RUNID',
+            help='Rebuild only specified watersheds by runid (space-separated)',
+        )
+        group.add_argument(
+            '--all',
+            action='store_true',
+            help='Rebuild every watershed currently in the database',
+        )
+
+    def handle(self, *args, **options):
+        if options['dev']:
+            runids = DEV_RUNIDS
+        elif options['runids']:
+            runids = options['runids']
+        else:
+            runids = list(Watershed.objects.values_list('runid', flat=True).order_by('runid'))
+
+        self.stdout.write(f"==> Rebuilding discovery catalog for {len(runids)} watershed(s)")
+
+        failed = 0
+        for runid in runids:
+            found = []
+            for kind, scan in _SCANS:
+                try:
+                    entry = refresh_catalog(kind, runid, scan)
+                except Exception as e:
+                    failed += 1
+                    self.stdout.write(self.style.ERROR(f"    ✗ {runid} {kind}: {e}"))
+                    continue
+                if entry.payload is not None:
+                    found.append(kind)
+            self.stdout.write(f"    ✓ {runid}: {', '.join(found) or 'no RHESSys data'}")
+
+        if failed:
+            self.stdout.write(self.style.WARNING(f"==> Done with {failed} failed scan(s)"))
+        else:
+            self.stdout.write(self.style.SUCCESS("==> Done"))
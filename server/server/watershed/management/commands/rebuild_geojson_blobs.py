@@ -0,0 +1,58 @@
+"""
+Django management command for rebuilding the precomputed GeoJSON collections.
+
+``load_watershed_data`` stores the watershed list and each loaded run's
+subcatchments and channels in ``GeoJSONBlob`` (see
+``server/watershed/precomputed.py``).  Run this after changing watershed
+data outside the loader; collections whose bytes did not change are left
+alone.
+
+Usage:
+    # Rebuild every watershed in the database (and drop blobs of removed runs)
+    python manage.py rebuild_geojson_blobs --all
+
+    # Rebuild the watershed list and specific watersheds by runid
+    python manage.py rebuild_geojson_blobs --runids 'batch;;nasa-roses-2026-sbs;;OR-20' 'aversive-forestry'
+"""
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from server.watershed.precomputed import build_blobs
+from server.watershed.versioning import bump_generation
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the precomputed GeoJSON collections of the watershed list endpoints.'
+
+    def add_arguments(self, parser):
+        group = parser.add_mutually_exclusive_group(required=True)
+        group.add_argument(
+            '--runids',
+            nargs='+',
+            metavar='RUNID',
+            help='Rebuild only specified watersheds by runid (space-separated)',
+        )
+        group.add_argument(
+            '--all',
+            action='store_true',
+            help='Rebuild every watershed currently in the database',
+        )
+
+    def handle(self, *args, **options):
+        runids = options['runids']
+        self.stdout.write(
+            f"==> Rebuilding precomputed GeoJSON for {len(runids) if runids else 'all'} watershed(s)"
+        )
+
+        with transaction.atomic():
+            result = build_blobs(runids)
+            if result.written or result.removed:
+                # Clients holding the previous bytes must revalidate.
+                bump_generation()
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"==> Done: {result.written} written, {result.unchanged} unchanged, {result.removed} removed"
+            )
+        )
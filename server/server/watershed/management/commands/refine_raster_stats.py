@@ -0,0 +1,74 @@
+"""
+Django management command for refining approximate raster statistics.
+
+The first statistics pass over a large raster reads an overview or a sample
+of its blocks (see ``server/watershed/tiles/stats.py``).  This command
+recomputes exact statistics for every approximate entry of the current
+revision.  When a color range changes, the data generation is bumped and
+cached output map tiles are dropped so no tile mixes old and new ranges.
+
+Usage:
+    # Refine every approximate entry (e.g. nightly, or after mirror_rasters)
+    python manage.py refine_raster_stats
+
+    # Refine at most 10 entries
+    python manage.py refine_raster_stats --limit 10
+"""
+
+from django.core.management.base import BaseCommand
+
+from server.watershed.models import RasterStatistics, Watershed
+from server.watershed.tiles.cache import get_tile_cache
+from server.watershed.tiles.layers import OUTPUTS
+from server.watershed.tiles.stats import refine_raster_stats
+from server.watershed.versioning import bump_generation
+
+
+class Command(BaseCommand):
+    help = 'Replace approximate raster statistics with exact ones.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--limit',
+            type=int,
+            default=None,
+            help='Refine at most this many entries',
+        )
+
+    def handle(self, *args, **options):
+        entries = list(
+            RasterStatistics.objects
+            .filter(approximate=True)
+            .order_by('updated_at')
+            .values_list('url', 'revision')
+        )
+        if options['limit'] is not None:
+            entries = entries[:options['limit']]
+
+        self.stdout.write(f"==> Refining statistics of {len(entries)} raster(s)")
+
+        ranges_changed = 0
+        for url, revision in entries:
+            try:
+                result = refine_raster_stats(url, revision)
+            except Exception as e:
+                self.stdout.write(self.style.ERROR(f"    ✗ {url}: {e}"))
+                continue
+            if result is None:
+                self.stdout.write(f"    - {url} (outdated revision, skipped)")
+                continue
+            approx, exact = result
+            if (approx.min, approx.max) != (exact.min, exact.max):
+                ranges_changed += 1
+            self.stdout.write(self.style.SUCCESS(
+                f"    ✓ {url}: [{approx.min:g}, {approx.max:g}] → [{exact.min:g}, {exact.max:g}]"
+            ))
+
+        if ranges_changed:
+            # Workers share the cached generation, so they reload the refined
+            # ranges as soon as it is bumped.
+            bump_generation()
+            cache = get_tile_cache()
+            for runid in Watershed.objects.values_list('runid', flat=True):
+                cache.invalidate(runid, OUTPUTS)
+            self.stdout.write(f"==> {ranges_changed} color range(s) changed; output map tiles invalidated")
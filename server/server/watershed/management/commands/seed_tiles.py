@@ -0,0 +1,193 @@
+"""
+Django management command for pre-seeding the raster tile cache.
+
+Renders SBS (every color mode), registered RHESSys spatial inputs and
+discovered RHESSys output maps over each watershed's boundary into the tile
+cache, so the first map views after a data load are served from disk.
+
+Usage:
+    # Seed every watershed in the database at the default zoom range
+    python manage.py seed_tiles
+
+    # Seed specific watersheds, SBS only, zooms 8-15 on 4 processes
+    python manage.py seed_tiles --runids 'batch;;nasa-roses-2026-sbs;;OR-20' \\
+        --layers sbs --min-zoom 8 --max-zoom 15 --processes 4
+
+    # Start over instead of resuming an interrupted run (progress of a
+    # completed run, or of a run with other arguments, is never resumed)
+    python manage.py seed_tiles --restart
+"""
+
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from server.watershed.loaders.config import get_config
+from server.watershed.models import Watershed
+from server.watershed.tiles.cache import get_tile_cache
+from server.watershed.tiles.layers import FAMILIES
+from server.watershed.tiles.seed import (
+    SeedState,
+    build_tasks,
+    list_seed_layers,
+    render_seed_task,
+    watershed_tiles,
+)
+from server.watershed.utils.logging import LoaderLogger, LoadPhase, configure_logging
+from server.watershed.versioning import get_generation
+
+
+def _init_worker():
+    """Make sure Django is configured in pool workers (spawn / forkserver)."""
+    import django
+    django.setup()
+
+
+class Command(BaseCommand):
+    help = 'Pre-render raster map tiles for watersheds into the tile cache.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--runids',
+            nargs='+',
+            metavar='RUNID',
+            help='Seed only specified watersheds by runid (space-separated). Defaults to all.',
+        )
+        parser.add_argument(
+            '--layers',
+            nargs='+',
+            choices=FAMILIES,
+            default=list(FAMILIES),
+            help='Layer families to seed (default: all)',
+        )
+        parser.add_argument('--min-zoom', type=int, default=8, help='Lowest zoom level (default: 8)')
+        parser.add_argument('--max-zoom', type=int, default=14, help='Highest zoom level (default: 14)')
+        parser.add_argument(
+            '--processes',
+            type=int,
+            default=os.cpu_count() or 1,
+            help='Worker processes used for rendering (default: CPU count)',
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=64,
+            help='Tiles per work unit (default: 64)',
+        )
+        parser.add_argument(
+            '--restart',
+            action='store_true',
+            help='Ignore progress from a previous interrupted run',
+        )
+
+    def handle(self, *args, **options):
+        min_zoom, max_zoom = options['min_zoom'], options['max_zoom']
+        if not 0 <= min_zoom <= max_zoom:
+            raise CommandError('--min-zoom must be between 0 and --max-zoom.')
+        if options['processes'] < 1 or options['chunk_size'] < 1:
+            raise CommandError('--processes and --chunk-size must be at least 1.')
+
+        cache = get_tile_cache()
+        if not cache.enabled:
+            raise CommandError('TILE_CACHE_DIR is not set; there is no tile cache to seed.')
+
+        configure_logging(verbose=options['verbosity'] > 1)
+        log = LoaderLogger()
+
+        watersheds = Watershed.objects.only('runid', 'geom').order_by('runid')
+        runids = options['runids']
+        if runids:
+            watersheds = watersheds.filter(runid__in=runids)
+            missing = set(runids) - set(watersheds.values_list('runid', flat=True))
+            for runid in sorted(missing):
+                log.warning(f"Watershed not in database, skipping: {runid}")
+
+        # Progress only carries over to a re-run of the same seed over the
+        # same data.
+        run = (
+            f"generation={get_generation()} zoom={min_zoom}-{max_zoom} "
+            f"layers={','.join(sorted(options['layers']))} chunk={options['chunk_size']} "
+            f"runids={','.join(sorted(runids)) if runids else 'all'}"
+        )
+        state = SeedState(
+            get_config().local_data_dir / 'seed_tiles.state',
+            run=run,
+            restart=options['restart'],
+        )
+
+        self.stdout.write(f"==> Planning tiles for zooms {min_zoom}-{max_zoom}...")
+        tasks = []
+        for watershed in watersheds:
+            tiles = watershed_tiles(watershed.geom, min_zoom, max_zoom)
+            for layer in list_seed_layers(watershed.runid, options['layers']):
+                tasks.extend(build_tasks(layer, tiles, options['chunk_size']))
+
+        pending = [t for t in tasks if not state.is_done(t.task_id)]
+        self.stdout.write(
+            f"==> {len(tasks)} work units, {len(tasks) - len(pending)} already done; "
+            f"seeding {len(pending)} on {options['processes']} process(es) into {cache.root}"
+        )
+
+        totals = {'rendered': 0, 'cached': 0, 'empty': 0, 'failed': 0}
+        log.start_phase(LoadPhase.SEEDING_TILES, total_items=len(pending))
+        try:
+            for task, result in self._run(pending, options['processes']):
+                if isinstance(result, Exception) or result.error:
+                    totals['failed'] += 1
+                    error = result if isinstance(result, Exception) else RuntimeError(result.error)
+                    log.item_error(task.task_id, error)
+                    log.item_skipped(task.task_id, 'failed')
+                    continue
+                totals['rendered'] += result.rendered
+                totals['cached'] += result.cached
+                totals['empty'] += result.empty
+                state.mark_done(task.task_id)
+                log.item_complete(
+                    task.task_id,
+                    records_saved=result.rendered,
+                    extra_info=f"{result.cached} cached, {result.empty} empty",
+                )
+            if not totals['failed']:
+                state.finish()
+        finally:
+            state.close()
+
+        log.end_phase(records_saved=totals['rendered'])
+        log.summary()
+
+        self.stdout.write(self.style.SUCCESS(
+            f"✓ Rendered {totals['rendered']} tiles "
+            f"({totals['cached']} already cached, {totals['empty']} outside raster)"
+        ))
+        if totals['failed']:
+            self.stdout.write(self.style.WARNING(
+                f"{totals['failed']} work unit(s) failed; re-run to retry them."
+            ))
+
+    def _run(self, tasks, processes):
+        """Yield ``(task, SeedResult | Exception)`` as tasks complete."""
+        if processes == 1:
+            for task in tasks:
+                try:
+                    yield task, render_seed_task(task)
+                except Exception as exc:
+                    yield task, exc
+            return
+
+        # Forked workers must not share the parent's database connections.
+        connections.close_all()
+        pool = ProcessPoolExecutor(max_workers=processes, initializer=_init_worker)
+        try:
+            futures = {pool.submit(render_seed_task, task): task for task in tasks}
+            for future in as_completed(futures):
+                task = futures[future]
+                try:
+                    yield task, future.result()
+                except Exception as exc:
+                    yield task, exc
+        finally:
+            # On interruption drop queued work; finished tasks are already
+            # recorded in the state file so the next run resumes from there.
+            pool.shutdown(wait=False, cancel_futures=True)
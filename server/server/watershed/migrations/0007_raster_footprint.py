@@ -0,0 +1,28 @@
+# Generated by Django 5.1.4 on 2026-10-17 00:54
+
+import django.contrib.gis.db.models.fields
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('watershed', '0006_watershed_utility_metadata'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RasterFootprint',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('runid', models.CharField(max_length=255)),
+                ('rel_path', models.CharField(max_length=512)),
+                ('bounds', django.contrib.gis.db.models.fields.PolygonField(srid=4326)),
+                ('footprint', django.contrib.gis.db.models.fields.MultiPolygonField(srid=4326)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('runid', 'rel_path'), name='unique_raster_footprint')],
+            },
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.1.4 on 2026-10-17 01:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('watershed', '0008_data_versioning'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RasterStatistics',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('url', models.CharField(max_length=1024)),
+                ('revision', models.CharField(blank=True, max_length=64)),
+                ('min', models.FloatField()),
+                ('max', models.FloatField()),
+                ('mean', models.FloatField(blank=True, null=True)),
+                ('std', models.FloatField(blank=True, null=True)),
+                ('valid_pixels', models.BigIntegerField(default=0)),
+                ('percentiles', models.JSONField(default=dict)),
+                ('histogram', models.JSONField(default=dict)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('url', 'revision'), name='unique_raster_statistics')],
+            },
+        ),
+    ]
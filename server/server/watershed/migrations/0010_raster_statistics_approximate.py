@@ -0,0 +1,18 @@
+# Generated by Django 5.1.4 on 2026-10-17 01:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('watershed', '0009_raster_statistics'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='rasterstatistics',
+            name='approximate',
+            field=models.BooleanField(default=False),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.1.4 on 2026-10-17 01:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('watershed', '0010_raster_statistics_approximate'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DiscoveryCatalog',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('runid', models.CharField(max_length=255)),
+                ('kind', models.CharField(max_length=32)),
+                ('payload', models.JSONField(blank=True, null=True)),
+                ('complete', models.BooleanField(default=True)),
+                ('refreshed_at', models.DateTimeField()),
+                ('refresh_started_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('runid', 'kind'), name='unique_discovery_catalog')],
+            },
+        ),
+    ]
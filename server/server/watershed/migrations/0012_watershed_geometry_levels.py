@@ -0,0 +1,24 @@
+# Generated by Django 5.1.4 on 2026-10-17 01:38
+
+import django.contrib.gis.db.models.fields
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('watershed', '0011_discovery_catalog'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='watershed',
+            name='geom_coarse',
+            field=django.contrib.gis.db.models.fields.MultiPolygonField(blank=True, null=True, srid=4326),
+        ),
+        migrations.AddField(
+            model_name='watershed',
+            name='geom_medium',
+            field=django.contrib.gis.db.models.fields.MultiPolygonField(blank=True, null=True, srid=4326),
+        ),
+    ]
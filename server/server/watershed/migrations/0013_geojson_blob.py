@@ -0,0 +1,24 @@
+# Generated by Django 5.1.4 on 2026-10-17 01:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('watershed', '0012_watershed_geometry_levels'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GeoJSONBlob',
+            fields=[
+                ('key', models.CharField(max_length=300, primary_key=True, serialize=False)),
+                ('runid', models.CharField(blank=True, db_index=True, max_length=255)),
+                ('digest', models.CharField(max_length=64)),
+                ('body', models.BinaryField()),
+                ('gzip_body', models.BinaryField()),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
@@ -29,6 +29,9 @@ class Watershed(models.Model):
     runid = models.CharField(primary_key=True, max_length=255)
     geom = models.MultiPolygonField(srid=4326)
     simplified_geom = models.MultiPolygonField(srid=4326, null=True, blank=True)
+    # Coarser levels of detail for overview maps (see geometry_levels.py)
+    geom_medium = models.MultiPolygonField(srid=4326, null=True, blank=True)
+    geom_coarse = models.MultiPolygonField(srid=4326, null=True, blank=True)
 
 # This is based on an auto-generated Django model module created by ogrinspect.
 class Subcatchment(models.Model):
@@ -90,4 +93,95 @@ class Channel(models.Model):
     topazid = models.IntegerField()
     weppid = models.IntegerField()
     order = models.IntegerField()
-    geom = models.MultiPolygonField(srid=4326)
\ No newline at end of file
+    geom = models.MultiPolygonField(srid=4326)
+
+# Extent and valid-data footprint of a tile-served raster, so tile requests
+# that miss the data can be answered without opening the GeoTIFF.
+class RasterFootprint(models.Model):
+    runid = models.CharField(max_length=255)
+    # Raster path relative to the run's download/ endpoint, e.g. "disturbed/sbs_4class.tif"
+    rel_path = models.CharField(max_length=512)
+    bounds = models.PolygonField(srid=4326)
+    footprint = models.MultiPolygonField(srid=4326)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['runid', 'rel_path'], name='unique_raster_footprint'),
+        ]
+
+# Monotonic data version counters.  The "data" generation is bumped whenever
+# the loader or the raster mirror changes what the API serves; ETags and
+# version-stamped URLs are derived from it (see versioning.py).
+class DataGeneration(models.Model):
+    scope = models.CharField(primary_key=True, max_length=64)
+    value = models.PositiveBigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+# Upstream revision of a tile-served raster (ETag, or Last-Modified + size),
+# recorded when the raster is discovered or mirrored.
+class RasterRevision(models.Model):
+    runid = models.CharField(max_length=255)
+    # Raster path relative to the run's download/ endpoint, e.g. "disturbed/sbs_4class.tif"
+    rel_path = models.CharField(max_length=512)
+    revision = models.CharField(max_length=64)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['runid', 'rel_path'], name='unique_raster_revision'),
+        ]
+
+# Band statistics of a raster source, computed once per upstream revision so
+# that no worker has to scan the raster again (see tiles/stats.py).
+class RasterStatistics(models.Model):
+    # Local mirror path or remote URL the raster is read from
+    url = models.CharField(max_length=1024)
+    revision = models.CharField(max_length=64, blank=True)
+    min = models.FloatField()
+    max = models.FloatField()
+    mean = models.FloatField(null=True, blank=True)
+    std = models.FloatField(null=True, blank=True)
+    valid_pixels = models.BigIntegerField(default=0)
+    percentiles = models.JSONField(default=dict)  # {"2": value, "50": value, ...}
+    histogram = models.JSONField(default=dict)    # {"counts": [...], "edges": [...]}
+    # Computed from an overview or a sample of blocks (see tiles/stats.py)
+    approximate = models.BooleanField(default=False)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['url', 'revision'], name='unique_raster_statistics'),
+        ]
+
+# Discovered RHESSys spatial inputs or output maps of a run, scraped from the
+# WEPPcloud file browser and refreshed in the background (see catalog.py).
+class DiscoveryCatalog(models.Model):
+    runid = models.CharField(max_length=255)
+    # "spatial" or "outputs"
+    kind = models.CharField(max_length=32)
+    # Discovery result; null when the run has no products of this kind
+    payload = models.JSONField(null=True, blank=True)
+    # False when discovery hit its deadline and entries may be missing
+    complete = models.BooleanField(default=True)
+    refreshed_at = models.DateTimeField()
+    # Set while a worker re-scans the run
+    refresh_started_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['runid', 'kind'], name='unique_discovery_catalog'),
+        ]
+
+# Precomputed FeatureCollection bodies of the unfiltered list endpoints,
+# written by the loader and served as-is (see precomputed.py).
+class GeoJSONBlob(models.Model):
+    # "watersheds", "watersheds:simplified", "subcatchments:<runid>", ...
+    key = models.CharField(primary_key=True, max_length=300)
+    # Watershed the collection belongs to; empty for the watershed list
+    runid = models.CharField(max_length=255, blank=True, db_index=True)
+    # SHA-256 of body, to skip rewriting unchanged collections
+    digest = models.CharField(max_length=64)
+    body = models.BinaryField()
+    gzip_body = models.BinaryField()
+    updated_at = models.DateTimeField(auto_now=True)
@@ -0,0 +1,153 @@
+"""
+Precomputed GeoJSON responses.
+
+Watershed, subcatchment and channel collections only change when data is
+loaded, so the loader stores the final bytes of the unfiltered list
+responses in ``GeoJSONBlob``, plain and gzip-compressed:
+
+    key                       collection
+    watersheds                GET /api/watershed/
+    watersheds:simplified     GET /api/watershed/?simplified_geom=true
+    subcatchments:<runid>     GET /api/watershed/<runid>/subcatchments
+    channels:<runid>          GET /api/watershed/<runid>/channels
+
+The views serve a stored body without querying the features (``gzip`` when
+the client accepts it); requests with filters, paging or a ``zoom`` /
+``tolerance`` level of detail are built as before, as is any collection
+without a blob.  A rebuild only rewrites collections whose bytes changed,
+and ``load_watershed_data --runids`` only rebuilds the runs it loaded (plus
+the watershed list).  Callers bump the data generation after a rebuild, never
+before: the ETags and ``?v=`` URLs of the new version must only ever cover
+the new bytes, which clients cache as immutable.  Brotli is not offered: no brotli encoder is a
+dependency of the server.
+"""
+
+from __future__ import annotations
+
+import gzip
+import hashlib
+import logging
+from dataclasses import dataclass
+from typing import Callable, Iterable, Iterator, Optional
+
+from django.db import DatabaseError
+from django.http import HttpResponse
+from django.utils.cache import patch_vary_headers
+
+from server.watershed.geojson import DEFAULT_PRECISION, accepts_gzip, geojson_response
+
+logger = logging.getLogger("watershed.precomputed")
+
+WATERSHEDS = "watersheds"
+SIMPLIFIED_WATERSHEDS = "watersheds:simplified"
+
+
+def subcatchments_key(runid: str) -> str:
+    return f"subcatchments:{runid}"
+
+
+def channels_key(runid: str) -> str:
+    return f"channels:{runid}"
+
+
+@dataclass
+class BuildResult:
+    """Counts of a blob rebuild."""
+    written: int = 0
+    unchanged: int = 0
+    removed: int = 0
+
+
+def _collections(runids: Iterable[str]) -> Iterator[tuple[str, str, Callable[[], bytes]]]:
+    """Yield ``(key, runid, build)`` for the watershed list and each run."""
+    from server.watershed.models import Channel, Subcatchment, Watershed
+    from server.watershed.views import CHANNEL_PROPERTIES, SUBCATCHMENT_PROPERTIES, WATERSHED_PROPERTIES
+
+    # Same arguments as the list views; ordered so that unchanged data
+    # produces identical bytes.
+    for key, geo_field in ((WATERSHEDS, "geom"), (SIMPLIFIED_WATERSHEDS, "simplified_geom")):
+        yield key, "", lambda geo_field=geo_field: geojson_response(
+            Watershed.objects.order_by("runid"),
+            geo_field=geo_field,
+            id_field="runid",
+            properties=WATERSHED_PROPERTIES,
+            precision=DEFAULT_PRECISION,
+        ).content
+
+    for runid in runids:
+        yield subcatchments_key(runid), runid, lambda runid=runid: geojson_response(
+            Subcatchment.objects.filter(watershed_id=runid).order_by("id"),
+            geo_field="geom",
+            properties=SUBCATCHMENT_PROPERTIES,
+        ).content
+        yield channels_key(runid), runid, lambda runid=runid: geojson_response(
+            Channel.objects.filter(watershed_id=runid).order_by("id"),
+            geo_field="geom",
+            properties=CHANNEL_PROPERTIES,
+        ).content
+
+
+def build_blobs(runids: Optional[Iterable[str]] = None) -> BuildResult:
+    """
+    Store the precomputed collections of the watershed list and of *runids*
+    (default: every watershed, dropping blobs of runs no longer loaded).
+    """
+    from server.watershed.models import GeoJSONBlob, Watershed
+
+    loaded = set(Watershed.objects.values_list("runid", flat=True))
+    result = BuildResult()
+    if runids is None:
+        runids = sorted(loaded)
+        result.removed, _ = GeoJSONBlob.objects.exclude(runid="").exclude(runid__in=loaded).delete()
+    else:
+        runids = [runid for runid in runids if runid in loaded]
+
+    digests = dict(GeoJSONBlob.objects.values_list("key", "digest"))
+    for key, runid, build in _collections(runids):
+        body = build()
+        digest = hashlib.sha256(body).hexdigest()
+        if digests.get(key) == digest:
+            result.unchanged += 1
+            continue
+        GeoJSONBlob.objects.update_or_create(
+            key=key,
+            defaults={
+                "runid": runid,
+                "digest": digest,
+                "body": body,
+                "gzip_body": gzip.compress(body, compresslevel=9, mtime=0),
+            },
+        )
+        result.written += 1
+    return result
+
+
+def clear_blobs() -> None:
+    """Delete every precomputed collection (e.g. before a full reload)."""
+    from server.watershed.models import GeoJSONBlob
+
+    GeoJSONBlob.objects.all().delete()
+
+
+def blob_response(request, key: str) -> Optional[HttpResponse]:
+    """
+    Return the stored collection *key*, gzip-encoded if *request* accepts
+    it, or None when there is none.
+    """
+    from server.watershed.models import GeoJSONBlob
+
+    compressed = accepts_gzip(request)
+    column = "gzip_body" if compressed else "body"
+    try:
+        body = GeoJSONBlob.objects.filter(key=key).values_list(column, flat=True).first()
+    except DatabaseError as exc:
+        logger.warning("Precomputed GeoJSON lookup failed for %s: %s", key, exc)
+        return None
+    if body is None:
+        return None
+
+    response = HttpResponse(bytes(body), content_type="application/json")
+    if compressed:
+        response["Content-Encoding"] = "gzip"
+    patch_vary_headers(response, ("Accept-Encoding",))
+    return response
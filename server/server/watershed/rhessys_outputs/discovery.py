@@ -6,8 +6,17 @@ The pre-computed maps (Victoria + Mill Creek) live in scenario subdirectories
 (e.g. ``baseline/``, ``Pspread_fire_1yr_change/``) each containing variable
 GeoTIFFs (``streamflow.tif``, ``lai.tif``, etc.).
 
-Results are cached in memory with a TTL so the remote server is not hammered
-on every API request.
+Results are stored in the discovery catalog (see ``catalog.py``) so the
+remote server is not hammered on every API request; value ranges are
+re-read from the statistics store when served (see
+:func:`current_value_ranges`).  The upstream revision
+of each discovered map is recorded (see ``versioning.py``) so its tiles get
+stable ETags.
+
+Scenario browse pages and per-map statistics are fetched concurrently
+(see ``fanout.py``) within an overall deadline; a catalog missing entries
+that did not finish in time is flagged ``partial`` and re-scanned in the
+background.
 """
 
 from __future__ import annotations
@@ -17,23 +26,26 @@ import re
 from typing import Optional
 
 import requests
-from cachetools import TTLCache
 
+from server.watershed import upstream
+from server.watershed.catalog import OUTPUT_MAPS, get_catalog
+from server.watershed.fanout import fan_out, get_fanout_config
 from server.watershed.loaders.config import resolve_run_base_url
+from server.watershed.tiles.mirror import mirrored_or_remote
+from server.watershed.tiles.stats import get_raster_stats
+from server.watershed.versioning import record_discovered_revision
 from .registry import (
     SCENARIO_BY_ID,
     VARIABLE_BY_FILENAME,
     OUTPUT_VARIABLES,
     SCENARIO_REGISTRY,
 )
-from .tile import _get_global_minmax
 
 logger = logging.getLogger("watershed.rhessys_outputs")
 
-_BROWSE_MAPS = "browse/rhessys/maps/"
-_DOWNLOAD_MAPS = "download/rhessys/maps"
-
-_discovery_cache: TTLCache[str, Optional[dict]] = TTLCache(maxsize=100, ttl=3600)
+MAPS_SUBPATH = "rhessys/maps"
+_BROWSE_MAPS = f"browse/{MAPS_SUBPATH}/"
+_DOWNLOAD_MAPS = f"download/{MAPS_SUBPATH}"
 
 _DIR_PATTERN = re.compile(r'[\w\-]+(?=[\s"\'<>])')
 _TIF_PATTERN = re.compile(r'[\w\-\.]+\.tif(?=[\s"\'<>])')
@@ -45,10 +57,19 @@ def get_map_download_url(runid: str, scenario: str, filename: str) -> str:
     return f"{base}/{_DOWNLOAD_MAPS}/{scenario}/{filename}"
 
 
+def get_map_tile_source(runid: str, scenario: str, filename: str) -> str:
+    """Return the mirrored local COG for a map GeoTIFF, or its download URL."""
+    return mirrored_or_remote(
+        runid,
+        f"{MAPS_SUBPATH}/{scenario}/{filename}",
+        get_map_download_url(runid, scenario, filename),
+    )
+
+
 def _fetch_page(url: str) -> Optional[str]:
     """Fetch an HTML directory listing, or None on failure."""
     try:
-        resp = requests.get(url, timeout=15)
+        resp = upstream.get(url)
         if resp.status_code == 200:
             return resp.text
         logger.info("Browse page returned %d for %s", resp.status_code, url)
@@ -93,77 +114,127 @@ def _discover_variables(runid: str, scenario: str) -> list[str]:
     return result
 
 
+def _discover_all_variables(
+    runid: str,
+    scenarios: list[str],
+    deadline: Optional[float] = None,
+) -> tuple[dict[str, list[str]], bool]:
+    """List the variables of every scenario concurrently.
+
+    Returns ``({scenario_id: [filename]}, complete)``; scenarios whose
+    browse page was not fetched before *deadline* are missing.
+    """
+    base = resolve_run_base_url(runid)
+    listing = fan_out(
+        (
+            (scenario_id, f"{base}/{_BROWSE_MAPS}{scenario_id}/",
+             lambda scenario_id=scenario_id: _discover_variables(runid, scenario_id))
+            for scenario_id in scenarios
+        ),
+        deadline=deadline,
+    )
+    found = {s: listing.results[s] for s in scenarios if s in listing.results}
+    return found, listing.complete
+
+
+def list_output_map_files(runid: str) -> list[tuple[str, str]]:
+    """List ``(scenario_id, filename)`` for every discovered output map.
+
+    Unlike :func:`discover_output_maps` this only probes the browse pages
+    and never computes raster statistics.
+    """
+    variables, _ = _discover_all_variables(runid, _discover_scenarios(runid))
+    return [
+        (scenario_id, filename)
+        for scenario_id, filenames in variables.items()
+        for filename in filenames
+    ]
+
+
+def _display_range(runid: str, scenario_id: str, filename: str, is_change: bool) -> dict:
+    """Return the display value range of one map from its raster statistics."""
+    stats = get_raster_stats(get_map_tile_source(runid, scenario_id, filename))
+    min_val, max_val = stats.min, stats.max
+
+    # Apply same symmetrization logic as tile rendering for change maps
+    if is_change and min_val < 0:
+        abs_max = max(abs(min_val), abs(max_val))
+        min_val = -abs_max
+        max_val = abs_max
+
+    return {
+        "min": float(min_val),
+        "max": float(max_val),
+    }
+
+
+def _value_range(runid: str, scenario_id: str, filename: str, is_change: bool) -> dict:
+    """Record the revision of one map and return its display value range."""
+    record_discovered_revision(
+        runid,
+        f"{MAPS_SUBPATH}/{scenario_id}/{filename}",
+        get_map_download_url(runid, scenario_id, filename),
+    )
+    return _display_range(runid, scenario_id, filename, is_change)
+
+
 def _compute_value_ranges(
     runid: str,
     scenarios: list[dict],
     variables: list[dict],
-) -> dict[str, dict[str, dict]]:
+    deadline: Optional[float] = None,
+) -> tuple[dict[str, dict[str, dict]], bool]:
     """Compute actual min/max value ranges for each scenario/variable.
 
-    Returns a nested dict: {scenario_id: {variable_id: {min, max}}}
+    Ranges come from the shared statistics store, so rasters are only
+    scanned the first time a revision is seen.  Maps are processed
+    concurrently; those not done by *deadline* are left out.
+
+    Returns ``(ranges, complete)`` where ranges is a nested dict:
+    {scenario_id: {variable_id: {min, max}}}
     Applies the same symmetrization logic used for rendering change maps.
     """
-    ranges: dict[str, dict[str, dict]] = {}
-    
+    calls = []
     for scenario in scenarios:
-        scenario_id = scenario["id"]
-        is_change = scenario["is_change"]
-        ranges[scenario_id] = {}
-        
         for variable in variables:
-            variable_id = variable["id"]
-            filename = variable["filename"]
-            
             # Only compute range if this variable exists in this scenario
-            if variable_id not in scenario["variables"]:
+            if variable["id"] not in scenario["variables"]:
                 continue
-            
-            try:
-                tif_url = get_map_download_url(runid, scenario_id, filename)
-                min_val, max_val = _get_global_minmax(tif_url)
-                
-                # Apply same symmetrization logic as tile rendering for change maps
-                if is_change and min_val < 0:
-                    abs_max = max(abs(min_val), abs(max_val))
-                    min_val = -abs_max
-                    max_val = abs_max
-                
-                ranges[scenario_id][variable_id] = {
-                    "min": float(min_val),
-                    "max": float(max_val),
-                }
-            except Exception as e:
-                logger.warning(
-                    "Failed to compute range for %s/%s/%s: %s",
-                    runid, scenario_id, variable_id, e,
-                )
-                continue
-    
-    return ranges
+            scenario_id, filename = scenario["id"], variable["filename"]
+            calls.append((
+                (scenario_id, variable["id"]),
+                get_map_tile_source(runid, scenario_id, filename),
+                lambda s=scenario_id, f=filename, c=scenario["is_change"]: _value_range(runid, s, f, c),
+            ))
 
+    computed = fan_out(calls, deadline=deadline)
 
-def discover_output_maps(runid: str) -> Optional[dict]:
-    """Discover available RHESSys output map products for a watershed.
+    # Failed maps are logged by fan_out and left out, as are unfinished ones.
+    ranges: dict[str, dict[str, dict]] = {s["id"]: {} for s in scenarios}
+    for (scenario_id, variable_id), value_range in computed.results.items():
+        ranges[scenario_id][variable_id] = value_range
+    return ranges, computed.complete
 
-    Returns a dict with ``scenarios`` and ``variables`` lists, or None
-    if the watershed has no map data.  Results are cached for 1 hour.
-    """
-    if runid in _discovery_cache:
-        return _discovery_cache[runid]
 
-    scenarios = _discover_scenarios(runid)
+def scan_output_maps(runid: str, deadline: Optional[float] = None) -> tuple[Optional[dict], bool]:
+    """Scrape the output map products of a watershed from WEPPcloud.
+
+    Returns ``(catalog, complete)``: a dict with ``scenarios``,
+    ``variables``, ``value_ranges`` and ``partial`` (True if *deadline*
+    cut the scan short), or None if the watershed has no map data.
+    """
+    scenarios = [s for s in _discover_scenarios(runid) if s in SCENARIO_BY_ID]
     if not scenarios:
-        _discovery_cache[runid] = None
-        return None
+        return None, True
+
+    scenario_variables, complete = _discover_all_variables(runid, scenarios, deadline)
 
     available_scenarios: list[dict] = []
     all_variables: set[str] = set()
 
     for scenario_id in scenarios:
-        meta = SCENARIO_BY_ID.get(scenario_id)
-        if not meta:
-            continue
-        var_filenames = _discover_variables(runid, scenario_id)
+        meta = SCENARIO_BY_ID[scenario_id]
+        var_filenames = scenario_variables.get(scenario_id)
         if not var_filenames:
             continue
         available_scenarios.append({
@@ -175,8 +246,7 @@ def discover_output_maps(runid: str) -> Optional[dict]:
         all_variables.update(var_filenames)
 
     if not available_scenarios:
-        _discovery_cache[runid] = None
-        return None
+        return None, complete
 
     variables = []
     for var in OUTPUT_VARIABLES:
@@ -189,12 +259,52 @@ def discover_output_maps(runid: str) -> Optional[dict]:
             })
 
     # Compute value ranges for each scenario/variable combination
-    value_ranges = _compute_value_ranges(runid, available_scenarios, variables)
+    value_ranges, ranges_complete = _compute_value_ranges(
+        runid, available_scenarios, variables, deadline,
+    )
+    complete = complete and ranges_complete
 
     result = {
         "scenarios": available_scenarios,
         "variables": variables,
         "value_ranges": value_ranges,
+        "partial": not complete,
     }
-    _discovery_cache[runid] = result
-    return result
+    return result, complete
+
+
+def current_value_ranges(runid: str, catalog: dict) -> dict[str, dict[str, dict]]:
+    """Re-read the value ranges of a catalog from the statistics store.
+
+    The ranges stored with the catalog were computed at scan time and go
+    stale when statistics are refined or a map is re-mirrored; both bump
+    the data generation, which :func:`get_raster_stats` caches by.  Maps
+    that do not finish within the fan-out deadline keep their stored range.
+    """
+    filenames = {variable["id"]: variable["filename"] for variable in catalog["variables"]}
+    is_change = {scenario["id"]: scenario["is_change"] for scenario in catalog["scenarios"]}
+    calls = [
+        (
+            (scenario_id, variable_id),
+            get_map_tile_source(runid, scenario_id, filenames[variable_id]),
+            lambda s=scenario_id, f=filenames[variable_id]: _display_range(runid, s, f, is_change[s]),
+        )
+        for scenario_id, ranges in catalog["value_ranges"].items()
+        for variable_id in ranges
+        if variable_id in filenames and scenario_id in is_change
+    ]
+    computed = fan_out(calls, deadline=get_fanout_config().deadline())
+
+    ranges = {scenario_id: dict(stored) for scenario_id, stored in catalog["value_ranges"].items()}
+    for (scenario_id, variable_id), value_range in computed.results.items():
+        ranges[scenario_id][variable_id] = value_range
+    return ranges
+
+
+def discover_output_maps(runid: str) -> Optional[dict]:
+    """Discover available RHESSys output map products for a watershed.
+
+    Returns the catalog described in :func:`scan_output_maps`, or None if
+    the watershed has no map data.  Served from the discovery catalog.
+    """
+    return get_catalog(OUTPUT_MAPS, runid, scan_output_maps)
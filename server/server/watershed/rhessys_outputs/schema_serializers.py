@@ -27,3 +27,10 @@ class RhessysOutputListResponseSerializer(serializers.Serializer):
         child=serializers.DictField(child=ValueRangeSerializer()),
         help_text="Nested dict: {scenario_id: {variable_id: {min, max}}}",
     )
+    versions = serializers.DictField(
+        child=serializers.DictField(child=serializers.CharField()),
+        help_text="Nested dict: {scenario_id: {variable_id: version}}; append ?v=<version> to tile URLs to cache them as immutable",
+    )
+    partial = serializers.BooleanField(
+        help_text="True if discovery hit its deadline; some scenarios or value ranges are missing and the list should be requested again later",
+    )
@@ -5,53 +5,43 @@ Supports two rendering modes:
   - sequential: viridis-like gradient for baseline/absolute maps
   - diverging: blue-white-red gradient for change/delta maps
 
-Global raster statistics (min/max) are computed once per GeoTIFF and cached
-so that every tile is rescaled against the same range, producing a coherent
-colormap across the entire map.
+Global raster statistics (min/max) are computed once per GeoTIFF revision
+and stored in the database (see ``tiles/stats.py``) so that every tile is
+rescaled against the same range, producing a coherent colormap across the
+entire map.
 """
 
 from __future__ import annotations
 
-from cachetools import TTLCache
-from rio_tiler.io import Reader
+from functools import lru_cache
 
-from .colormap import build_sequential_colormap, build_diverging_colormap
+from server.watershed.tiles.layers import OUTPUTS
+from server.watershed.tiles.raw import read_tile_array
+from server.watershed.tiles.data import Quantization, continuous_lut
+from server.watershed.tiles.render import ContinuousColorizer
+from server.watershed.tiles.stats import get_raster_stats
 
-_global_stats_cache: TTLCache[str, tuple[float, float]] = TTLCache(
-    maxsize=128, ttl=3600,
-)
+from .colormap import build_sequential_colormap, build_diverging_colormap
 
 
 def _get_global_minmax(tif_url: str) -> tuple[float, float]:
-    """Return (min, max) for the first band of *tif_url*, cached."""
-    cached = _global_stats_cache.get(tif_url)
-    if cached is not None:
-        return cached
+    """Return (min, max) for the first band of *tif_url* from the statistics store."""
+    stats = get_raster_stats(tif_url)
+    return stats.min, stats.max
 
-    with Reader(tif_url) as src:
-        stats = src.statistics()
 
-    band_key = next(iter(stats))
-    band_stats = stats[band_key]
-    result = (band_stats.min, band_stats.max)
-    _global_stats_cache[tif_url] = result
-    return result
+@lru_cache(maxsize=256)
+def get_colorizer(is_change: bool, min_val: float, max_val: float) -> ContinuousColorizer:
+    """Return the compiled colormap for a map's value range (cached)."""
+    cm = build_diverging_colormap() if is_change else build_sequential_colormap()
+    return ContinuousColorizer(cm, min_val, max_val)
 
 
-def get_tile_png(
-    tif_url: str,
-    tile_z: int,
-    tile_x: int,
-    tile_y: int,
-    *,
-    is_change: bool = False,
-) -> bytes:
-    """Return 256x256 PNG bytes for a Web Mercator tile.
+def get_render_range(tif_url: str, is_change: bool = False) -> tuple[float, float]:
+    """Return the (min, max) value range a map is colored over.
 
-    The GeoTIFF is read remotely via rio-tiler. Data is rescaled to 0-255
-    using the **global** raster min/max so that colours are consistent
-    across all tiles.  Change maps use a diverging colormap; baseline maps
-    use a sequential one.
+    Based on the **global** raster min/max so that colours are consistent
+    across all tiles.
     """
     min_val, max_val = _get_global_minmax(tif_url)
 
@@ -78,13 +68,38 @@ def get_tile_png(
         else:
             max_val = min_val + 1e-10  # pixels stay at index 0 (minimum)
 
-    with Reader(tif_url) as src:
-        img = src.tile(tile_x, tile_y, tile_z, tilesize=256)
+    return min_val, max_val
+
+
+def get_quantization(tif_url: str, is_change: bool = False) -> Quantization:
+    """Return how raw-data tiles of a map store its values (uint16 steps)."""
+    return Quantization.for_range(*get_render_range(tif_url, is_change))
 
-    rescaled = img.rescale(
-        in_range=((min_val, max_val),),
-        out_range=((0, 255),),
-    )
 
+def get_lut(tif_url: str, is_change: bool = False) -> dict:
+    """Return LUT metadata for client-side colorization of raw-data tiles."""
+    min_val, max_val = get_render_range(tif_url, is_change)
     cm = build_diverging_colormap() if is_change else build_sequential_colormap()
-    return rescaled.render(colormap=cm)
+    return continuous_lut(cm, min_val, max_val, get_quantization(tif_url, is_change))
+
+
+def get_tile_png(
+    tif_url: str,
+    tile_z: int,
+    tile_x: int,
+    tile_y: int,
+    *,
+    is_change: bool = False,
+    img_format: str = "PNG",
+) -> bytes:
+    """Return 256x256 PNG (or *img_format*) bytes for a Web Mercator tile.
+
+    The GeoTIFF is read remotely via rio-tiler. Data is mapped onto the
+    colormap using the **global** raster min/max so that colours are consistent
+    across all tiles.  Change maps use a diverging colormap; baseline maps
+    use a sequential one.
+    """
+    min_val, max_val = get_render_range(tif_url, is_change)
+    data = read_tile_array(tif_url, tile_z, tile_x, tile_y, family=OUTPUTS)
+
+    return get_colorizer(is_change, min_val, max_val).render(data, img_format=img_format)
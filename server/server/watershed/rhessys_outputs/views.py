@@ -1,13 +1,19 @@
 """
 API views for RHESSys output map data.
 
-Three endpoints:
+Endpoints:
   GET /api/watershed/<runid>/rhessys/outputs
       → list of available scenarios and variables with legend metadata
 
   GET /api/watershed/<runid>/rhessys/outputs/<scenario>/<variable>/tiles/<z>/<x>/<y>.png
       → 256×256 PNG tile with appropriate colormap
 
+  GET /api/watershed/<runid>/rhessys/outputs/<scenario>/<variable>/tiles/<z>/<x>/<y>.bin
+      → 256×256 quantized raw values for client-side colorization
+
+  GET /api/watershed/<runid>/rhessys/outputs/<scenario>/<variable>/lut
+      → colormap LUT for the raw-data tiles
+
   GET /api/watershed/<runid>/rhessys/outputs/geometry/<scale>
       → Proxy for hillslope/patch GeoJSON from WEPPcloud (avoids CORS)
 """
@@ -16,13 +22,11 @@ from __future__ import annotations
 
 import json
 import logging
-import struct
-import zlib
 
 import rasterio.errors
 import requests
-from cachetools import TTLCache
 from django.http import HttpResponse
+from django.utils.cache import patch_vary_headers
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework.exceptions import NotFound
@@ -30,33 +34,22 @@ from drf_spectacular.utils import extend_schema, OpenApiParameter, OpenApiRespon
 from drf_spectacular.types import OpenApiTypes
 from rio_tiler.errors import TileOutsideBounds
 
+from server.watershed import upstream
 from server.watershed.loaders.config import resolve_run_base_url
-from .discovery import discover_output_maps, get_map_download_url
+from server.watershed.shared_cache import SharedCache
+from server.watershed.singleflight import single_flight
+from server.watershed.tiles.cache import get_tile_cache
+from server.watershed.tiles.data import data_tile_response, get_tile_data
+from server.watershed.tiles.footprint import tile_outside_footprint
+from server.watershed.tiles.formats import negotiate_tile_format, transparent_tile_response
+from server.watershed.tiles.layers import TileLayer
+from server.watershed.tiles.schema_serializers import TileLutResponseSerializer
+from server.watershed.tiles.workers import render_in_pool
+from server.watershed.versioning import raster_version
+from .discovery import current_value_ranges, discover_output_maps, get_map_tile_source
 from .schema_serializers import RhessysOutputListResponseSerializer
 from .registry import get_variable, is_change_scenario
-from .tile import get_tile_png
-
-
-def _build_transparent_png(width: int = 256, height: int = 256) -> bytes:
-    """Build a minimal fully-transparent RGBA PNG with no external deps."""
-    raw_row = b"\x00" + b"\x00\x00\x00\x00" * width  # filter-byte + RGBA
-    raw = raw_row * height
-    compressed = zlib.compress(raw)
-
-    def _chunk(tag: bytes, data: bytes) -> bytes:
-        crc = zlib.crc32(tag + data) & 0xFFFFFFFF
-        return struct.pack(">I", len(data)) + tag + data + struct.pack(">I", crc)
-
-    ihdr = struct.pack(">IIBBBBB", width, height, 8, 6, 0, 0, 0)
-    return (
-        b"\x89PNG\r\n\x1a\n"
-        + _chunk(b"IHDR", ihdr)
-        + _chunk(b"IDAT", compressed)
-        + _chunk(b"IEND", b"")
-    )
-
-
-_TRANSPARENT_TILE_BYTES: bytes = _build_transparent_png()
+from .tile import get_lut, get_quantization, get_tile_png
 
 logger = logging.getLogger("watershed.rhessys_outputs")
 
@@ -77,9 +70,25 @@ class RhessysOutputListView(APIView):
     def get(self, request, runid: str):
         catalog = discover_output_maps(runid)
         if catalog is None:
-            return Response({"scenarios": [], "variables": [], "value_ranges": {}})
-
-        return Response(catalog)
+            return Response({
+                "scenarios": [], "variables": [], "value_ranges": {}, "versions": {}, "partial": False,
+            })
+
+        # Stamp tile URLs with ?v=<version> to make them cacheable for good.
+        versions = {
+            scenario["id"]: {
+                variable: raster_version(
+                    runid, TileLayer.output(runid, scenario["id"], variable).rel_path,
+                ).token
+                for variable in scenario["variables"]
+            }
+            for scenario in catalog["scenarios"]
+        }
+        return Response({
+            **catalog,
+            "value_ranges": current_value_ranges(runid, catalog),
+            "versions": versions,
+        })
 
 
 class RhessysOutputTileView(APIView):
@@ -93,6 +102,10 @@ class RhessysOutputTileView(APIView):
                 response=OpenApiTypes.BINARY,
                 description='256x256 PNG tile',
             ),
+            (200, 'image/webp'): OpenApiResponse(
+                response=OpenApiTypes.BINARY,
+                description='256x256 lossless WebP tile (Accept: image/webp, when enabled)',
+            ),
         },
     )
     def get(
@@ -109,21 +122,38 @@ class RhessysOutputTileView(APIView):
         if not var_meta:
             raise NotFound(f"Unknown RHESSys output variable: {variable}")
 
-        tif_url = get_map_download_url(runid, scenario, var_meta.filename)
+        tif_url = get_map_tile_source(runid, scenario, var_meta.filename)
         change = is_change_scenario(scenario)
 
+        layer = TileLayer.output(runid, scenario, variable)
+        fmt = negotiate_tile_format(request.headers.get("Accept", ""))
+        version = raster_version(runid, layer.rel_path)
+        not_modified = version.not_modified(request, fmt.ext)
+        if not_modified is not None:
+            patch_vary_headers(not_modified, ("Accept",))
+            return not_modified
+
+        if tile_outside_footprint(runid, layer.rel_path, z, x, y):
+            return version.apply(request, transparent_tile_response(fmt), fmt.ext)
+
+        key = layer.key(z, x, y, ext=fmt.ext)
         try:
-            png_bytes = get_tile_png(tif_url, z, x, y, is_change=change)
-        except TileOutsideBounds:
-            return HttpResponse(
-                _TRANSPARENT_TILE_BYTES, content_type="image/png"
+            tile_bytes, hit = get_tile_cache().get_or_render(
+                key, lambda: render_in_pool(
+                    get_tile_png, tif_url, z, x, y, is_change=change, img_format=fmt.driver,
+                ),
             )
+        except TileOutsideBounds:
+            return version.apply(request, transparent_tile_response(fmt), fmt.ext)
         except rasterio.errors.RasterioIOError:
             raise NotFound(
                 "RHESSys output map not found or not available for this watershed."
             )
 
-        return HttpResponse(png_bytes, content_type="image/png")
+        response = HttpResponse(tile_bytes, content_type=fmt.content_type)
+        patch_vary_headers(response, ("Accept",))
+        response["X-Tile-Cache"] = "HIT" if hit else "MISS"
+        return version.apply(request, response, fmt.ext)
 
 
 _GEOMETRY_FILES = {
@@ -141,7 +171,7 @@ _PATCH_GEOMETRY_FILES = {
 # In-memory cache: (runid, scale, geometry_revision) → reprojected GeoJSON bytes.
 # geometry_revision is None for hillslope; for patch it is "1985" or "2021" so
 # scenarios that share the same file (e.g. S2 and S4b → 2021) share one entry.
-_geometry_cache: TTLCache[tuple[str, str, str | None], bytes] = TTLCache(maxsize=20, ttl=3600)
+_geometry_cache = SharedCache("rhessys-geometry", ttl=3600)
 
 
 def _reproject_geojson(geojson: dict) -> dict:
@@ -195,6 +225,100 @@ def _reproject_geojson(geojson: dict) -> dict:
     return geojson
 
 
+class RhessysOutputDataTileView(APIView):
+    """Return the quantized raw values of a RHESSys output map tile.
+
+    Sibling of :class:`RhessysOutputTileView` for client-side colorization;
+    values are stored as uint16 steps over the map's global range (see the
+    response headers and :class:`RhessysOutputLutView`).
+    """
+
+    @extend_schema(
+        operation_id='watershed_rhessys_outputs_tiles_bin_retrieve',
+        summary='Get RHESSys output map raw-data tile',
+        responses={
+            (200, 'application/octet-stream'): OpenApiResponse(
+                response=OpenApiTypes.BINARY,
+                description='256x256 uint16 quantized values',
+            ),
+        },
+    )
+    def get(
+        self,
+        request,
+        runid: str,
+        scenario: str,
+        variable: str,
+        z: int,
+        x: int,
+        y: int,
+    ):
+        var_meta = get_variable(variable)
+        if not var_meta:
+            raise NotFound(f"Unknown RHESSys output variable: {variable}")
+
+        tif_url = get_map_tile_source(runid, scenario, var_meta.filename)
+        change = is_change_scenario(scenario)
+        layer = TileLayer.output(runid, scenario, variable)
+        version = raster_version(runid, layer.rel_path)
+        not_modified = version.not_modified(request, "bin")
+        if not_modified is not None:
+            return not_modified
+
+        try:
+            quantization = get_quantization(tif_url, change)
+            if tile_outside_footprint(runid, layer.rel_path, z, x, y):
+                return version.apply(
+                    request, data_tile_response(quantization.empty_tile(), quantization), "bin",
+                )
+            payload, hit = get_tile_cache().get_or_render(
+                layer.data_key(z, x, y, quantization),
+                lambda: render_in_pool(
+                    get_tile_data, tif_url, z, x, y, quantization, family=layer.family,
+                ),
+            )
+        except TileOutsideBounds:
+            return version.apply(
+                request, data_tile_response(quantization.empty_tile(), quantization), "bin",
+            )
+        except rasterio.errors.RasterioIOError:
+            raise NotFound(
+                "RHESSys output map not found or not available for this watershed."
+            )
+
+        response = data_tile_response(payload, quantization)
+        response["X-Tile-Cache"] = "HIT" if hit else "MISS"
+        return version.apply(request, response, "bin")
+
+
+class RhessysOutputLutView(APIView):
+    """Return the colormap LUT for a RHESSys output map's raw-data tiles."""
+
+    @extend_schema(
+        operation_id='watershed_rhessys_outputs_lut_retrieve',
+        summary='Get RHESSys output map raw-data tile LUT',
+        responses={
+            200: OpenApiResponse(
+                response=TileLutResponseSerializer,
+                description='LUT for raw-data tiles',
+            ),
+        },
+    )
+    def get(self, request, runid: str, scenario: str, variable: str):
+        var_meta = get_variable(variable)
+        if not var_meta:
+            raise NotFound(f"Unknown RHESSys output variable: {variable}")
+
+        tif_url = get_map_tile_source(runid, scenario, var_meta.filename)
+        try:
+            lut = get_lut(tif_url, is_change_scenario(scenario))
+        except rasterio.errors.RasterioIOError:
+            raise NotFound(
+                "RHESSys output map not found or not available for this watershed."
+            )
+        return Response(lut)
+
+
 class RhessysOutputGeometryView(APIView):
     """Proxy hillslope/patch GeoJSON from WEPPcloud, reprojected to WGS84.
 
@@ -247,21 +371,26 @@ class RhessysOutputGeometryView(APIView):
         base = resolve_run_base_url(runid)
         url = f"{base}/download/{geojson_path}"
 
-        try:
-            resp = requests.get(url, timeout=60)
-        except requests.RequestException as exc:
-            logger.warning("Failed to fetch geometry for runid=%s scale=%s: %s", runid, scale, exc)
-            raise NotFound("Failed to fetch geometry from WEPPcloud.")
+        def fetch() -> bytes:
+            try:
+                resp = upstream.get(url)
+            except requests.RequestException as exc:
+                logger.warning("Failed to fetch geometry for runid=%s scale=%s: %s", runid, scale, exc)
+                raise NotFound("Failed to fetch geometry from WEPPcloud.")
 
-        if resp.status_code != 200:
-            raise NotFound(
-                f"Geometry not available for this watershed (upstream returned {resp.status_code})."
-            )
+            if resp.status_code != 200:
+                raise NotFound(
+                    f"Geometry not available for this watershed (upstream returned {resp.status_code})."
+                )
+
+            geojson = resp.json()
+            reprojected = _reproject_geojson(geojson)
+            fetched = json.dumps(reprojected).encode("utf-8")
 
-        geojson = resp.json()
-        reprojected = _reproject_geojson(geojson)
-        body = json.dumps(reprojected).encode("utf-8")
+            _geometry_cache.set(cache_key, fetched)
+            return fetched
 
-        _geometry_cache[cache_key] = body
+        # Concurrent requests for the same file share one download.
+        body = single_flight(f"geometry:{url}", fetch, lookup=lambda: _geometry_cache.get(cache_key))
 
         return HttpResponse(body, content_type="application/geo+json")
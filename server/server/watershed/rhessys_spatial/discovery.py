@@ -2,8 +2,10 @@
 Discover available RHESSys spatial input GeoTIFFs for a watershed by
 probing the WEPPcloud file browser.
 
-Results are cached in memory with a TTL so the remote server is not
-hammered on every API request.
+Results are stored in the discovery catalog (see ``catalog.py``) so the
+remote server is not hammered on every API request.  The upstream revision
+of each discovered file is recorded (see ``versioning.py``) so its tiles get
+stable ETags.
 """
 
 from __future__ import annotations
@@ -13,9 +15,13 @@ import re
 from typing import Optional
 
 import requests
-from cachetools import TTLCache
 
+from server.watershed import upstream
+from server.watershed.catalog import SPATIAL_INPUTS, get_catalog
+from server.watershed.fanout import fan_out
 from server.watershed.loaders.config import resolve_run_base_url
+from server.watershed.tiles.mirror import mirrored_or_remote
+from server.watershed.versioning import record_discovered_revision
 from .registry import (
     get_display_name,
     get_meta,
@@ -24,11 +30,9 @@ from .registry import (
 
 logger = logging.getLogger("watershed.rhessys_spatial")
 
-_BROWSE_SUBPATH = "browse/rhessys/spatial_inputs_and_climates/"
-_DOWNLOAD_SUBPATH = "download/rhessys/spatial_inputs_and_climates"
-
-# filename → [metadata dicts] per runid, cached for 1 hour, up to 100 watersheds
-_discovery_cache: TTLCache[str, Optional[list[dict]]] = TTLCache(maxsize=100, ttl=3600)
+SPATIAL_INPUTS_SUBPATH = "rhessys/spatial_inputs_and_climates"
+_BROWSE_SUBPATH = f"browse/{SPATIAL_INPUTS_SUBPATH}/"
+_DOWNLOAD_SUBPATH = f"download/{SPATIAL_INPUTS_SUBPATH}"
 
 
 def get_download_url(runid: str, filename: str) -> str:
@@ -37,12 +41,21 @@ def get_download_url(runid: str, filename: str) -> str:
     return f"{base}/{_DOWNLOAD_SUBPATH}/{filename}"
 
 
+def get_tile_source(runid: str, filename: str) -> str:
+    """Return the mirrored local COG for a spatial input, or its download URL."""
+    return mirrored_or_remote(
+        runid,
+        f"{SPATIAL_INPUTS_SUBPATH}/{filename}",
+        get_download_url(runid, filename),
+    )
+
+
 def _fetch_browse_page(runid: str) -> Optional[str]:
     """Fetch the HTML directory listing from WEPPcloud, or None on failure."""
     base = resolve_run_base_url(runid)
     url = f"{base}/{_BROWSE_SUBPATH}"
     try:
-        resp = requests.get(url, timeout=15)
+        resp = upstream.get(url)
         if resp.status_code == 200:
             return resp.text
         logger.info(
@@ -97,25 +110,38 @@ def _build_file_metadata(filename: str) -> dict:
     }
 
 
-def discover_spatial_inputs(runid: str) -> Optional[list[dict]]:
-    """Discover available RHESSys spatial input GeoTIFFs for a watershed.
+def scan_spatial_inputs(runid: str, deadline: Optional[float] = None) -> tuple[Optional[list[dict]], bool]:
+    """Scrape the spatial inputs of a watershed from WEPPcloud.
 
-    Returns a list of metadata dicts, or None if the watershed has no
-    RHESSys data (browse page returned 404 / error).  Results are cached.
+    Returns ``(files, complete)``: a list of metadata dicts, or None if the
+    watershed has no RHESSys data (browse page returned 404 / error), and
+    whether every file's revision was recorded before *deadline*.
     """
-    if runid in _discovery_cache:
-        return _discovery_cache[runid]
-
     html = _fetch_browse_page(runid)
     if html is None:
-        _discovery_cache[runid] = None
-        return None
+        return None, True
 
     filenames = _parse_tif_filenames(html)
     if not filenames:
-        _discovery_cache[runid] = None
-        return None
+        return None, True
 
-    result = [_build_file_metadata(f) for f in filenames]
-    _discovery_cache[runid] = result
-    return result
+    calls = []
+    for filename in filenames:
+        rel_path = f"{SPATIAL_INPUTS_SUBPATH}/{filename}"
+        url = get_download_url(runid, filename)
+        calls.append((
+            filename,
+            url,
+            lambda rel_path=rel_path, url=url: record_discovered_revision(runid, rel_path, url),
+        ))
+    recorded = fan_out(calls, deadline=deadline)
+    return [_build_file_metadata(f) for f in filenames], recorded.complete
+
+
+def discover_spatial_inputs(runid: str) -> Optional[list[dict]]:
+    """Discover available RHESSys spatial input GeoTIFFs for a watershed.
+
+    Returns a list of metadata dicts, or None if the watershed has no
+    RHESSys data.  Served from the discovery catalog.
+    """
+    return get_catalog(SPATIAL_INPUTS, runid, scan_spatial_inputs)
@@ -9,6 +9,7 @@ class RhessysSpatialFileSerializer(serializers.Serializer):
     min = serializers.FloatField(required=False, allow_null=True)
     max = serializers.FloatField(required=False, allow_null=True)
     legend = serializers.JSONField(required=False, allow_null=True)
+    version = serializers.CharField(required=False, help_text="Data version; append ?v=<version> to tile URLs to cache them as immutable")
 
 
 class RhessysSpatialListResponseSerializer(serializers.Serializer):
@@ -2,20 +2,88 @@
 Generate PNG map tiles from RHESSys spatial input GeoTIFFs using rio-tiler.
 
 Supports three rendering modes based on the file's data type:
-  - continuous: rescale to 0-255, apply 256-entry rainbow colormap
+  - continuous: map the value range onto a 256-entry rainbow colormap
   - categorical: map raw pixel values to qualitative palette
   - stream: render value 1 as cyan, all else transparent
 """
 
 from __future__ import annotations
 
-from rio_tiler.io import Reader
+from functools import lru_cache
 
+from server.watershed.tiles.data import Quantization, categorical_lut, continuous_lut
+from server.watershed.tiles.layers import SPATIAL
+from server.watershed.tiles.raw import read_tile_array
+from server.watershed.tiles.render import (
+    CategoricalColorizer,
+    Colorizer,
+    ContinuousColorizer,
+)
 from .colormap import (
     build_continuous_colormap,
     build_categorical_colormap,
     STREAM_COLORMAP,
 )
+from .registry import SpatialInputMeta, get_render_range
+
+
+def get_render_kwargs(meta: SpatialInputMeta) -> dict:
+    """Return the :func:`get_tile_png` keyword arguments for a registered file."""
+    lo, hi = get_render_range(meta)
+    return dict(
+        data_type=meta.data_type,
+        min_val=lo,
+        max_val=hi,
+        unique_values=meta.unique_values,
+        reversed_colormap=meta.reversed_colormap,
+    )
+
+
+@lru_cache(maxsize=256)
+def get_colorizer(
+    data_type: str,
+    min_val: float,
+    max_val: float,
+    unique_values: tuple[int, ...] | None,
+    reversed_colormap: bool,
+) -> Colorizer:
+    """Return the compiled colormap for a rendering configuration (cached)."""
+    if data_type == "stream":
+        return CategoricalColorizer(STREAM_COLORMAP)
+    if data_type == "categorical" and unique_values:
+        return CategoricalColorizer(build_categorical_colormap(list(unique_values)))
+    return ContinuousColorizer(
+        build_continuous_colormap(reversed=reversed_colormap), min_val, max_val,
+    )
+
+
+def get_quantization(meta: SpatialInputMeta) -> Quantization:
+    """Return how raw-data tiles of a registered file store its values.
+
+    Continuous files are quantized over the union of the file's and its
+    group's range, so range sliders can reach past a clamped render range.
+    """
+    if meta.data_type == "stream":
+        return Quantization.for_categories(max(STREAM_COLORMAP))
+    if meta.data_type == "categorical" and meta.unique_values:
+        return Quantization.for_categories(max(meta.unique_values))
+    lo, hi = get_render_range(meta)
+    lows = [v for v in (meta.min_val, meta.group_min) if v is not None]
+    highs = [v for v in (meta.max_val, meta.group_max) if v is not None]
+    return Quantization.for_range(min(lows, default=lo), max(highs, default=hi))
+
+
+def get_lut(meta: SpatialInputMeta) -> dict:
+    """Return LUT metadata for client-side colorization of raw-data tiles."""
+    quantization = get_quantization(meta)
+    if meta.data_type == "stream":
+        return categorical_lut(STREAM_COLORMAP, quantization)
+    if meta.data_type == "categorical" and meta.unique_values:
+        return categorical_lut(build_categorical_colormap(meta.unique_values), quantization)
+    lo, hi = get_render_range(meta)
+    return continuous_lut(
+        build_continuous_colormap(reversed=meta.reversed_colormap), lo, hi, quantization,
+    )
 
 
 def get_tile_png(
@@ -29,27 +97,22 @@ def get_tile_png(
     max_val: float = 1.0,
     unique_values: list[int] | None = None,
     reversed_colormap: bool = False,
+    img_format: str = "PNG",
 ) -> bytes:
-    """Return 256x256 PNG bytes for a Web Mercator tile.
+    """Return 256x256 PNG (or *img_format*) bytes for a Web Mercator tile.
 
-    For continuous data, rio-tiler's ``rescale()`` maps the value range
-    [min_val, max_val] → [0, 255].  The alpha mask from the source
-    raster handles nodata transparency automatically during ``render()``.
+    For continuous data the value range [min_val, max_val] is mapped onto
+    the 256-entry colormap by the compiled lookup table; nodata pixels
+    (the source raster's mask) are rendered transparent.  Categorical and
+    stream PNGs are written as 8-bit paletted images.
     """
-    with Reader(tif_url) as src:
-        img = src.tile(tile_x, tile_y, tile_z, tilesize=256)
-
-    if data_type == "stream":
-        return img.render(colormap=STREAM_COLORMAP)
-
-    if data_type == "categorical" and unique_values:
-        cm = build_categorical_colormap(unique_values)
-        return img.render(colormap=cm)
+    data = read_tile_array(tif_url, tile_z, tile_x, tile_y, family=SPATIAL)
 
-    # Continuous: rescale raw values to 0-255, let mask handle nodata
-    rescaled = img.rescale(
-        in_range=((min_val, max_val),),
-        out_range=((0, 255),),
+    colorizer = get_colorizer(
+        data_type,
+        min_val,
+        max_val,
+        tuple(unique_values) if unique_values else None,
+        reversed_colormap,
     )
-    cm = build_continuous_colormap(reversed=reversed_colormap)
-    return rescaled.render(colormap=cm)
+    return colorizer.render(data, img_format=img_format)
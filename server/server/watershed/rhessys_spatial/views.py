@@ -1,18 +1,25 @@
 """
 API views for RHESSys spatial input raster data.
 
-Two endpoints:
+Endpoints:
   GET /api/watershed/<runid>/rhessys/spatial-inputs/
       → list of available GeoTIFFs with metadata (discovery + registry)
 
   GET /api/watershed/<runid>/rhessys/spatial-inputs/<filename>/tiles/<z>/<x>/<y>.png
       → 256×256 PNG tile with colormap applied
+
+  GET /api/watershed/<runid>/rhessys/spatial-inputs/<filename>/tiles/<z>/<x>/<y>.bin
+      → 256×256 quantized raw values for client-side colorization
+
+  GET /api/watershed/<runid>/rhessys/spatial-inputs/<filename>/lut
+      → colormap LUT for the raw-data tiles
 """
 
 from __future__ import annotations
 
 import rasterio.errors
 from django.http import HttpResponse
+from django.utils.cache import patch_vary_headers
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework.exceptions import NotFound
@@ -20,10 +27,18 @@ from drf_spectacular.utils import extend_schema, OpenApiResponse
 from drf_spectacular.types import OpenApiTypes
 from rio_tiler.errors import TileOutsideBounds
 
-from .discovery import discover_spatial_inputs, get_download_url
+from server.watershed.tiles.cache import get_tile_cache
+from server.watershed.tiles.data import data_tile_response, get_tile_data
+from server.watershed.tiles.footprint import tile_outside_footprint
+from server.watershed.tiles.formats import negotiate_tile_format, transparent_tile_response
+from server.watershed.tiles.layers import TileLayer
+from server.watershed.tiles.schema_serializers import TileLutResponseSerializer
+from server.watershed.tiles.workers import render_in_pool
+from server.watershed.versioning import raster_version
+from .discovery import discover_spatial_inputs, get_tile_source
 from .schema_serializers import RhessysSpatialListResponseSerializer
-from .registry import get_meta, get_render_range
-from .tile import get_tile_png
+from .registry import get_meta
+from .tile import get_lut, get_quantization, get_render_kwargs, get_tile_png
 from .colormap import (
     get_continuous_legend_stops,
     get_categorical_legend,
@@ -51,6 +66,8 @@ class RhessysSpatialListView(APIView):
             return Response({"files": []})
 
         for f in files:
+            # Stamp tile URLs with ?v=<version> to make them cacheable for good.
+            f["version"] = raster_version(runid, TileLayer.spatial(runid, f["filename"]).rel_path).token
             if f["type"] == "categorical" and f.get("unique_values"):
                 f["legend"] = get_categorical_legend(f["unique_values"])
             elif f["type"] == "stream":
@@ -80,33 +97,120 @@ class RhessysSpatialTileView(APIView):
         summary='Get RHESSys spatial input tile PNG',
         responses={
             (200, 'image/png'): OpenApiResponse(response=OpenApiTypes.BINARY, description='256x256 PNG tile'),
+            (200, 'image/webp'): OpenApiResponse(response=OpenApiTypes.BINARY, description='256x256 lossless WebP tile (Accept: image/webp, when enabled)'),
         },
     )
     def get(self, request, runid: str, filename: str, z: int, x: int, y: int):
-        tif_url = get_download_url(runid, filename)
+        tif_url = get_tile_source(runid, filename)
+
+        meta = get_meta(filename)
+        if not meta:
+            raise NotFound(
+                "RHESSys spatial input is not registered in the legend registry."
+            )
+
+        kwargs = get_render_kwargs(meta)
+
+        layer = TileLayer.spatial(runid, filename)
+        fmt = negotiate_tile_format(request.headers.get("Accept", ""))
+        version = raster_version(runid, layer.rel_path)
+        not_modified = version.not_modified(request, fmt.ext)
+        if not_modified is not None:
+            patch_vary_headers(not_modified, ("Accept",))
+            return not_modified
+
+        if tile_outside_footprint(runid, layer.rel_path, z, x, y):
+            return version.apply(request, transparent_tile_response(fmt), fmt.ext)
+
+        key = layer.key(z, x, y, ext=fmt.ext)
+        try:
+            tile_bytes, hit = get_tile_cache().get_or_render(
+                key, lambda: render_in_pool(get_tile_png, tif_url, z, x, y, img_format=fmt.driver, **kwargs),
+            )
+        except TileOutsideBounds:
+            return version.apply(request, transparent_tile_response(fmt), fmt.ext)
+        except rasterio.errors.RasterioIOError:
+            raise NotFound(
+                "RHESSys spatial input not found or not available for this watershed."
+            )
+
+        response = HttpResponse(tile_bytes, content_type=fmt.content_type)
+        patch_vary_headers(response, ("Accept",))
+        response["X-Tile-Cache"] = "HIT" if hit else "MISS"
+        return version.apply(request, response, fmt.ext)
+
+
+class RhessysSpatialDataTileView(APIView):
+    """Return the quantized raw values of a RHESSys spatial input tile.
+
+    Sibling of :class:`RhessysSpatialTileView` for client-side colorization;
+    the value encoding is described by the response headers and by
+    :class:`RhessysSpatialLutView`.
+    """
 
+    @extend_schema(
+        operation_id='watershed_rhessys_spatial_inputs_tiles_bin_retrieve',
+        summary='Get RHESSys spatial input raw-data tile',
+        responses={
+            (200, 'application/octet-stream'): OpenApiResponse(response=OpenApiTypes.BINARY, description='256x256 quantized raw values'),
+        },
+    )
+    def get(self, request, runid: str, filename: str, z: int, x: int, y: int):
         meta = get_meta(filename)
         if not meta:
             raise NotFound(
                 "RHESSys spatial input is not registered in the legend registry."
             )
 
-        lo, hi = get_render_range(meta)
-        kwargs = dict(
-            data_type=meta.data_type,
-            min_val=lo,
-            max_val=hi,
-            unique_values=meta.unique_values,
-            reversed_colormap=meta.reversed_colormap,
-        )
+        tif_url = get_tile_source(runid, filename)
+        quantization = get_quantization(meta)
+
+        layer = TileLayer.spatial(runid, filename)
+        version = raster_version(runid, layer.rel_path)
+        not_modified = version.not_modified(request, "bin")
+        if not_modified is not None:
+            return not_modified
+
+        if tile_outside_footprint(runid, layer.rel_path, z, x, y):
+            return version.apply(
+                request, data_tile_response(quantization.empty_tile(), quantization), "bin",
+            )
 
         try:
-            png_bytes = get_tile_png(tif_url, z, x, y, **kwargs)
+            payload, hit = get_tile_cache().get_or_render(
+                layer.data_key(z, x, y, quantization),
+                lambda: render_in_pool(
+                    get_tile_data, tif_url, z, x, y, quantization, family=layer.family,
+                ),
+            )
         except TileOutsideBounds:
-            raise NotFound("Tile is outside the bounds of this raster.")
+            return version.apply(
+                request, data_tile_response(quantization.empty_tile(), quantization), "bin",
+            )
         except rasterio.errors.RasterioIOError:
             raise NotFound(
                 "RHESSys spatial input not found or not available for this watershed."
             )
 
-        return HttpResponse(png_bytes, content_type="image/png")
+        response = data_tile_response(payload, quantization)
+        response["X-Tile-Cache"] = "HIT" if hit else "MISS"
+        return version.apply(request, response, "bin")
+
+
+class RhessysSpatialLutView(APIView):
+    """Return the colormap LUT for a RHESSys spatial input's raw-data tiles."""
+
+    @extend_schema(
+        operation_id='watershed_rhessys_spatial_inputs_lut_retrieve',
+        summary='Get RHESSys spatial input raw-data tile LUT',
+        responses={
+            200: OpenApiResponse(response=TileLutResponseSerializer, description='LUT for raw-data tiles'),
+        },
+    )
+    def get(self, request, runid: str, filename: str):
+        meta = get_meta(filename)
+        if not meta:
+            raise NotFound(
+                "RHESSys spatial input is not registered in the legend registry."
+            )
+        return Response(get_lut(meta))
@@ -1,5 +1,7 @@
 from rest_framework import serializers
 
+from server.watershed.tiles.schema_serializers import TileLutResponseSerializer
+
 
 class SbsColormapEntrySerializer(serializers.Serializer):
     value = serializers.IntegerField()
@@ -10,3 +12,7 @@ class SbsColormapEntrySerializer(serializers.Serializer):
 class SbsColormapResponseSerializer(serializers.Serializer):
     mode = serializers.CharField()
     entries = SbsColormapEntrySerializer(many=True)
+
+
+class SbsLutResponseSerializer(TileLutResponseSerializer):
+    mode = serializers.CharField()
@@ -25,6 +25,9 @@ from server.watershed.sbs_raster.color_map import (
     get_colormap_metadata,
     get_render_colormap,
 )
+from server.watershed.tiles.config import TileConfig
+from server.watershed.tiles.formats import TRANSPARENT_PNG
+from server.watershed.versioning import clear_version_caches
 
 
 # ---------------------------------------------------------------------------
@@ -470,15 +473,68 @@ class SbsRasterTileViewTests(APITestCase):
 
     @patch(_RESOLVE_PATCH_TARGET, side_effect=_mock_resolve())
     @patch(_TILE_PATCH_TARGET, side_effect=TileOutsideBounds)
-    def test_tile_outside_bounds_returns_404(self, mock_tile, mock_resolve):
+    def test_tile_outside_bounds_returns_transparent_tile(self, mock_tile, mock_resolve):
         """
         When the requested tile lies outside the raster extent the view should
-        return 404.  The view catches TileOutsideBoundsError (aliased from
-        rio_tiler.errors.TileOutsideBounds) and raises DRF NotFound.
+        answer like a footprint miss: 200 with the shared transparent tile.
         """
         url = self._url(self.watershed.runid)
         response = self.client.get(url)
-        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.content, TRANSPARENT_PNG)
+
+    # -- Tile outside the recorded raster footprint --------------------------
+
+    @patch('server.watershed.sbs_raster.views.tile_outside_footprint', return_value=True)
+    @patch(_RESOLVE_PATCH_TARGET, side_effect=_mock_resolve())
+    @patch(_TILE_PATCH_TARGET, return_value=_MINIMAL_PNG)
+    def test_tile_outside_footprint_returns_transparent_tile(self, mock_tile, mock_resolve, mock_fp):
+        """
+        Tiles that miss the indexed footprint are answered with the shared
+        transparent tile without opening the GeoTIFF.
+        """
+        url = self._url(self.watershed.runid)
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.content, TRANSPARENT_PNG)
+        self.assertIn('Accept', response['Vary'])
+        mock_tile.assert_not_called()
+
+    @patch('server.watershed.tiles.formats.get_tile_config', return_value=TileConfig(webp_enabled=True))
+    @patch('server.watershed.sbs_raster.views.tile_outside_footprint', return_value=True)
+    @patch(_RESOLVE_PATCH_TARGET, side_effect=_mock_resolve())
+    @patch(_TILE_PATCH_TARGET, return_value=_MINIMAL_PNG)
+    def test_empty_tile_follows_negotiated_format(self, mock_tile, mock_resolve, mock_fp, mock_config):
+        url = self._url(self.watershed.runid)
+        png = self.client.get(url, HTTP_ACCEPT='image/png')
+        webp = self.client.get(url, HTTP_ACCEPT='image/webp,*/*;q=0.8')
+
+        self.assertEqual((png['Content-Type'], png.content), ('image/png', TRANSPARENT_PNG))
+        self.assertEqual(webp['Content-Type'], 'image/webp')
+        self.assertEqual(webp.content[8:12], b'WEBP')
+        self.assertNotEqual(png['ETag'], webp['ETag'])
+        self.assertIn('Accept', png['Vary'])
+        self.assertIn('Accept', webp['Vary'])
+
+    # -- Output format negotiation -----------------------------------------
+
+    @patch('server.watershed.tiles.formats.get_tile_config', return_value=TileConfig(webp_enabled=True))
+    @patch(_RESOLVE_PATCH_TARGET, side_effect=_mock_resolve())
+    @patch(_TILE_PATCH_TARGET, return_value=b'RIFF-webp')
+    def test_webp_served_when_accepted(self, mock_tile, mock_resolve, mock_config):
+        url = self._url(self.watershed.runid)
+        response = self.client.get(url, HTTP_ACCEPT='image/webp,image/*,*/*;q=0.8')
+        self.assertEqual(response['Content-Type'], 'image/webp')
+        self.assertIn('Accept', response['Vary'])
+        self.assertEqual(mock_tile.call_args.kwargs['img_format'], 'WEBP')
+
+    @patch(_RESOLVE_PATCH_TARGET, side_effect=_mock_resolve())
+    @patch(_TILE_PATCH_TARGET, return_value=_MINIMAL_PNG)
+    def test_webp_not_served_unless_enabled(self, mock_tile, mock_resolve):
+        url = self._url(self.watershed.runid)
+        response = self.client.get(url, HTTP_ACCEPT='image/webp,*/*')
+        self.assertEqual(response['Content-Type'], 'image/png')
+        self.assertEqual(mock_tile.call_args.kwargs['img_format'], 'PNG')
 
     # -- Rasterio HTTP 404 (TIF not found on remote) ------------------------
 
@@ -493,3 +549,61 @@ class SbsRasterTileViewTests(APITestCase):
         url = self._url(self.watershed.runid)
         response = self.client.get(url)
         self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    # -- Conditional requests -----------------------------------------------
+
+    @patch(_RESOLVE_PATCH_TARGET, side_effect=_mock_resolve())
+    @patch(_TILE_PATCH_TARGET, return_value=_MINIMAL_PNG)
+    def test_matching_etag_returns_304_without_rendering(self, mock_tile, mock_resolve):
+        clear_version_caches()
+        url = self._url(self.watershed.runid)
+        etag = self.client.get(url)['ETag']
+
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(response['ETag'], etag)
+        self.assertEqual(mock_tile.call_count, 1)
+
+    @patch(_RESOLVE_PATCH_TARGET, side_effect=_mock_resolve())
+    @patch(_TILE_PATCH_TARGET, return_value=_MINIMAL_PNG)
+    def test_version_stamped_tile_is_immutable(self, mock_tile, mock_resolve):
+        clear_version_caches()
+        url = self._url(self.watershed.runid)
+        version = self.client.get(url)['X-Data-Version']
+
+        response = self.client.get(self._url(self.watershed.runid, v=version))
+
+        self.assertIn('immutable', response['Cache-Control'])
+
+
+# ---------------------------------------------------------------------------
+# Raw-data tiles and LUT: .../sbs/tiles/<z>/<x>/<y>.bin, /sbs/lut
+# ---------------------------------------------------------------------------
+
+class SbsRasterDataTileViewTests(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.watershed = _create_watershed('test-run-123')
+
+    @patch(_RESOLVE_PATCH_TARGET, side_effect=_mock_resolve())
+    @patch('server.watershed.sbs_raster.views.get_tile_data', return_value=b'\x00' * 65536)
+    def test_returns_raw_class_codes_with_headers(self, mock_data, mock_resolve):
+        url = reverse('sbs-data-tile', args=[self.watershed.runid, 10, 160, 387])
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response['Content-Type'], 'application/octet-stream')
+        self.assertEqual(response['X-Tile-Dtype'], 'uint8')
+        self.assertEqual(response['X-Tile-Nodata'], '255')
+        self.assertEqual(len(response.content), 65536)
+
+    def test_lut_matches_render_colormap(self):
+        response = self.client.get(reverse('sbs-lut'), {'mode': 'shift'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['mode'], 'shift')
+        self.assertEqual(response.data['type'], 'categorical')
+        expected = {
+            str(value): '#{:02X}{:02X}{:02X}{:02X}'.format(*rgba)
+            for value, rgba in get_render_colormap(ColorMode.SHIFT).items()
+        }
+        self.assertEqual(response.data['colors'], expected)
@@ -1,10 +1,29 @@
 """
-Generate PNG map tiles from SBS GeoTIFF using rio-tiler.
+Generate PNG/WebP map tiles from SBS GeoTIFF using rio-tiler.
 """
 
-from rio_tiler.io import Reader
+from functools import lru_cache
+
+from server.watershed.tiles.data import Quantization, categorical_lut
+from server.watershed.tiles.layers import SBS
+from server.watershed.tiles.raw import read_tile_array
+from server.watershed.tiles.render import CategoricalColorizer
 from .color_map import ColorMode, get_render_colormap
 
+# Raw SBS pixels are class codes 0–3; raw-data tiles store them as is.
+SBS_QUANTIZATION = Quantization.for_categories(max(get_render_colormap(ColorMode.LEGACY)))
+
+
+@lru_cache(maxsize=None)
+def get_colorizer(mode: ColorMode = ColorMode.LEGACY) -> CategoricalColorizer:
+    """Return the compiled render colormap for *mode*."""
+    return CategoricalColorizer(get_render_colormap(mode))
+
+
+def get_lut(mode: ColorMode = ColorMode.LEGACY) -> dict:
+    """Return LUT metadata for client-side colorization of raw-data tiles."""
+    return categorical_lut(get_render_colormap(mode), SBS_QUANTIZATION)
+
 
 def get_tile_png(
     tif_url: str,
@@ -12,17 +31,18 @@ def get_tile_png(
     tile_x: int,
     tile_y: int,
     mode: ColorMode = ColorMode.LEGACY,
+    img_format: str = "PNG",
 ) -> bytes:
     """
-    Return PNG bytes for the given Web Mercator tile (z, x, y).
+    Return encoded bytes (paletted PNG by default) for the given Web Mercator
+    tile (z, x, y).
 
-    Uses get_render_colormap() (0-based pixel keys) so the colormap indices
+    Uses get_render_colormap() (0-based pixel keys), compiled once into a
+    lookup table by get_colorizer(), so the colormap indices
     match the raw pixel values stored in the SBS GeoTIFF (0–3).  The legend
     API continues to use the canonical 130-133 class codes.
     """
-    colormap = get_render_colormap(mode)
-    with Reader(tif_url) as src:
-        img = src.tile(tile_x, tile_y, tile_z, tilesize=256)
-    return img.render(colormap=colormap)
+    data = read_tile_array(tif_url, tile_z, tile_x, tile_y, family=SBS)
+    return get_colorizer(mode).render(data, img_format=img_format)
 
 
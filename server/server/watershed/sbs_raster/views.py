@@ -1,6 +1,7 @@
 import rasterio.errors
 
 from django.http import HttpResponse
+from django.utils.cache import patch_vary_headers
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework.exceptions import NotFound
@@ -9,9 +10,17 @@ from drf_spectacular.types import OpenApiTypes
 from rio_tiler.errors import TileOutsideBounds
 
 from server.watershed.sbs_raster.color_map import ColorMode, get_colormap_metadata
-from server.watershed.sbs_raster.schema_serializers import SbsColormapResponseSerializer
-from server.watershed.sbs_raster.tile import get_tile_png
+from server.watershed.sbs_raster.schema_serializers import SbsColormapResponseSerializer, SbsLutResponseSerializer
+from server.watershed.sbs_raster.tile import SBS_QUANTIZATION, get_lut, get_tile_png
 from server.watershed.loaders.config import resolve_run_base_url
+from server.watershed.tiles.cache import get_tile_cache
+from server.watershed.tiles.data import data_tile_response, get_tile_data
+from server.watershed.tiles.footprint import tile_outside_footprint
+from server.watershed.tiles.formats import negotiate_tile_format, transparent_tile_response
+from server.watershed.tiles.layers import TileLayer
+from server.watershed.tiles.mirror import SBS_REL_PATH, mirrored_or_remote
+from server.watershed.tiles.workers import render_in_pool
+from server.watershed.versioning import raster_version
 
 
 class SbsColormapView(APIView):
@@ -55,6 +64,44 @@ class SbsColormapView(APIView):
         })
 
 
+class SbsLutView(APIView):
+    """
+    Returns the render LUT for SBS raw-data tiles in the requested color mode.
+
+    Maps each raw class code stored in ``.bin`` tiles to the ``#RRGGBBAA``
+    colour the PNG tiles use, so the client can switch color modes without
+    refetching tiles.
+
+    Query params:
+        mode (str): "legacy" (default) or "shift" (Okabe-Ito colorblind-safe).
+    """
+
+    @extend_schema(
+        operation_id='watershed_sbs_lut_retrieve',
+        summary='Get SBS raw-data tile LUT',
+        parameters=[
+            OpenApiParameter(
+                name='mode',
+                description='Color mode: "legacy" or "shift" (Okabe-Ito)',
+                required=False,
+                type=str,
+                enum=[m.value for m in ColorMode],
+            ),
+        ],
+        responses={
+            200: OpenApiResponse(response=SbsLutResponseSerializer, description='LUT for SBS raw-data tiles'),
+        },
+    )
+    def get(self, request):
+        raw_mode = request.query_params.get('mode', ColorMode.LEGACY.value)
+        try:
+            mode = ColorMode(raw_mode)
+        except ValueError:
+            mode = ColorMode.LEGACY
+
+        return Response({'mode': mode.value, **get_lut(mode)})
+
+
 class SbsRasterTileView(APIView):
     """
     Returns a 256×256 PNG map tile for the SBS raster at Web Mercator tile
@@ -85,6 +132,7 @@ class SbsRasterTileView(APIView):
         ],
         responses={
             (200, 'image/png'): OpenApiResponse(response=OpenApiTypes.BINARY, description='256x256 PNG tile'),
+            (200, 'image/webp'): OpenApiResponse(response=OpenApiTypes.BINARY, description='256x256 lossless WebP tile (Accept: image/webp, when enabled)'),
         },
     )
     def get(self, request, runid: str, z: int, x: int, y: int):
@@ -95,13 +143,86 @@ class SbsRasterTileView(APIView):
             mode = ColorMode.LEGACY
 
         run_base = resolve_run_base_url(runid)
-        tif_url = f"{run_base}/download/disturbed/sbs_4class.tif"
+        tif_url = mirrored_or_remote(
+            runid, SBS_REL_PATH, f"{run_base}/download/{SBS_REL_PATH}",
+        )
+
+        layer = TileLayer.sbs(runid, mode)
+        fmt = negotiate_tile_format(request.headers.get('Accept', ''))
+        version = raster_version(runid, layer.rel_path)
+        not_modified = version.not_modified(request, fmt.ext)
+        if not_modified is not None:
+            patch_vary_headers(not_modified, ('Accept',))
+            return not_modified
+
+        if tile_outside_footprint(runid, layer.rel_path, z, x, y):
+            return version.apply(request, transparent_tile_response(fmt), fmt.ext)
+
+        key = layer.key(z, x, y, ext=fmt.ext)
+        try:
+            tile_bytes, hit = get_tile_cache().get_or_render(
+                key, lambda: render_in_pool(get_tile_png, tif_url, z, x, y, mode, img_format=fmt.driver),
+            )
+        except TileOutsideBounds:
+            # Same answer as a footprint miss, whichever check catches it.
+            return version.apply(request, transparent_tile_response(fmt), fmt.ext)
+        except rasterio.errors.RasterioIOError:
+            raise NotFound("SBS raster data not found or not available for this watershed.")
+
+        response = HttpResponse(tile_bytes, content_type=fmt.content_type)
+        patch_vary_headers(response, ('Accept',))
+        response['X-Tile-Cache'] = 'HIT' if hit else 'MISS'
+        return version.apply(request, response, fmt.ext)
+
+
+class SbsRasterDataTileView(APIView):
+    """
+    Returns the raw SBS class codes of a 256×256 tile for client-side
+    colorization (see ``tiles/data.py`` for the format).
+
+    URL params:
+        runid: Watershed run identifier.
+        z, x, y: Web Mercator tile coordinates.
+    """
+
+    @extend_schema(
+        operation_id='watershed_sbs_tiles_bin_retrieve',
+        summary='Get SBS raster raw-data tile',
+        responses={
+            (200, 'application/octet-stream'): OpenApiResponse(response=OpenApiTypes.BINARY, description='256x256 uint8 class codes'),
+        },
+    )
+    def get(self, request, runid: str, z: int, x: int, y: int):
+        run_base = resolve_run_base_url(runid)
+        tif_url = mirrored_or_remote(
+            runid, SBS_REL_PATH, f"{run_base}/download/{SBS_REL_PATH}",
+        )
+
+        layer = TileLayer.sbs(runid, ColorMode.LEGACY)
+        version = raster_version(runid, layer.rel_path)
+        not_modified = version.not_modified(request, 'bin')
+        if not_modified is not None:
+            return not_modified
+
+        if tile_outside_footprint(runid, layer.rel_path, z, x, y):
+            return version.apply(
+                request, data_tile_response(SBS_QUANTIZATION.empty_tile(), SBS_QUANTIZATION), 'bin',
+            )
 
         try:
-            png_bytes = get_tile_png(tif_url, z, x, y, mode)
+            payload, hit = get_tile_cache().get_or_render(
+                layer.data_key(z, x, y, SBS_QUANTIZATION),
+                lambda: render_in_pool(
+                    get_tile_data, tif_url, z, x, y, SBS_QUANTIZATION, family=layer.family,
+                ),
+            )
         except TileOutsideBounds:
-            raise NotFound("Tile is outside the bounds of this raster.")
+            return version.apply(
+                request, data_tile_response(SBS_QUANTIZATION.empty_tile(), SBS_QUANTIZATION), 'bin',
+            )
         except rasterio.errors.RasterioIOError:
             raise NotFound("SBS raster data not found or not available for this watershed.")
 
-        return HttpResponse(png_bytes, content_type='image/png')
+        response = data_tile_response(payload, SBS_QUANTIZATION)
+        response['X-Tile-Cache'] = 'HIT' if hit else 'MISS'
+        return version.apply(request, response, 'bin')
@@ -1,6 +1,19 @@
 from rest_framework import serializers
 
 
+class FeatureCollectionLinkSerializer(serializers.Serializer):
+    rel = serializers.CharField()
+    type = serializers.CharField()
+    href = serializers.URLField()
+
+
+class PagedFeatureCollectionSerializer(serializers.Serializer):
+    """Members present when the collection was requested with ``limit``."""
+    numberMatched = serializers.IntegerField(required=False)
+    numberReturned = serializers.IntegerField(required=False)
+    links = FeatureCollectionLinkSerializer(many=True, required=False)
+
+
 class WatershedPropertiesSerializer(serializers.Serializer):
     pws_name = serializers.CharField(allow_null=True, required=False)
     county_nam = serializers.CharField(allow_null=True, required=False)
@@ -21,7 +34,7 @@ class WatershedFeatureSerializer(serializers.Serializer):
     geometry = serializers.JSONField(allow_null=True)
 
 
-class WatershedFeatureCollectionSerializer(serializers.Serializer):
+class WatershedFeatureCollectionSerializer(PagedFeatureCollectionSerializer):
     type = serializers.ChoiceField(choices=["FeatureCollection"])
     features = WatershedFeatureSerializer(many=True)
 
@@ -44,7 +57,7 @@ class SubcatchmentFeatureSerializer(serializers.Serializer):
     geometry = serializers.JSONField(allow_null=True)
 
 
-class SubcatchmentFeatureCollectionSerializer(serializers.Serializer):
+class SubcatchmentFeatureCollectionSerializer(PagedFeatureCollectionSerializer):
     type = serializers.ChoiceField(choices=["FeatureCollection"])
     features = SubcatchmentFeatureSerializer(many=True)
 
@@ -62,7 +75,7 @@ class ChannelFeatureSerializer(serializers.Serializer):
     geometry = serializers.JSONField(allow_null=True)
 
 
-class ChannelFeatureCollectionSerializer(serializers.Serializer):
+class ChannelFeatureCollectionSerializer(PagedFeatureCollectionSerializer):
     type = serializers.ChoiceField(choices=["FeatureCollection"])
     features = ChannelFeatureSerializer(many=True)
 
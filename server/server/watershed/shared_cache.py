@@ -0,0 +1,171 @@
+"""
+Cache shared by all gunicorn workers of a host.
+
+Discovery revisions, raster statistics, footprints and geometry used to live
+in a ``cachetools.TTLCache`` per worker, so each of the 8 workers warmed its
+own copy and lost it whenever it was recycled.  They now use the ``shared``
+Django cache (see ``CACHES`` in ``settings.py``), backed by
+:class:`SizedFileBasedCache`: Django's file-based cache with a byte budget
+instead of an entry count.  It needs no external service, is visible to
+every worker and survives worker (and, on the data volume, container)
+restarts.
+
+:class:`SharedCache` is a namespaced view of it with a default TTL::
+
+    _stats_cache = SharedCache("stats", ttl=300)
+    _stats_cache.set(key, value)
+    _stats_cache.get(key)
+    _stats_cache.clear()   # invalidates the namespace for every worker
+
+Keys may be any value with a stable ``repr`` (tuples of strings and ints);
+values must be picklable.  Namespace invalidation bumps a version stored in
+the cache, which orphans every entry of the old version; they expire or are
+evicted like any other entry.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import logging
+import os
+import threading
+import time
+from typing import Any, Hashable, Optional
+
+from django.core.cache import caches
+from django.core.cache.backends.base import DEFAULT_TIMEOUT
+from django.core.cache.backends.filebased import FileBasedCache
+
+logger = logging.getLogger("watershed.shared_cache")
+
+SHARED_CACHE_ALIAS = "shared"
+
+_MISSING = object()
+
+
+class SizedFileBasedCache(FileBasedCache):
+    """
+    File-based cache bounded by total size rather than entry count.
+
+    ``OPTIONS``:
+        MAX_BYTES: Size budget (default 256 MiB)
+        LOW_WATER: Fraction of the budget eviction shrinks the cache to
+            (default 0.9)
+
+    Reads bump the entry's mtime, and eviction removes the least recently
+    used entries first, like the tile cache (``tiles/cache.py``).  The total
+    size is tracked per process and re-scanned after every eviction, so
+    concurrent workers stay approximately in agreement.
+    """
+
+    def __init__(self, dir, params):
+        options = dict(params.get("OPTIONS", {}))
+        self.max_bytes = int(options.pop("MAX_BYTES", 256 * 1024 * 1024))
+        self.low_water = float(options.pop("LOW_WATER", 0.9))
+        super().__init__(dir, {**params, "OPTIONS": options})
+        self._size_lock = threading.Lock()
+        self._approx_bytes: Optional[int] = None
+
+    def get(self, key, default=None, version=None):
+        value = super().get(key, _MISSING, version)
+        if value is _MISSING:
+            return default
+        try:
+            os.utime(self._key_to_file(key, version))
+        except OSError:
+            pass
+        return value
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        super().set(key, value, timeout, version)
+        try:
+            size = os.path.getsize(self._key_to_file(key, version))
+        except OSError:
+            return
+        with self._size_lock:
+            if self._approx_bytes is None:
+                self._approx_bytes = self.size()
+            else:
+                self._approx_bytes += size
+            over_budget = self._approx_bytes > self.max_bytes
+        if over_budget:
+            self.evict()
+
+    def _cull(self):
+        # Replaced by size-based eviction in set(); the stock implementation
+        # lists the whole directory on every write.
+        pass
+
+    def _entries(self):
+        for path in self._list_cache_files():
+            try:
+                st = os.stat(path)
+            except FileNotFoundError:
+                continue
+            yield path, st.st_size, st.st_mtime
+
+    def size(self) -> int:
+        """Return the total size of the cache files in bytes."""
+        return sum(size for _path, size, _mtime in self._entries())
+
+    def evict(self) -> int:
+        """Remove least recently used entries until under the low-water mark."""
+        entries = sorted(self._entries(), key=lambda e: e[2])
+        total = sum(size for _path, size, _mtime in entries)
+        target = int(self.max_bytes * self.low_water)
+
+        removed = 0
+        for path, size, _mtime in entries:
+            if total <= target:
+                break
+            if self._delete(path):
+                removed += 1
+            total -= size
+
+        with self._size_lock:
+            self._approx_bytes = total
+        if removed:
+            logger.info("Shared cache evicted %d entries (%d bytes remain)", removed, total)
+        return removed
+
+    def clear(self):
+        super().clear()
+        with self._size_lock:
+            self._approx_bytes = 0
+
+
+class SharedCache:
+    """A namespace of the shared cache with a default TTL in seconds."""
+
+    def __init__(self, namespace: str, ttl: Optional[int]):
+        self.namespace = namespace
+        self.ttl = ttl
+
+    @property
+    def _backend(self):
+        return caches[SHARED_CACHE_ALIAS]
+
+    def _namespace_version(self) -> int:
+        return self._backend.get(f"ns:{self.namespace}", 0)
+
+    def _key(self, key: Hashable) -> str:
+        digest = hashlib.sha1(repr(key).encode()).hexdigest()
+        return f"{self.namespace}:{self._namespace_version()}:{digest}"
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """Return the cached value of *key* (which may be None), or *default*."""
+        return self._backend.get(self._key(key), default)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return self.get(key, _MISSING) is not _MISSING
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[int] = None) -> None:
+        """Store *value* for the namespace TTL, or *ttl* seconds."""
+        self._backend.set(self._key(key), value, self.ttl if ttl is None else ttl)
+
+    def delete(self, key: Hashable) -> None:
+        self._backend.delete(self._key(key))
+
+    def clear(self) -> None:
+        """Invalidate every entry of the namespace, for all workers."""
+        self._backend.set(f"ns:{self.namespace}", time.time_ns(), None)
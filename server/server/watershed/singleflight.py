@@ -0,0 +1,215 @@
+"""
+Single-flight coalescing of expensive cache fills.
+
+When a popular cache entry is missing, every concurrent request would
+otherwise download or compute the same value.  :func:`single_flight` lets
+exactly one caller compute it:
+
+  - within a process, concurrent callers with the same key wait for the
+    first one and receive its result (or its exception);
+  - across gunicorn workers, the computing caller holds an exclusive file
+    lock for the key.  Callers in other workers wait for the lock and then
+    check the shared store (tile cache on disk, statistics or catalog table)
+    through *lookup* before computing anything themselves.
+
+Lock files live in ``SINGLEFLIGHT_LOCK_DIR`` (default
+``<tmp>/watershed-locks``, which must be shared by all workers of a host)
+and are striped: keys hash into ``_LOCK_STRIPES`` files, so the directory
+stays small and unrelated keys rarely share a lock.  A thread holds at most
+one such lock; fills nested inside another fill (a tile render needing
+raster statistics) only coalesce within the process, which rules out
+lock-order deadlocks between workers.  That includes fills in a render
+process (``tiles/workers.py``): it runs on behalf of a request thread that
+holds the tile's lock, so it calls :func:`mark_nested` on start-up instead
+of taking stripes of its own, which could otherwise collide with the
+caller's stripe and block until the timeout.
+
+Waiting is bounded by ``SINGLEFLIGHT_TIMEOUT`` seconds (default 120); a
+caller that waited longer computes the value itself.  Without ``fcntl``
+(e.g. on Windows) only in-process coalescing is done.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import logging
+import os
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable, Iterator, Optional, TypeVar
+
+from server.watershed.loaders.config import _get_env_int, _get_env_str
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - non-POSIX development machines
+    fcntl = None
+
+logger = logging.getLogger("watershed.singleflight")
+
+T = TypeVar("T")
+
+_LOCK_STRIPES = 4096
+
+# Poll interval while waiting for another worker's file lock.
+_POLL_SECONDS = 0.05
+
+
+@dataclass
+class SingleFlightConfig:
+    """
+    Configuration for single-flight coalescing.
+
+    Attributes:
+        lock_dir: Directory of the cross-worker lock files
+        timeout: Seconds to wait for another caller before computing anyway
+    """
+    lock_dir: Path = Path(tempfile.gettempdir()) / "watershed-locks"
+    timeout: int = 120
+
+    @classmethod
+    def from_environment(cls) -> "SingleFlightConfig":
+        """Create config from environment variables."""
+        lock_dir = _get_env_str("SINGLEFLIGHT_LOCK_DIR", "")
+        return cls(
+            lock_dir=Path(lock_dir) if lock_dir else cls.lock_dir,
+            timeout=_get_env_int("SINGLEFLIGHT_TIMEOUT", cls.timeout),
+        )
+
+
+class _Call:
+    """A fill in progress that other threads of the process can wait on."""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error: Optional[BaseException] = None
+
+
+_config: Optional[SingleFlightConfig] = None
+_calls: dict[str, _Call] = {}
+_lock = threading.Lock()
+
+# Whether the current thread is inside a cross-worker locked fill.
+_held = threading.local()
+
+
+def get_singleflight_config() -> SingleFlightConfig:
+    """
+    Get the default single-flight configuration.
+
+    Lazily initializes from environment on first call.
+    """
+    global _config
+    if _config is None:
+        _config = SingleFlightConfig.from_environment()
+    return _config
+
+
+def mark_nested() -> None:
+    """
+    Treat every fill of the current thread as nested in a locked fill.
+
+    Such fills only coalesce within the process and never wait for a
+    cross-worker lock.
+    """
+    _held.locked = True
+
+
+@contextmanager
+def _file_lock(key: str, timeout: float) -> Iterator[None]:
+    """Hold the cross-worker lock stripe of *key*, or proceed unlocked after *timeout*."""
+    if fcntl is None or getattr(_held, "locked", False):
+        yield
+        return
+
+    lock_dir = get_singleflight_config().lock_dir
+    stripe = int(hashlib.sha1(key.encode()).hexdigest(), 16) % _LOCK_STRIPES
+    try:
+        lock_dir.mkdir(parents=True, exist_ok=True)
+        fd = os.open(lock_dir / f"{stripe:04x}.lock", os.O_RDWR | os.O_CREAT, 0o644)
+    except OSError as exc:
+        logger.warning("Cannot open lock file in %s: %s", lock_dir, exc)
+        yield
+        return
+
+    try:
+        deadline = time.monotonic() + timeout
+        while True:
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                locked = True
+                break
+            except BlockingIOError:
+                if time.monotonic() >= deadline:
+                    logger.warning("Timed out waiting for fill of %s; computing it anyway", key)
+                    locked = False
+                    break
+                time.sleep(_POLL_SECONDS)
+
+        _held.locked = True
+        try:
+            yield
+        finally:
+            _held.locked = False
+            if locked:
+                fcntl.flock(fd, fcntl.LOCK_UN)
+    finally:
+        os.close(fd)
+
+
+def single_flight(
+    key: str,
+    compute: Callable[[], T],
+    lookup: Optional[Callable[[], Optional[T]]] = None,
+) -> T:
+    """
+    Return ``compute()`` for *key*, computing it once for concurrent callers.
+
+    Call this after a cache miss.  *lookup* re-reads the shared store the
+    value is written to (returning None when absent); without it only
+    callers in the same process are coalesced, since another worker's result
+    could not be seen anyway.  *compute* is expected to store the value.
+    """
+    timeout = get_singleflight_config().timeout
+
+    with _lock:
+        call = _calls.get(key)
+        leader = call is None
+        if leader:
+            call = _calls[key] = _Call()
+
+    if not leader:
+        if not call.done.wait(timeout):
+            logger.warning("Timed out waiting for fill of %s; computing it anyway", key)
+            return compute()
+        if call.error is not None:
+            raise call.error
+        return call.result
+
+    try:
+        if lookup is None:
+            call.result = compute()
+        else:
+            with _file_lock(key, timeout):
+                # Another worker may have stored the value while we waited.
+                value = lookup()
+                call.result = value if value is not None else compute()
+        return call.result
+    except BaseException as exc:
+        call.error = exc
+        raise
+    finally:
+        with _lock:
+            del _calls[key]
+        call.done.set()
+
+
+def reset_singleflight() -> None:
+    """Reset the configuration (useful for testing)."""
+    global _config
+    _config = None
@@ -1,10 +1,35 @@
+import gzip
 import json
+import os
+import tempfile
+import threading
+import time
+import unittest
+from datetime import timedelta
+from pathlib import Path
+from unittest.mock import MagicMock, patch
 
 from rest_framework.test import APITestCase
 from rest_framework import status
+from rest_framework.exceptions import ValidationError
 from django.contrib.gis.geos import GEOSGeometry
+from django.http import HttpResponse
+from django.core.cache import caches
+from django.test import RequestFactory, override_settings
 from django.urls import reverse
+from django.utils import timezone
+from server.watershed.catalog import CatalogEntry, clear_catalog_cache, get_catalog, refresh_catalog
+from server.watershed.geojson import GeoJSONConfig
+from server.watershed.geometry_levels import level_for_tolerance, level_for_zoom, level_from_query
+from server.watershed.filters import MAX_LIMIT, Page, parse_bbox, parse_page
+from server.watershed.fanout import FanoutConfig, fan_out, reset_fanout
 from server.watershed.models import Watershed, Subcatchment
+from server.watershed import upstream
+from server.watershed.precomputed import build_blobs
+from server.watershed.shared_cache import SHARED_CACHE_ALIAS, SharedCache
+from server.watershed.vector_tiles import MVT_CONTENT_TYPE, tile_bounds, tile_exists
+from server.watershed.singleflight import SingleFlightConfig, _file_lock, mark_nested, single_flight
+from server.watershed.versioning import DataVersion, bump_generation, clear_version_caches, revision_token
 
 def create_watershed(webcloud_run_id: str):
     """
@@ -119,6 +144,178 @@ class SubcatchmentTests(APITestCase):
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertEqual(len(payload['features']), 0)
 
+    def test_bbox_selects_intersecting_subcatchments(self):
+        url = reverse('watershed-subcatchments', args=[self.watershed_with_multiple_subcatchments.runid])
+
+        inside = json.loads(self.client.get(url, {'bbox': '0.5,0.5,2,2'}).content)
+        outside = json.loads(self.client.get(url, {'bbox': '5,5,6,6'}).content)
+
+        self.assertEqual(len(inside['features']), 2)
+        self.assertEqual(len(outside['features']), 0)
+
+    def test_invalid_bbox_is_bad_request(self):
+        url = reverse('watershed-subcatchments', args=[self.watershed_with_multiple_subcatchments.runid])
+        response = self.client.get(url, {'bbox': '1,1,0,0'})
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_attribute_filter_matches_any_value(self):
+        url = reverse('watershed-subcatchments', args=[self.watershed_with_multiple_subcatchments.runid])
+
+        one = json.loads(self.client.get(url, {'topazid': '2'}).content)
+        both = json.loads(self.client.get(url, {'topazid': ['1', '2']}).content)
+
+        self.assertEqual([f['properties']['topazid'] for f in one['features']], [2])
+        self.assertEqual(len(both['features']), 2)
+
+    def test_limit_pages_through_subcatchments(self):
+        url = reverse('watershed-subcatchments', args=[self.watershed_with_multiple_subcatchments.runid])
+
+        first = json.loads(self.client.get(url, {'limit': '1'}).content)
+        next_url = first['links'][0]['href']
+        second = json.loads(self.client.get(next_url).content)
+
+        self.assertEqual(first['numberMatched'], 2)
+        self.assertEqual(first['numberReturned'], 1)
+        self.assertIn('offset=1', next_url)
+        self.assertEqual(second['numberReturned'], 1)
+        self.assertNotIn('links', second)
+        self.assertNotEqual(first['features'][0]['id'], second['features'][0]['id'])
+
+    def test_streamed_collection_matches_buffered(self):
+        url = reverse('watershed-subcatchments', args=[self.watershed_with_multiple_subcatchments.runid])
+        buffered = json.loads(self.client.get(url, {'limit': '1'}).content)
+
+        with patch('server.watershed.views.get_geojson_config', return_value=GeoJSONConfig(stream=True, chunk_size=1)):
+            plain = self.client.get(url, {'limit': '1'})
+            compressed = self.client.get(url, {'limit': '1'}, HTTP_ACCEPT_ENCODING='gzip, br')
+
+        self.assertTrue(plain.streaming)
+        self.assertEqual(json.loads(b''.join(plain.streaming_content)), buffered)
+        self.assertEqual(compressed['Content-Encoding'], 'gzip')
+        self.assertEqual(json.loads(gzip.decompress(b''.join(compressed.streaming_content))), buffered)
+
+    def test_postgres_engine_matches_python_engine(self):
+        url = reverse('watershed-subcatchments', args=[self.watershed_with_multiple_subcatchments.runid])
+        python = json.loads(self.client.get(url, {'limit': '1'}).content)
+
+        with patch('server.watershed.views.get_geojson_config', return_value=GeoJSONConfig(engine='postgres')):
+            paged = json.loads(self.client.get(url, {'limit': '1'}).content)
+            empty = json.loads(self.client.get(url, {'bbox': '5,5,6,6'}).content)
+
+        self.assertEqual(paged, python)
+        self.assertEqual(empty['features'], [])
+
+    def test_postgres_engine_keeps_the_page_order(self):
+        url = reverse('watershed-subcatchments', args=[self.watershed_with_multiple_subcatchments.runid])
+        python = json.loads(self.client.get(url, {'limit': '2'}).content)
+
+        with patch('server.watershed.views.get_geojson_config', return_value=GeoJSONConfig(engine='postgres')):
+            postgres = json.loads(self.client.get(url, {'limit': '2'}).content)
+
+        ids = [f['id'] for f in python['features']]
+        self.assertEqual(ids, sorted(ids))
+        self.assertEqual([f['id'] for f in postgres['features']], ids)
+
+
+class GeoJSONConfigTests(unittest.TestCase):
+    def test_streaming_is_opt_in(self):
+        with patch.dict(os.environ, {}, clear=True):
+            self.assertFalse(GeoJSONConfig.from_environment().stream)
+        with patch.dict(os.environ, {'GEOJSON_STREAM': 'true', 'GEOJSON_STREAM_CHUNK_SIZE': '0'}):
+            config = GeoJSONConfig.from_environment()
+        self.assertTrue(config.stream)
+        self.assertEqual(config.chunk_size, 1)
+
+    def test_unknown_engine_falls_back_to_python(self):
+        with patch.dict(os.environ, {'GEOJSON_ENGINE': 'Postgres'}):
+            self.assertEqual(GeoJSONConfig.from_environment().engine, 'postgres')
+        with patch.dict(os.environ, {'GEOJSON_ENGINE': 'rust'}):
+            self.assertEqual(GeoJSONConfig.from_environment().engine, 'python')
+
+    def test_gzip_only_when_accepted(self):
+        factory = RequestFactory()
+        config = GeoJSONConfig(stream=True)
+
+        self.assertTrue(config.compress_for(factory.get('/', HTTP_ACCEPT_ENCODING='gzip, deflate')))
+        self.assertFalse(config.compress_for(factory.get('/', HTTP_ACCEPT_ENCODING='br')))
+        self.assertFalse(GeoJSONConfig(gzip=False).compress_for(factory.get('/', HTTP_ACCEPT_ENCODING='gzip')))
+
+
+
+class PrecomputedGeoJSONTests(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.watershed = create_watershed('WS-BLOB-1')
+        create_subcatchment(cls.watershed, topazid=1)
+        create_subcatchment(cls.watershed, topazid=2)
+
+    def _get(self, **extra):
+        url = reverse('watershed-subcatchments', args=[self.watershed.runid])
+        return self.client.get(url, **extra)
+
+    def test_stored_collection_matches_built_one(self):
+        built = json.loads(self._get().content)
+        result = build_blobs()
+        plain = self._get()
+        compressed = self._get(HTTP_ACCEPT_ENCODING='gzip')
+
+        self.assertEqual(result.written, 4)
+        self.assertEqual(json.loads(plain.content)['features'], sorted(built['features'], key=lambda f: f['id']))
+        self.assertNotIn('Content-Encoding', plain)
+        self.assertEqual(compressed['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(compressed.content), plain.content)
+        self.assertIn('ETag', compressed)
+
+    def test_gzip_and_identity_bodies_have_distinct_etags(self):
+        build_blobs()
+        plain = self._get()
+        compressed = self._get(HTTP_ACCEPT_ENCODING='gzip')
+        self.assertNotEqual(plain['ETag'], compressed['ETag'])
+
+        # A gzip client revalidating the identity body gets it sent again.
+        response = self._get(HTTP_ACCEPT_ENCODING='gzip', HTTP_IF_NONE_MATCH=plain['ETag'])
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        response = self._get(HTTP_ACCEPT_ENCODING='gzip', HTTP_IF_NONE_MATCH=compressed['ETag'])
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertIn('Accept-Encoding', response['Vary'])
+
+    def test_rebuild_skips_unchanged_and_drops_removed_runs(self):
+        build_blobs()
+        unchanged = build_blobs()
+        Watershed.objects.filter(pk=self.watershed.pk).delete()
+        removed = build_blobs()
+
+        self.assertEqual((unchanged.written, unchanged.unchanged), (0, 4))
+        # Both watershed lists changed; the run's two collections are gone.
+        self.assertEqual((removed.written, removed.removed), (2, 2))
+        self.assertEqual(json.loads(self._get().content)['features'], [])
+
+    def test_filtered_request_is_built(self):
+        build_blobs()
+        Subcatchment.objects.filter(topazid=2).delete()
+
+        self.assertEqual(len(json.loads(self._get().content)['features']), 2)
+        url = reverse('watershed-subcatchments', args=[self.watershed.runid])
+        self.assertEqual(len(json.loads(self.client.get(url, {'topazid': '1'}).content)['features']), 1)
+
+
+class FeatureFilterTests(unittest.TestCase):
+    def test_bbox_must_have_four_ordered_numbers(self):
+        self.assertEqual(parse_bbox('-120,35,-119,36').extent, (-120.0, 35.0, -119.0, 36.0))
+        for value in ('1,2,3', 'a,b,c,d', '1,1,0,2', '0,0,181,1'):
+            with self.assertRaises(ValidationError):
+                parse_bbox(value)
+
+    def test_page_is_optional_and_clamped(self):
+        self.assertIsNone(parse_page({}))
+        self.assertIsNone(parse_page({'offset': '10'}))
+        self.assertEqual(parse_page({'limit': '0'}), Page(1, 0))
+        self.assertEqual(parse_page({'limit': str(MAX_LIMIT + 1), 'offset': '3'}), Page(MAX_LIMIT, 3))
+        with self.assertRaises(ValidationError):
+            parse_page({'limit': '-1'})
+
 
 class WatershedTests(APITestCase):
     @classmethod
@@ -154,3 +351,631 @@ class WatershedTests(APITestCase):
 
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertIsNone(payload.get('geometry'))
+
+    def test_zoom_without_stored_level_falls_back_to_full_geometry(self):
+        """A level of detail that was never computed must not blank the geometry."""
+        url = reverse('watershed-detail', args=[self.watershed.runid])
+        response = self.client.get(url, {'zoom': '3'})
+        payload = json.loads(response.content)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(payload['geometry']['type'], 'MultiPolygon')
+
+
+class GeometryLevelTests(unittest.TestCase):
+    def test_zoom_selects_coarser_levels_when_zoomed_out(self):
+        self.assertEqual(level_for_zoom(3).field, 'geom_coarse')
+        self.assertEqual(level_for_zoom(8).field, 'geom_medium')
+        self.assertEqual(level_for_zoom(12).field, 'simplified_geom')
+        self.assertEqual(level_for_zoom(16).field, 'geom')
+
+    def test_precision_grows_with_detail(self):
+        precisions = [level_for_zoom(z).precision for z in range(0, 20)]
+        self.assertEqual(precisions, sorted(precisions))
+
+    def test_tolerance_selects_level_within_it(self):
+        self.assertEqual(level_for_tolerance(0.01).field, 'geom_medium')
+        self.assertEqual(level_for_tolerance(0).field, 'geom')
+
+    def test_query_parameters(self):
+        self.assertEqual(level_from_query({'zoom': '3'}).field, 'geom_coarse')
+        self.assertEqual(level_from_query({'tolerance': '1'}).field, 'geom_coarse')
+        self.assertIsNone(level_from_query({'zoom': 'far'}))
+        self.assertIsNone(level_from_query({}))
+
+
+# ---------------------------------------------------------------------------
+# Conditional caching (versioning.py)
+# ---------------------------------------------------------------------------
+
+class LoadGenerationTests(unittest.TestCase):
+    def test_generation_is_bumped_after_derived_data_is_rewritten(self):
+        from server.watershed import load
+
+        calls = MagicMock()
+        calls.load_with_discovery.return_value = {'watersheds_saved': 1}
+        calls.build_blobs.return_value = MagicMock(written=1, unchanged=0, removed=0)
+        calls.bump_generation.return_value = 7
+
+        with patch.object(load, 'load_with_discovery', calls.load_with_discovery), \
+                patch.object(load, 'connection', calls.connection), \
+                patch.object(load, 'build_blobs', calls.build_blobs), \
+                patch.object(load, 'bump_generation', calls.bump_generation), \
+                patch.object(load, 'configure_logging'):
+            result = load.run(verbose=False, runids=['run-a'])
+
+        order = [name for name, _, _ in calls.mock_calls if name in (
+            'load_with_discovery', 'connection.cursor().__enter__().execute', 'build_blobs', 'bump_generation',
+        )]
+        self.assertEqual(order, [
+            'load_with_discovery', 'connection.cursor().__enter__().execute', 'build_blobs', 'bump_generation',
+        ])
+        self.assertEqual(result['generation'], 7)
+
+
+class DataVersionTests(unittest.TestCase):
+    def setUp(self):
+        self.factory = RequestFactory()
+        self.version = DataVersion('abc123')
+
+    def test_etag_is_strong_and_per_variant(self):
+        self.assertEqual(self.version.etag(), '"abc123"')
+        self.assertEqual(self.version.etag('webp'), '"abc123.webp"')
+
+    def test_matching_if_none_match_is_not_modified(self):
+        request = self.factory.get('/tile.png', HTTP_IF_NONE_MATCH='"abc123.png"')
+        response = self.version.not_modified(request, 'png')
+
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], '"abc123.png"')
+
+    def test_stale_if_none_match_is_sent(self):
+        request = self.factory.get('/tile.png', HTTP_IF_NONE_MATCH='"old.png"')
+        self.assertIsNone(self.version.not_modified(request, 'png'))
+
+    def test_unstamped_url_must_revalidate(self):
+        request = self.factory.get('/tile.png')
+        response = self.version.apply(request, HttpResponse(b''), 'png')
+
+        self.assertIn('no-cache', response['Cache-Control'])
+        self.assertEqual(response['X-Data-Version'], 'abc123')
+
+    def test_stamped_url_is_immutable(self):
+        request = self.factory.get('/tile.png', {'v': 'abc123'})
+        response = self.version.apply(request, HttpResponse(b''), 'png')
+
+        self.assertIn('immutable', response['Cache-Control'])
+        self.assertIn('max-age=31536000', response['Cache-Control'])
+
+    def test_outdated_stamp_must_revalidate(self):
+        request = self.factory.get('/tile.png', {'v': 'old'})
+        response = self.version.apply(request, HttpResponse(b''), 'png')
+
+        self.assertIn('no-cache', response['Cache-Control'])
+        self.assertNotIn('immutable', response['Cache-Control'])
+
+    def test_revision_token(self):
+        self.assertEqual(revision_token(None), '')
+        self.assertEqual(revision_token({'etag': None, 'last_modified': None}), '')
+        self.assertNotEqual(revision_token({'etag': '"a"'}), revision_token({'etag': '"b"'}))
+        self.assertEqual(
+            revision_token({'etag': None, 'last_modified': 'Mon', 'content_length': '10'}),
+            revision_token({'last_modified': 'Mon', 'content_length': '10'}),
+        )
+
+
+class ConditionalGeoJSONTests(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        create_watershed('WS-ETAG-1')
+
+    def setUp(self):
+        clear_version_caches()
+
+    def test_list_sets_etag_and_revalidates(self):
+        url = reverse('watershed-list')
+        response = self.client.get(url)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn('ETag', response)
+        self.assertIn('no-cache', response['Cache-Control'])
+
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(response.content, b'')
+
+    def test_bump_changes_etag(self):
+        url = reverse('watershed-list')
+        etag = self.client.get(url)['ETag']
+
+        bump_generation()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_version_stamped_url_is_immutable(self):
+        url = reverse('watershed-list')
+        version = self.client.get(url)['X-Data-Version']
+
+        response = self.client.get(url, {'v': version})
+
+        self.assertIn('immutable', response['Cache-Control'])
+
+
+# ---------------------------------------------------------------------------
+# Vector tiles (vector_tiles.py)
+# ---------------------------------------------------------------------------
+
+class TileAddressTests(unittest.TestCase):
+    def test_tile_bounds(self):
+        self.assertEqual(tile_bounds(0, 0, 0)[0::2], (-180, 180))
+        west, south, east, north = tile_bounds(1, 1, 0)
+        self.assertEqual((west, south, east), (0, 0, 180))
+        self.assertAlmostEqual(north, 85.0511287798, places=6)
+
+    def test_tile_exists(self):
+        self.assertTrue(tile_exists(2, 3, 3))
+        self.assertFalse(tile_exists(2, 4, 0))
+        self.assertFalse(tile_exists(-1, 0, 0))
+        self.assertFalse(tile_exists(40, 0, 0))
+
+
+class VectorTileTests(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        # Geometries cover lon/lat 0..1, i.e. tile (1, 1, 0).
+        cls.watershed = create_watershed('WS-MVT-1')
+        create_subcatchment(cls.watershed, topazid=1)
+
+    def setUp(self):
+        clear_version_caches()
+
+    def test_watershed_tile_contains_features(self):
+        response = self.client.get(reverse('watershed-tiles', args=[1, 1, 0]))
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response['Content-Type'], MVT_CONTENT_TYPE)
+        self.assertIn(b'watersheds', response.content)
+        self.assertIn(b'WS-MVT-1', response.content)
+
+    def test_tile_away_from_features_is_empty(self):
+        response = self.client.get(reverse('watershed-tiles', args=[1, 0, 1]))
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.content, b'')
+
+    def test_subcatchment_tile_is_limited_to_watershed(self):
+        url = reverse('watershed-subcatchments-tiles', args=[self.watershed.runid, 1, 1, 0])
+        other = reverse('watershed-subcatchments-tiles', args=['unrecognized-webcloud-run-id', 1, 1, 0])
+
+        self.assertIn(b'subcatchments', self.client.get(url).content)
+        self.assertEqual(self.client.get(other).content, b'')
+
+    def test_tile_revalidates(self):
+        url = reverse('watershed-channels-tiles', args=[self.watershed.runid, 1, 1, 0])
+        etag = self.client.get(url)['ETag']
+
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_out_of_range_tile_is_404(self):
+        response = self.client.get(reverse('watershed-tiles', args=[1, 2, 0]))
+
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+# ---------------------------------------------------------------------------
+# Concurrent fan-out (fanout.py)
+# ---------------------------------------------------------------------------
+
+class FanoutTests(unittest.TestCase):
+    def setUp(self):
+        reset_fanout()
+        config = patch(
+            'server.watershed.fanout.get_fanout_config',
+            return_value=FanoutConfig(max_workers=8, per_host=2, deadline_seconds=0),
+        )
+        config.start()
+        self.addCleanup(config.stop)
+        self.addCleanup(reset_fanout)
+
+    def test_limits_concurrency_per_host(self):
+        lock = threading.Lock()
+        running: dict[str, int] = {}
+        peak: dict[str, int] = {}
+
+        def call(host):
+            with lock:
+                running[host] = running.get(host, 0) + 1
+                peak[host] = max(peak.get(host, 0), running[host])
+            time.sleep(0.05)
+            with lock:
+                running[host] -= 1
+            return host
+
+        calls = [
+            (i, f'https://{host}/file{i}.tif', lambda host=host: call(host))
+            for i, host in enumerate(['a.example'] * 6 + ['b.example'] * 2)
+        ]
+        result = fan_out(calls)
+
+        self.assertTrue(result.complete)
+        self.assertEqual(len(result.results), 8)
+        self.assertEqual(peak['a.example'], 2)
+        self.assertEqual(peak['b.example'], 2)
+
+    def test_deadline_returns_partial_results(self):
+        calls = [
+            ('fast', 'https://a.example/fast', lambda: 'done'),
+            ('slow', 'https://b.example/slow', lambda: time.sleep(1)),
+        ]
+        started = time.monotonic()
+        result = fan_out(calls, deadline=time.monotonic() + 0.2)
+
+        self.assertLess(time.monotonic() - started, 0.9)
+        self.assertFalse(result.complete)
+        self.assertEqual(result.results, {'fast': 'done'})
+        self.assertEqual(result.pending, ['slow'])
+
+    def test_failed_calls_are_left_out(self):
+        def fail():
+            raise ValueError('unreadable raster')
+
+        with self.assertLogs('watershed.fanout', 'WARNING'):
+            result = fan_out([
+                ('ok', '/data/rasters/ok.tif', lambda: 1),
+                ('bad', '/data/rasters/bad.tif', fail),
+            ])
+
+        self.assertTrue(result.complete)
+        self.assertEqual(result.results, {'ok': 1})
+
+    def test_output_discovery_flags_partial_catalog(self):
+        from server.watershed.rhessys_outputs import discovery
+
+        def value_range(runid, scenario_id, filename, is_change):
+            if filename == 'lai.tif':
+                time.sleep(1)
+            return {'min': 0.0, 'max': 1.0}
+
+        with patch.object(discovery, '_discover_scenarios', return_value=['baseline']), \
+                patch.object(discovery, '_discover_variables', return_value=['lai.tif', 'streamflow.tif']), \
+                patch.object(discovery, '_value_range', side_effect=value_range), \
+                patch.object(discovery, 'get_map_tile_source', side_effect=lambda r, s, f: f'/data/{s}/{f}'):
+            catalog, complete = discovery.scan_output_maps('run-1', deadline=time.monotonic() + 0.3)
+
+        self.assertFalse(complete)
+        self.assertTrue(catalog['partial'])
+        self.assertEqual(list(catalog['value_ranges']['baseline']), ['streamflow'])
+
+    def test_served_value_ranges_follow_refined_statistics(self):
+        from server.watershed.rhessys_outputs import discovery
+
+        catalog = {
+            'scenarios': [{'id': 'fire_change', 'is_change': True, 'variables': ['lai', 'et']}],
+            'variables': [
+                {'id': 'lai', 'filename': 'lai.tif'},
+                {'id': 'et', 'filename': 'et.tif'},
+            ],
+            'value_ranges': {'fire_change': {'lai': {'min': -1.0, 'max': 1.0}, 'et': {'min': 0.0, 'max': 5.0}}},
+        }
+        refined = {'/data/fire_change/lai.tif': MagicMock(min=-2.0, max=0.5)}
+
+        def stats(source):
+            if source not in refined:
+                raise ValueError('unreadable raster')
+            return refined[source]
+
+        with patch.object(discovery, 'get_raster_stats', side_effect=stats), \
+                patch.object(discovery, 'get_map_tile_source', side_effect=lambda r, s, f: f'/data/{s}/{f}'), \
+                self.assertLogs('watershed.fanout', 'WARNING'):
+            ranges = discovery.current_value_ranges('run-1', catalog)
+
+        self.assertEqual(ranges['fire_change']['lai'], {'min': -2.0, 'max': 2.0})
+        # A map whose statistics cannot be read keeps the stored range.
+        self.assertEqual(ranges['fire_change']['et'], {'min': 0.0, 'max': 5.0})
+        self.assertEqual(catalog['value_ranges']['fire_change']['lai'], {'min': -1.0, 'max': 1.0})
+
+
+# ---------------------------------------------------------------------------
+# Discovery catalog (catalog.py)
+# ---------------------------------------------------------------------------
+
+class DiscoveryCatalogTests(unittest.TestCase):
+    def setUp(self):
+        self.stored = {}
+        self.scanned = []
+        clear_catalog_cache()
+        self.addCleanup(clear_catalog_cache)
+
+        def load(kind, runid):
+            return self.stored.get((kind, runid))
+
+        def store(kind, runid, entry):
+            self.stored[(kind, runid)] = entry
+
+        for name, side_effect in (
+            ('_load_entry', load),
+            ('_store_entry', store),
+            ('_claim_refresh', lambda kind, runid, seen: True),
+        ):
+            patcher = patch(f'server.watershed.catalog.{name}', side_effect=side_effect)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+        # Run "background" refreshes inline.
+        executor = MagicMock()
+        executor.submit.side_effect = lambda fn, *args: fn(*args)
+        patcher = patch('server.watershed.catalog._refresh_executor', executor)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def scan(self, runid, deadline):
+        self.scanned.append(deadline)
+        return [f'scan {len(self.scanned)}'], True
+
+    def test_first_request_scans_within_deadline(self):
+        self.assertEqual(get_catalog('spatial', 'run-1', self.scan), ['scan 1'])
+        self.assertIsNotNone(self.scanned[0])
+
+        clear_catalog_cache()  # e.g. another worker
+        self.assertEqual(get_catalog('spatial', 'run-1', self.scan), ['scan 1'])
+        self.assertEqual(len(self.scanned), 1)
+
+    def test_stale_entry_is_served_while_refreshing(self):
+        old = timezone.now() - timedelta(days=1)
+        self.stored[('spatial', 'run-1')] = CatalogEntry(['old'], True, old)
+
+        self.assertEqual(get_catalog('spatial', 'run-1', self.scan), ['old'])
+        self.assertEqual(self.scanned, [None])
+        self.assertEqual(self.stored[('spatial', 'run-1')].payload, ['scan 1'])
+        self.assertEqual(get_catalog('spatial', 'run-1', self.scan), ['scan 1'])
+
+    def test_partial_entry_is_refreshed(self):
+        self.stored[('outputs', 'run-1')] = CatalogEntry({'partial': True}, False, timezone.now())
+
+        get_catalog('outputs', 'run-1', self.scan)
+        self.assertTrue(self.stored[('outputs', 'run-1')].complete)
+
+    def test_empty_refresh_keeps_known_products(self):
+        self.stored[('spatial', 'run-1')] = CatalogEntry(['known'], True, timezone.now())
+
+        with self.assertLogs('watershed.catalog', 'WARNING'):
+            entry = refresh_catalog('spatial', 'run-1', lambda runid, deadline: (None, True))
+        self.assertEqual(entry.payload, ['known'])
+
+
+# ---------------------------------------------------------------------------
+# Upstream HTTP client (upstream.py)
+# ---------------------------------------------------------------------------
+
+class UpstreamClientTests(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_GET(self):
+                body = b'<a href="lai.tif">lai.tif</a>' * 100
+                if 'gzip' in self.headers.get('Accept-Encoding', ''):
+                    body = gzip.compress(body)
+                    self.send_response(200)
+                    self.send_header('Content-Encoding', 'gzip')
+                else:
+                    self.send_response(200)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        cls.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.url = f'http://127.0.0.1:{cls.server.server_port}/browse/'
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        upstream.reset_upstream()
+        self.addCleanup(upstream.reset_upstream)
+
+    def test_connections_are_reused(self):
+        for _ in range(3):
+            self.assertEqual(upstream.get(self.url).status_code, 200)
+
+        metrics = upstream.get_upstream_metrics()[f'127.0.0.1:{self.server.server_port}']
+        self.assertEqual(metrics['requests'], 3)
+        self.assertEqual(metrics['connections'], 1)
+        self.assertEqual(metrics['errors'], 0)
+
+    def test_gzip_is_negotiated_and_decoded(self):
+        response = upstream.get(self.url)
+
+        self.assertEqual(response.headers['Content-Encoding'], 'gzip')
+        self.assertIn('lai.tif', response.text)
+
+    def test_default_timeouts_apply(self):
+        with patch.object(upstream.get_session(), 'request', wraps=upstream.get_session().request) as send:
+            upstream.get(self.url)
+        self.assertEqual(send.call_args.kwargs['timeout'], upstream.get_upstream_config().timeout)
+
+
+# ---------------------------------------------------------------------------
+# Single-flight coalescing (singleflight.py)
+# ---------------------------------------------------------------------------
+
+class SingleFlightTests(unittest.TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        patcher = patch(
+            'server.watershed.singleflight.get_singleflight_config',
+            return_value=SingleFlightConfig(lock_dir=Path(tmp.name), timeout=5),
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_concurrent_callers_share_one_computation(self):
+        calls = []
+        release = threading.Event()
+
+        def compute():
+            calls.append(1)
+            release.wait(1)
+            return 'geojson'
+
+        results = []
+        threads = [
+            threading.Thread(target=lambda: results.append(single_flight('geometry:a', compute)))
+            for _ in range(8)
+        ]
+        for t in threads:
+            t.start()
+        time.sleep(0.1)
+        release.set()
+        for t in threads:
+            t.join()
+
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(results, ['geojson'] * 8)
+
+    def test_waiters_receive_the_error(self):
+        started = threading.Event()
+
+        def fail():
+            started.set()
+            time.sleep(0.1)
+            raise ValueError('upstream returned 500')
+
+        errors = []
+
+        def call():
+            try:
+                single_flight('geometry:b', fail)
+            except ValueError as exc:
+                errors.append(exc)
+
+        leader = threading.Thread(target=call)
+        leader.start()
+        started.wait(1)
+        call()
+        leader.join()
+
+        self.assertEqual(len(errors), 2)
+
+    def test_other_worker_result_is_looked_up(self):
+        # Stand-in for another worker: hold the key's file lock while filling.
+        store = {}
+        locked = threading.Event()
+
+        def other_worker():
+            with _file_lock('stats:x', timeout=5):
+                locked.set()
+                time.sleep(0.2)
+                store['stats:x'] = 'stats'
+
+        worker = threading.Thread(target=other_worker)
+        worker.start()
+        locked.wait(1)
+        compute = MagicMock(return_value='recomputed')
+        result = single_flight('stats:x', compute, lookup=lambda: store.get('stats:x'))
+        worker.join()
+
+        self.assertEqual(result, 'stats')
+        compute.assert_not_called()
+
+    def test_nested_thread_does_not_wait_for_file_locks(self):
+        locked, release = threading.Event(), threading.Event()
+
+        def caller():
+            # Stand-in for the request thread holding the tile's lock stripe.
+            with _file_lock('stats:y', timeout=5):
+                locked.set()
+                release.wait(5)
+
+        holder = threading.Thread(target=caller)
+        holder.start()
+        locked.wait(1)
+        results = []
+
+        def render_process():
+            mark_nested()
+            start = time.monotonic()
+            results.append(single_flight('stats:y', lambda: 'stats', lookup=lambda: None))
+            results.append(time.monotonic() - start)
+
+        render = threading.Thread(target=render_process)
+        render.start()
+        render.join()
+        release.set()
+        holder.join()
+
+        self.assertEqual(results[0], 'stats')
+        self.assertLess(results[1], 1)
+
+
+class SharedCacheTests(unittest.TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        settings = override_settings(CACHES={
+            'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+            SHARED_CACHE_ALIAS: {
+                'BACKEND': 'server.watershed.shared_cache.SizedFileBasedCache',
+                'LOCATION': tmp.name,
+                'OPTIONS': {'MAX_BYTES': 64 * 1024, 'LOW_WATER': 0.5},
+            },
+        })
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+    def test_values_are_shared_between_instances(self):
+        # Two workers each create their own handle on the same namespace.
+        SharedCache('stats', ttl=60).set(('run-a', 'sbs.tif'), {'min': 0, 'max': 4})
+
+        self.assertEqual(SharedCache('stats', ttl=60).get(('run-a', 'sbs.tif')), {'min': 0, 'max': 4})
+
+    def test_stored_none_is_distinguished_from_a_miss(self):
+        cache = SharedCache('footprint', ttl=60)
+        cache.set('unindexed', None)
+
+        self.assertIn('unindexed', cache)
+        self.assertNotIn('unknown', cache)
+        self.assertEqual(cache.get('unknown', 'missing'), 'missing')
+
+    def test_clear_invalidates_only_its_namespace(self):
+        stats, footprints = SharedCache('stats', ttl=60), SharedCache('footprint', ttl=60)
+        stats.set('key', 1)
+        footprints.set('key', 2)
+
+        stats.clear()
+
+        self.assertIsNone(stats.get('key'))
+        self.assertEqual(footprints.get('key'), 2)
+
+    def test_least_recently_used_entries_are_evicted(self):
+        cache = SharedCache('geometry', ttl=60)
+        payload = os.urandom(10 * 1024)  # incompressible
+        cache.set('first', payload)
+        cache.set('second', payload)
+        # Make the first entry the oldest regardless of filesystem timestamp
+        # resolution, then read the second one.
+        backend = caches[SHARED_CACHE_ALIAS]
+        first = backend._key_to_file(cache._key('first'))
+        past = time.time() - 60
+        os.utime(first, (past, past))
+        cache.get('second')
+
+        for i in range(5):
+            cache.set(f'more-{i}', payload)
+
+        self.assertNotIn('first', cache)
+        self.assertLessEqual(backend.size(), 64 * 1024)
@@ -0,0 +1,316 @@
+"""
+Persistent on-disk cache for rendered raster map tiles.
+
+Every SBS, RHESSys spatial-input and RHESSys output tile is otherwise rendered
+from a remote GeoTIFF on each request.  This cache stores the encoded bytes
+one file per tile under::
+
+    <root>/<runid>/<layer segments...>/<variant>/<z>/<x>/<y>.<ext>
+
+Because the cache lives on disk rather than in process memory it is shared by
+all gunicorn workers and survives worker recycling.  The directory layout
+makes per-watershed and per-layer invalidation a single ``rmtree``.
+
+Eviction is approximate LRU: a hit bumps the file's mtime, and when the
+tracked size exceeds the budget the least recently used files are removed
+until the cache is back under the low-water mark.
+"""
+
+from __future__ import annotations
+
+import logging
+import os
+import shutil
+import tempfile
+import threading
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable, Optional
+from urllib.parse import quote
+
+from server.watershed.singleflight import single_flight
+
+from .config import get_tile_config
+
+logger = logging.getLogger("watershed.tiles")
+
+
+@dataclass(frozen=True)
+class TileKey:
+    """
+    Identifies one rendered tile.
+
+    Attributes:
+        runid: Watershed run identifier
+        layer: Slash-separated layer path, e.g. ``"sbs"``,
+            ``"spatial/wbt_slope.tif"`` or ``"outputs/baseline/lai"``
+        variant: Rendering variant within the layer (e.g. SBS color mode)
+        z, x, y: Web Mercator tile coordinates
+        ext: File extension of the encoded tile
+    """
+    runid: str
+    layer: str
+    variant: str
+    z: int
+    x: int
+    y: int
+    ext: str = "png"
+
+
+def _segment(value: str) -> str:
+    """Encode an arbitrary string as a single, traversal-safe path segment."""
+    return quote(value, safe="-_").replace(".", "%2E")
+
+
+class TileCache:
+    """
+    Disk-backed tile cache with a size budget and LRU eviction.
+
+    A cache constructed with ``root=None`` is disabled: lookups always miss
+    and writes are dropped, so callers never need to special-case it.
+    """
+
+    def __init__(
+        self,
+        root: Optional[Path],
+        max_bytes: int,
+        low_water: float = 0.9,
+    ):
+        self.root = Path(root) if root is not None else None
+        self.max_bytes = max_bytes
+        self.low_water = low_water
+        self._lock = threading.Lock()
+        self._approx_bytes: Optional[int] = None
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+        self.evictions = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.root is not None
+
+    def _layer_dir(self, runid: str, layer: Optional[str] = None) -> Path:
+        path = self.root / _segment(runid)
+        if layer:
+            for part in layer.split("/"):
+                path = path / _segment(part)
+        return path
+
+    def path_for(self, key: TileKey) -> Path:
+        """Return the file path a tile is stored under."""
+        return (
+            self._layer_dir(key.runid, key.layer)
+            / _segment(key.variant)
+            / str(key.z)
+            / str(key.x)
+            / f"{key.y}.{key.ext}"
+        )
+
+    def _read(self, key: TileKey) -> Optional[bytes]:
+        path = self.path_for(key)
+        try:
+            data = path.read_bytes()
+        except FileNotFoundError:
+            return None
+        except OSError as exc:
+            logger.warning("Tile cache read failed for %s: %s", path, exc)
+            return None
+
+        # Bump mtime so eviction treats this tile as recently used.
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return data
+
+    def get(self, key: TileKey) -> Optional[bytes]:
+        """Return cached tile bytes, or None on a miss."""
+        if not self.enabled:
+            return None
+
+        data = self._read(key)
+        with self._lock:
+            if data is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return data
+
+    def put(self, key: TileKey, data: bytes) -> None:
+        """Store tile bytes atomically, evicting old tiles if over budget."""
+        if not self.enabled:
+            return
+
+        path = self.path_for(key)
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            # Write to a temp file in the same directory and rename so that
+            # concurrent readers in other workers never see a partial tile.
+            fd, tmp_name = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+            try:
+                with os.fdopen(fd, "wb") as fh:
+                    fh.write(data)
+                os.replace(tmp_name, path)
+            except BaseException:
+                Path(tmp_name).unlink(missing_ok=True)
+                raise
+        except OSError as exc:
+            logger.warning("Tile cache write failed for %s: %s", path, exc)
+            return
+
+        with self._lock:
+            self.writes += 1
+            if self._approx_bytes is None:
+                self._approx_bytes = self._scan_size()
+            else:
+                self._approx_bytes += len(data)
+            over_budget = self._approx_bytes > self.max_bytes
+
+        if over_budget:
+            self.evict()
+
+    def get_or_render(
+        self,
+        key: TileKey,
+        render: Callable[[], bytes],
+    ) -> tuple[bytes, bool]:
+        """
+        Return ``(tile_bytes, hit)`` for *key*, rendering and storing on a miss.
+
+        Concurrent misses of the same tile, in this or another worker,
+        render it once (see ``singleflight.py``).  Exceptions raised by
+        *render* propagate unchanged and nothing is cached, so error
+        responses (404s etc.) are never persisted.
+        """
+        cached = self.get(key)
+        if cached is not None:
+            return cached, True
+
+        def fill() -> bytes:
+            data = render()
+            self.put(key, data)
+            return data
+
+        data = single_flight(
+            f"tile:{self.root}:{key}",
+            fill,
+            lookup=(lambda: self._read(key)) if self.enabled else None,
+        )
+        return data, False
+
+    def invalidate(self, runid: str, layer: Optional[str] = None) -> None:
+        """
+        Remove all cached tiles for a watershed, or for one layer of it.
+
+        *layer* may be a prefix of a layer path, e.g. ``"outputs/baseline"``
+        drops every variable of the baseline scenario.
+        """
+        if not self.enabled:
+            return
+
+        target = self._layer_dir(runid, layer)
+        shutil.rmtree(target, ignore_errors=True)
+        with self._lock:
+            self._approx_bytes = None
+        logger.info("Invalidated tile cache: runid=%s layer=%s", runid, layer or "*")
+
+    def clear(self) -> None:
+        """Remove every cached tile."""
+        if not self.enabled or not self.root.exists():
+            return
+        for child in self.root.iterdir():
+            if child.is_dir():
+                shutil.rmtree(child, ignore_errors=True)
+            else:
+                child.unlink(missing_ok=True)
+        with self._lock:
+            self._approx_bytes = 0
+
+    def _iter_files(self):
+        for dirpath, _dirnames, filenames in os.walk(self.root):
+            for name in filenames:
+                if name.endswith(".tmp"):
+                    continue
+                path = os.path.join(dirpath, name)
+                try:
+                    st = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                yield path, st.st_size, st.st_mtime
+
+    def _scan_size(self) -> int:
+        if not self.root.exists():
+            return 0
+        return sum(size for _path, size, _mtime in self._iter_files())
+
+    def evict(self) -> int:
+        """
+        Remove least recently used tiles until under the low-water mark.
+
+        Returns the number of files removed.  Safe to run concurrently from
+        several workers; files already removed by another worker are skipped.
+        """
+        if not self.enabled or not self.root.exists():
+            return 0
+
+        entries = sorted(self._iter_files(), key=lambda e: e[2])
+        total = sum(size for _path, size, _mtime in entries)
+        target = int(self.max_bytes * self.low_water)
+
+        removed = 0
+        for path, size, _mtime in entries:
+            if total <= target:
+                break
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+            removed += 1
+
+        with self._lock:
+            self._approx_bytes = total
+            self.evictions += removed
+
+        if removed:
+            logger.info("Tile cache evicted %d tiles (%d bytes remain)", removed, total)
+        return removed
+
+    def stats(self) -> dict:
+        """Return this process's hit/miss counters and the tracked cache size."""
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "hits": self.hits,
+                "misses": self.misses,
+                "writes": self.writes,
+                "evictions": self.evictions,
+                "bytes": self._approx_bytes,
+                "max_bytes": self.max_bytes,
+            }
+
+
+_default_cache: Optional[TileCache] = None
+
+
+def get_tile_cache() -> TileCache:
+    """
+    Get the process-wide tile cache.
+
+    Lazily initializes from the tile configuration on first call.
+    """
+    global _default_cache
+    if _default_cache is None:
+        cfg = get_tile_config()
+        _default_cache = TileCache(
+            root=cfg.cache_dir,
+            max_bytes=cfg.cache_max_mb * 1024 * 1024,
+        )
+    return _default_cache
+
+
+def reset_tile_cache() -> None:
+    """Reset the tile cache singleton (useful for testing)."""
+    global _default_cache
+    _default_cache = None
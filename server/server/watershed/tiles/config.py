@@ -0,0 +1,109 @@
+"""
+Runtime configuration for raster tile serving.
+
+Mirrors the loader configuration in ``loaders/config.py``: every knob has a
+sensible default and can be overridden through an environment variable so
+that production tuning lives in ``.env`` / ``compose.prod.yml``.
+"""
+
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Optional
+
+from server.watershed.loaders.config import _get_env_float, _get_env_int, _get_env_str
+
+
+@dataclass
+class TileConfig:
+    """
+    Configuration for the shared tile-serving infrastructure.
+
+    The on-disk tile caches are disabled unless ``cache_dir`` /
+    ``raw_cache_dir`` are set, so development containers and the test suite
+    always read and render fresh tiles.
+
+    Attributes:
+        cache_dir: Root directory of the rendered tile cache
+        cache_max_mb: Size budget of the rendered tile cache
+        raw_cache_dir: Root directory of the decoded tile array cache
+        raw_cache_max_mb: Size budget of the decoded tile array cache
+        reader_pool_size: Idle raster handles kept open per worker (0 disables)
+        reader_idle_seconds: Close pooled handles unused for this long
+        gdal_cachemax_mb: GDAL block cache size per worker
+        vsi_cache_mb: Read-ahead cache per open raster handle
+        webp_enabled: Serve lossless WebP to clients that accept it
+        metatile_sbs: Metatile size (N×N tiles per read) for SBS tiles
+        metatile_spatial: Metatile size for RHESSys spatial-input tiles
+        metatile_outputs: Metatile size for RHESSys output map tiles
+        stats_pixel_budget: Pixels read for approximate raster statistics
+            (0 always computes exact statistics)
+        render_processes: Render processes per worker (0 renders in the
+            request thread)
+        render_queue_depth: Renders that may wait for a busy render process
+        render_timeout: Seconds to wait for a render before answering 503
+    """
+    cache_dir: Optional[Path] = None
+    cache_max_mb: int = 2048
+    raw_cache_dir: Optional[Path] = None
+    raw_cache_max_mb: int = 4096
+    reader_pool_size: int = 32
+    reader_idle_seconds: int = 300
+    gdal_cachemax_mb: int = 256
+    vsi_cache_mb: int = 8
+    webp_enabled: bool = False
+    metatile_sbs: int = 1
+    metatile_spatial: int = 1
+    metatile_outputs: int = 1
+    stats_pixel_budget: int = 1024 * 1024
+    render_processes: int = 0
+    render_queue_depth: int = 4
+    render_timeout: float = 30.0
+
+    @classmethod
+    def from_environment(cls) -> "TileConfig":
+        """Create config from environment variables."""
+        cache_dir = _get_env_str("TILE_CACHE_DIR", "")
+        raw_cache_dir = _get_env_str("TILE_RAW_CACHE_DIR", "")
+        return cls(
+            cache_dir=Path(cache_dir) if cache_dir else None,
+            cache_max_mb=_get_env_int("TILE_CACHE_MAX_MB", cls.cache_max_mb),
+            raw_cache_dir=Path(raw_cache_dir) if raw_cache_dir else None,
+            raw_cache_max_mb=_get_env_int("TILE_RAW_CACHE_MAX_MB", cls.raw_cache_max_mb),
+            reader_pool_size=_get_env_int("TILE_READER_POOL_SIZE", cls.reader_pool_size),
+            reader_idle_seconds=_get_env_int("TILE_READER_IDLE_SECONDS", cls.reader_idle_seconds),
+            gdal_cachemax_mb=_get_env_int("TILE_GDAL_CACHEMAX_MB", cls.gdal_cachemax_mb),
+            vsi_cache_mb=_get_env_int("TILE_VSI_CACHE_MB", cls.vsi_cache_mb),
+            webp_enabled=_get_env_str("TILE_WEBP", "false").lower() in ("true", "1", "yes"),
+            metatile_sbs=_get_env_int("TILE_METATILE_SBS", cls.metatile_sbs),
+            metatile_spatial=_get_env_int("TILE_METATILE_SPATIAL", cls.metatile_spatial),
+            metatile_outputs=_get_env_int("TILE_METATILE_OUTPUTS", cls.metatile_outputs),
+            stats_pixel_budget=_get_env_int("TILE_STATS_PIXEL_BUDGET", cls.stats_pixel_budget),
+            render_processes=max(0, _get_env_int("TILE_RENDER_PROCESSES", cls.render_processes)),
+            render_queue_depth=max(0, _get_env_int("TILE_RENDER_QUEUE", cls.render_queue_depth)),
+            render_timeout=_get_env_float("TILE_RENDER_TIMEOUT", cls.render_timeout),
+        )
+
+    def metatile_size(self, family: str) -> int:
+        """Return the metatile size for a tile layer family (see ``layers.py``)."""
+        return getattr(self, f"metatile_{family}", 1)
+
+
+_default_config: Optional[TileConfig] = None
+
+
+def get_tile_config() -> TileConfig:
+    """
+    Get the default tile configuration.
+
+    Lazily initializes from environment on first call.
+    """
+    global _default_config
+    if _default_config is None:
+        _default_config = TileConfig.from_environment()
+    return _default_config
+
+
+def reset_tile_config() -> None:
+    """Reset the default configuration singleton (useful for testing)."""
+    global _default_config
+    _default_config = None
@@ -0,0 +1,181 @@
+"""
+Raw-data tiles and colormap LUT metadata for client-side colorization.
+
+Besides colorized PNGs, every raster tile layer can be served as quantized
+raw values (``.bin`` tiles): a little-endian, row-major 256×256 array of
+``uint8`` or ``uint16``.  Together with the layer's LUT metadata (built from
+the same ``colormap.py`` definitions the PNG renderer uses) the frontend can
+apply color modes, reversed ramps and range sliders locally, without another
+request.
+
+Quantization is set per layer, never per tile, so response headers do not
+depend on the pixels:
+
+  - categorical layers store class codes as is (``uint8``, or ``uint16``
+    when a code exceeds 254);
+  - continuous layers store ``round((value - offset) / scale)`` as
+    ``uint16`` over the layer's data range, values outside it are clipped.
+
+A continuous layer's range follows its current statistics, which change
+when they are refined or the raster is replaced.  Cached tiles are keyed by
+the quantization they were encoded with (see ``TileLayer.data_key``), so a
+payload is always served with its own headers.
+
+The largest value of the dtype marks nodata.  Headers:
+
+    X-Tile-Dtype    uint8 | uint16
+    X-Tile-Scale    value = stored * scale + offset
+    X-Tile-Offset
+    X-Tile-Nodata   stored value of nodata pixels
+"""
+
+from __future__ import annotations
+
+import hashlib
+from dataclasses import dataclass
+from typing import Mapping, Optional
+
+import numpy as np
+from django.http import HttpResponse
+
+from .raw import read_tile_array
+
+RGBA = tuple[int, int, int, int]
+
+RAW_CONTENT_TYPE = "application/octet-stream"
+
+# Exposed to cross-origin clients through CORS_EXPOSE_HEADERS.
+DATA_TILE_HEADERS = ("X-Tile-Dtype", "X-Tile-Scale", "X-Tile-Offset", "X-Tile-Nodata")
+
+_UINT16_STEPS = np.iinfo(np.uint16).max - 1
+
+
+@dataclass(frozen=True)
+class Quantization:
+    """How a layer's values are stored in its raw-data tiles."""
+    dtype: str
+    scale: float = 1.0
+    offset: float = 0.0
+    categorical: bool = True
+
+    @classmethod
+    def for_categories(cls, max_code: int) -> "Quantization":
+        """Class codes stored unchanged in the narrowest dtype that fits."""
+        return cls("uint8" if max_code < 255 else "uint16")
+
+    @classmethod
+    def for_range(cls, lo: float, hi: float) -> "Quantization":
+        """Continuous values in ``[lo, hi]`` stored as uint16 steps."""
+        span = hi - lo
+        scale = span / _UINT16_STEPS if span > 0 else 1.0
+        return cls("uint16", scale=scale, offset=float(lo), categorical=False)
+
+    @property
+    def token(self) -> str:
+        """Short digest identifying this quantization in cache keys."""
+        return hashlib.sha1(repr(self).encode()).hexdigest()[:12]
+
+    @property
+    def nodata(self) -> int:
+        return int(np.iinfo(self.dtype).max)
+
+    @property
+    def _wire_dtype(self) -> np.dtype:
+        return np.dtype(self.dtype).newbyteorder("<")
+
+    def encode(self, data: np.ma.MaskedArray) -> bytes:
+        """Quantize the first band of a masked tile array to raw bytes."""
+        band = data[0] if data.ndim == 3 else data
+        values = np.ma.getdata(band)
+        invalid = np.ma.getmaskarray(band)
+        if values.dtype.kind == "f":
+            invalid = invalid | ~np.isfinite(values)
+
+        with np.errstate(invalid="ignore"):
+            if self.categorical:
+                codes = np.rint(values) if values.dtype.kind == "f" else values
+                invalid = invalid | (codes < 0) | (codes >= self.nodata)
+                if values.dtype.kind == "f":
+                    invalid = invalid | (codes != values)
+                stored = codes.astype(self.dtype)
+            else:
+                steps = (values.astype(np.float64) - self.offset) / self.scale
+                stored = np.clip(np.rint(steps), 0, _UINT16_STEPS).astype(self.dtype)
+
+        stored[invalid] = self.nodata
+        return stored.astype(self._wire_dtype, copy=False).tobytes()
+
+    def empty_tile(self, size: int = 256) -> bytes:
+        """Return a tile in which every pixel is nodata."""
+        return np.full(size * size, self.nodata, dtype=self._wire_dtype).tobytes()
+
+    def headers(self) -> dict[str, str]:
+        return {
+            "X-Tile-Dtype": self.dtype,
+            "X-Tile-Scale": repr(self.scale),
+            "X-Tile-Offset": repr(self.offset),
+            "X-Tile-Nodata": str(self.nodata),
+        }
+
+    def metadata(self) -> dict:
+        return {
+            "dtype": self.dtype,
+            "scale": self.scale,
+            "offset": self.offset,
+            "nodata": self.nodata,
+        }
+
+
+def get_tile_data(
+    url: str,
+    z: int,
+    x: int,
+    y: int,
+    quantization: Quantization,
+    family: Optional[str] = None,
+) -> bytes:
+    """Return the raw-data tile (z, x, y) of a raster source."""
+    return quantization.encode(read_tile_array(url, z, x, y, family=family))
+
+
+def data_tile_response(payload: bytes, quantization: Quantization) -> HttpResponse:
+    """Wrap a raw-data tile in a response carrying its quantization headers."""
+    response = HttpResponse(payload, content_type=RAW_CONTENT_TYPE)
+    for name, value in quantization.headers().items():
+        response[name] = value
+    return response
+
+
+def _hex(rgba: RGBA) -> str:
+    return "#{:02X}{:02X}{:02X}{:02X}".format(*rgba)
+
+
+def categorical_lut(colormap: Mapping[int, RGBA], quantization: Quantization) -> dict:
+    """
+    LUT metadata for a class-coded layer: one ``#RRGGBBAA`` colour per
+    stored value.  Values without an entry are transparent.
+    """
+    return {
+        "type": "categorical",
+        **quantization.metadata(),
+        "colors": {str(int(value)): _hex(rgba) for value, rgba in colormap.items()},
+    }
+
+
+def continuous_lut(
+    colormap: Mapping[int, RGBA],
+    lo: float,
+    hi: float,
+    quantization: Quantization,
+) -> dict:
+    """
+    LUT metadata for a continuous layer: a 256-entry palette applied to
+    ``[lo, hi]``, exactly as the PNG renderer does (value ``v`` uses entry
+    ``floor((clip(v, lo, hi) - lo) / (hi - lo) * 255)``).
+    """
+    return {
+        "type": "continuous",
+        **quantization.metadata(),
+        "range": [lo, hi],
+        "colors": [_hex(colormap[i]) for i in range(256)],
+    }
@@ -0,0 +1,155 @@
+"""
+Raster footprint index.
+
+Small watersheds cover a handful of tiles, so most tile requests at the
+edges of the map fall outside the raster.  Without an index every such
+request opens the (often remote) GeoTIFF only to learn that the tile is
+empty.  The ``RasterFootprint`` table stores each raster's bounds and a
+coarse valid-data footprint in EPSG:4326; tile views consult it first and
+return the shared transparent tile for tiles that miss the footprint.
+
+Footprints are computed from the raster's mask at reduced resolution
+(overviews when available) and buffered by two coarse pixels, so the index
+can only err on the side of rendering a tile.  Rasters without an entry are
+always rendered.
+"""
+
+from __future__ import annotations
+
+import json
+import logging
+import math
+
+import morecantile
+from django.contrib.gis.geos import GEOSGeometry, MultiPolygon, Polygon
+from django.db import DatabaseError
+
+from server.watershed.shared_cache import SharedCache
+
+logger = logging.getLogger("watershed.tiles")
+
+# Longest side of the mask grid the footprint is traced from.
+_MASK_SIZE = 512
+
+_WEB_MERCATOR = morecantile.tms.get("WebMercatorQuad")
+
+# (runid, rel_path) → footprint geometry, or None when no entry exists.
+_footprint_cache = SharedCache("footprint", ttl=300)
+
+_MISSING = object()
+
+
+def _as_multipolygon(geom: GEOSGeometry) -> MultiPolygon:
+    if isinstance(geom, MultiPolygon):
+        return geom
+    if isinstance(geom, Polygon):
+        return MultiPolygon(geom, srid=geom.srid)
+    polygons = [g for g in geom if isinstance(g, Polygon)]
+    return MultiPolygon(*polygons, srid=geom.srid)
+
+
+def compute_footprint(source: str) -> tuple[Polygon, MultiPolygon]:
+    """
+    Return ``(bounds, footprint)`` in EPSG:4326 for a raster path or URL.
+
+    ``footprint`` is the union of valid-data regions of the dataset mask,
+    traced on a grid of at most ``_MASK_SIZE`` pixels per side.
+    """
+    import rasterio
+    from rasterio.features import shapes
+    from rasterio.warp import transform_bounds, transform_geom
+
+    with rasterio.open(source) as ds:
+        west, south, east, north = transform_bounds(ds.crs, "EPSG:4326", *ds.bounds)
+        bounds = Polygon.from_bbox((west, south, east, north))
+        bounds.srid = 4326
+
+        factor = max(1, math.ceil(max(ds.width, ds.height) / _MASK_SIZE))
+        out_h = math.ceil(ds.height / factor)
+        out_w = math.ceil(ds.width / factor)
+        mask = ds.dataset_mask(out_shape=(out_h, out_w))
+        transform = ds.transform * ds.transform.scale(ds.width / out_w, ds.height / out_h)
+        pixel = max(abs(transform.a), abs(transform.e))
+
+        if not mask.any():
+            return bounds, MultiPolygon(srid=4326)
+
+        if mask.all():
+            native = Polygon.from_bbox(tuple(ds.bounds))
+        else:
+            parts = [
+                GEOSGeometry(json.dumps(geom))
+                for geom, _value in shapes(mask, mask=mask > 0, transform=transform)
+            ]
+            native = MultiPolygon(*parts).unary_union
+        native = native.buffer(2 * pixel).simplify(pixel / 2)
+
+        footprint = GEOSGeometry(
+            json.dumps(transform_geom(ds.crs, "EPSG:4326", json.loads(native.json))),
+            srid=4326,
+        )
+    return bounds, _as_multipolygon(footprint)
+
+
+def record_footprint(runid: str, rel_path: str, source: str) -> None:
+    """Compute and store the footprint of a raster, replacing any old entry."""
+    from server.watershed.models import RasterFootprint
+
+    bounds, footprint = compute_footprint(source)
+    RasterFootprint.objects.update_or_create(
+        runid=runid,
+        rel_path=rel_path,
+        defaults={"bounds": bounds, "footprint": footprint},
+    )
+    _footprint_cache.delete((runid, rel_path))
+
+
+def has_footprint(runid: str, rel_path: str) -> bool:
+    from server.watershed.models import RasterFootprint
+
+    return RasterFootprint.objects.filter(runid=runid, rel_path=rel_path).exists()
+
+
+def _load_footprint(runid: str, rel_path: str):
+    key = (runid, rel_path)
+    cached = _footprint_cache.get(key, _MISSING)
+    if cached is not _MISSING:
+        return cached
+
+    from server.watershed.models import RasterFootprint
+
+    try:
+        row = (
+            RasterFootprint.objects
+            .filter(runid=runid, rel_path=rel_path)
+            .only("footprint")
+            .first()
+        )
+    except DatabaseError as exc:
+        logger.warning("Footprint lookup failed for %s %s: %s", runid, rel_path, exc)
+        return None
+
+    footprint = row.footprint if row is not None else None
+    _footprint_cache.set(key, footprint)
+    return footprint
+
+
+def tile_outside_footprint(runid: str, rel_path: str, z: int, x: int, y: int) -> bool:
+    """
+    Return True if tile (z, x, y) certainly holds no data for the raster.
+
+    Rasters without a recorded footprint return False so they are rendered.
+    """
+    footprint = _load_footprint(runid, rel_path)
+    if footprint is None:
+        return False
+    b = _WEB_MERCATOR.bounds(morecantile.Tile(x, y, z))
+    tile = Polygon.from_bbox((b.left, b.bottom, b.right, b.top))
+    tile.srid = 4326
+    return not footprint.intersects(tile)
+
+
+def clear_footprint_cache() -> None:
+    """Drop cached footprints (useful for testing)."""
+    _footprint_cache.clear()
+
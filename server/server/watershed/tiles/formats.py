@@ -0,0 +1,135 @@
+"""
+Tile output formats shared by the raster tile views.
+
+  - Paletted PNG: categorical layers (SBS, landuse, streams, ...) have a
+    handful of classes, so their tiles are written as 8-bit indexed PNGs with
+    a ``tRNS`` chunk for transparency instead of 32-bit RGBA.  The encoder is
+    plain ``zlib`` and skips GDAL entirely.
+  - Lossless WebP: served instead of PNG to clients whose ``Accept`` header
+    lists ``image/webp``, when ``TILE_WEBP`` is enabled.
+"""
+
+from __future__ import annotations
+
+import struct
+import zlib
+from dataclasses import dataclass
+from functools import lru_cache
+
+import numpy as np
+from django.http import HttpResponse
+from django.utils.cache import patch_vary_headers
+
+from .config import get_tile_config
+
+
+def _png_chunk(tag: bytes, data: bytes) -> bytes:
+    crc = zlib.crc32(tag + data) & 0xFFFFFFFF
+    return struct.pack(">I", len(data)) + tag + data + struct.pack(">I", crc)
+
+
+def build_transparent_png(width: int = 256, height: int = 256) -> bytes:
+    """Build a minimal fully-transparent RGBA PNG with no external deps."""
+    raw_row = b"\x00" + b"\x00\x00\x00\x00" * width  # filter-byte + RGBA
+    raw = raw_row * height
+    compressed = zlib.compress(raw)
+
+    ihdr = struct.pack(">IIBBBBB", width, height, 8, 6, 0, 0, 0)
+    return (
+        b"\x89PNG\r\n\x1a\n"
+        + _png_chunk(b"IHDR", ihdr)
+        + _png_chunk(b"IDAT", compressed)
+        + _png_chunk(b"IEND", b"")
+    )
+
+
+def encode_paletted_png(indices: np.ndarray, palette: np.ndarray, level: int = 6) -> bytes:
+    """
+    Encode an (H, W) array of palette indices as an 8-bit indexed PNG.
+
+    *palette* is an (N, 4) uint8 RGBA table with N <= 256; its alpha column
+    becomes the ``tRNS`` chunk (trailing opaque entries are omitted, as the
+    PNG spec allows).
+    """
+    height, width = indices.shape
+    if len(palette) > 256:
+        raise ValueError(f"PNG palettes hold at most 256 entries, got {len(palette)}")
+
+    # Filter type 0 (None) per scanline; it compresses best for indexed data.
+    raw = np.zeros((height, width + 1), dtype=np.uint8)
+    raw[:, 1:] = indices
+
+    alpha = palette[:, 3]
+    opaque = np.flatnonzero(alpha != 255)
+    trns = alpha[: opaque[-1] + 1].tobytes() if opaque.size else b""
+
+    ihdr = struct.pack(">IIBBBBB", width, height, 8, 3, 0, 0, 0)
+    return (
+        b"\x89PNG\r\n\x1a\n"
+        + _png_chunk(b"IHDR", ihdr)
+        + _png_chunk(b"PLTE", np.ascontiguousarray(palette[:, :3]).tobytes())
+        + (_png_chunk(b"tRNS", trns) if trns else b"")
+        + _png_chunk(b"IDAT", zlib.compress(raw.tobytes(), level))
+        + _png_chunk(b"IEND", b"")
+    )
+
+
+@dataclass(frozen=True)
+class TileFormat:
+    """An encoded tile format: GDAL driver name, file extension, MIME type."""
+    driver: str
+    ext: str
+    content_type: str
+
+
+PNG = TileFormat("PNG", "png", "image/png")
+WEBP = TileFormat("WEBP", "webp", "image/webp")
+
+
+def negotiate_tile_format(accept: str) -> TileFormat:
+    """
+    Pick the tile format for a request's ``Accept`` header.
+
+    WebP is only chosen when enabled with ``TILE_WEBP`` and explicitly listed
+    by the client (wildcards such as ``*/*`` do not count); PNG otherwise.
+    """
+    if not get_tile_config().webp_enabled:
+        return PNG
+    for part in accept.split(","):
+        media_type, *params = part.split(";")
+        if media_type.strip().lower() != WEBP.content_type:
+            continue
+        quality = 1.0
+        for param in params:
+            name, _, value = param.partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        return WEBP if quality > 0 else PNG
+    return PNG
+
+
+# Returned for tiles that hold no data for a layer.
+TRANSPARENT_PNG: bytes = build_transparent_png()
+
+
+@lru_cache(maxsize=None)
+def transparent_tile(fmt: TileFormat) -> bytes:
+    """Return the fully-transparent tile encoded as *fmt*."""
+    if fmt == PNG:
+        return TRANSPARENT_PNG
+    from .render import encode_rgba
+
+    return encode_rgba(np.zeros((256, 256, 4), dtype=np.uint8), img_format=fmt.driver, LOSSLESS=True)
+
+
+def transparent_tile_response(fmt: TileFormat) -> HttpResponse:
+    """
+    Response for a tile that holds no data, in the negotiated format like a
+    rendered tile (whose ETag variant and ``Vary: Accept`` it shares).
+    """
+    response = HttpResponse(transparent_tile(fmt), content_type=fmt.content_type)
+    patch_vary_headers(response, ("Accept",))
+    return response
@@ -0,0 +1,174 @@
+"""
+Identity and rendering of the raster tile layers served by the API.
+
+The tile views and offline tooling (cache seeding) must agree on how a
+layer is named in the tile cache and how its tiles are rendered, otherwise
+seeded tiles would never be hit.  :class:`TileLayer` is the single place
+that defines both.
+
+Layer families:
+  - ``sbs``:      soil burn severity map, one variant per ``ColorMode``
+  - ``spatial``:  registered RHESSys spatial input (``name`` = filename)
+  - ``outputs``:  RHESSys output map (``name`` = ``"<scenario>/<variable>"``)
+"""
+
+from __future__ import annotations
+
+import logging
+from dataclasses import dataclass
+from typing import Optional
+
+from .cache import TileKey, get_tile_cache
+from .data import Quantization
+
+logger = logging.getLogger("watershed.tiles")
+
+SBS = "sbs"
+SPATIAL = "spatial"
+OUTPUTS = "outputs"
+
+FAMILIES = (SBS, SPATIAL, OUTPUTS)
+
+
+@dataclass(frozen=True)
+class TileLayer:
+    """
+    One renderable tile layer of a watershed.
+
+    Instances are small and picklable so they can be shipped to worker
+    processes.
+    """
+    runid: str
+    family: str
+    name: str = ""
+    variant: str = "default"
+
+    @classmethod
+    def sbs(cls, runid: str, mode) -> "TileLayer":
+        return cls(runid, SBS, "", mode.value)
+
+    @classmethod
+    def spatial(cls, runid: str, filename: str) -> "TileLayer":
+        return cls(runid, SPATIAL, filename)
+
+    @classmethod
+    def output(cls, runid: str, scenario: str, variable: str) -> "TileLayer":
+        return cls(runid, OUTPUTS, f"{scenario}/{variable}")
+
+    @property
+    def cache_layer(self) -> str:
+        """Layer path used in :class:`TileKey`."""
+        return f"{self.family}/{self.name}" if self.name else self.family
+
+    def key(self, z: int, x: int, y: int, ext: str = "png") -> TileKey:
+        return TileKey(self.runid, self.cache_layer, self.variant, z, x, y, ext)
+
+    def data_key(self, z: int, x: int, y: int, quantization: Quantization) -> TileKey:
+        """
+        Cache key of the raw-data tile encoded with *quantization*, shared by
+        all rendering variants.
+        """
+        return TileKey(self.runid, self.cache_layer, f"data-{quantization.token}", z, x, y, "bin")
+
+    @property
+    def rel_path(self) -> str:
+        """Source raster path relative to the run's ``download/`` endpoint."""
+        if self.family == SBS:
+            from .mirror import SBS_REL_PATH
+
+            return SBS_REL_PATH
+        if self.family == SPATIAL:
+            from server.watershed.rhessys_spatial.discovery import SPATIAL_INPUTS_SUBPATH
+
+            return f"{SPATIAL_INPUTS_SUBPATH}/{self.name}"
+        if self.family == OUTPUTS:
+            from server.watershed.rhessys_outputs.discovery import MAPS_SUBPATH
+            from server.watershed.rhessys_outputs.registry import get_variable
+
+            scenario, variable = self.name.split("/", 1)
+            var_meta = get_variable(variable)
+            filename = var_meta.filename if var_meta is not None else variable
+            return f"{MAPS_SUBPATH}/{scenario}/{filename}"
+        raise ValueError(f"Unknown tile layer family: {self.family}")
+
+    def render(self, z: int, x: int, y: int) -> bytes:
+        """
+        Render one PNG tile exactly as the corresponding tile view does.
+
+        Raises the same exceptions as the underlying ``get_tile_png``
+        (``TileOutsideBounds``, ``RasterioIOError``) and ``ValueError`` for a
+        layer that is not registered.
+        """
+        if self.family == SBS:
+            from server.watershed.sbs_raster.color_map import ColorMode
+            from server.watershed.sbs_raster.tile import get_tile_png
+            from .mirror import SBS_REL_PATH, mirrored_or_remote, remote_url
+
+            url = mirrored_or_remote(
+                self.runid, SBS_REL_PATH, remote_url(self.runid, SBS_REL_PATH),
+            )
+            return get_tile_png(url, z, x, y, ColorMode(self.variant))
+
+        if self.family == SPATIAL:
+            from server.watershed.rhessys_spatial.discovery import get_tile_source
+            from server.watershed.rhessys_spatial.registry import get_meta
+            from server.watershed.rhessys_spatial.tile import get_render_kwargs, get_tile_png
+
+            meta = get_meta(self.name)
+            if meta is None:
+                raise ValueError(f"Unregistered RHESSys spatial input: {self.name}")
+            url = get_tile_source(self.runid, self.name)
+            return get_tile_png(url, z, x, y, **get_render_kwargs(meta))
+
+        if self.family == OUTPUTS:
+            from server.watershed.rhessys_outputs.discovery import get_map_tile_source
+            from server.watershed.rhessys_outputs.registry import get_variable, is_change_scenario
+            from server.watershed.rhessys_outputs.tile import get_tile_png
+
+            scenario, variable = self.name.split("/", 1)
+            var_meta = get_variable(variable)
+            if var_meta is None:
+                raise ValueError(f"Unknown RHESSys output variable: {variable}")
+            url = get_map_tile_source(self.runid, scenario, var_meta.filename)
+            return get_tile_png(url, z, x, y, is_change=is_change_scenario(scenario))
+
+        raise ValueError(f"Unknown tile layer family: {self.family}")
+
+
+def raster_cache_layer(rel_path: str) -> Optional[str]:
+    """
+    Return the tile cache layer rendered from a run-relative raster path
+    (every variant of it), or None for a raster no tile layer serves.
+    """
+    from server.watershed.rhessys_outputs.discovery import MAPS_SUBPATH
+    from server.watershed.rhessys_outputs.registry import VARIABLE_BY_FILENAME
+    from server.watershed.rhessys_spatial.discovery import SPATIAL_INPUTS_SUBPATH
+    from .mirror import SBS_REL_PATH
+
+    if rel_path == SBS_REL_PATH:
+        return SBS
+    if rel_path.startswith(f"{SPATIAL_INPUTS_SUBPATH}/"):
+        return f"{SPATIAL}/{rel_path[len(SPATIAL_INPUTS_SUBPATH) + 1:]}"
+    if rel_path.startswith(f"{MAPS_SUBPATH}/"):
+        scenario, _, filename = rel_path[len(MAPS_SUBPATH) + 1:].partition("/")
+        var_meta = VARIABLE_BY_FILENAME.get(filename)
+        return f"{OUTPUTS}/{scenario}/{var_meta.id if var_meta is not None else filename}"
+    return None
+
+
+def invalidate_raster(runid: str, rel_path: str) -> None:
+    """
+    Drop the cached tiles rendered from a raster whose content changed.
+
+    Decoded arrays are keyed by the source revision (see ``raw.py``); the
+    remote revision is probed again so they are re-read as well.
+    """
+    from server.watershed.versioning import forget_source_revision
+    from .mirror import remote_url
+
+    forget_source_revision(remote_url(runid, rel_path))
+    layer = raster_cache_layer(rel_path)
+    if layer is None:
+        logger.warning("No tile layer is rendered from %s %s", runid, rel_path)
+        return
+    get_tile_cache().invalidate(runid, layer)
@@ -0,0 +1,242 @@
+"""
+Local mirror of upstream WEPPcloud rasters as Cloud-Optimized GeoTIFFs.
+
+Tile rendering otherwise reads every GeoTIFF straight from the WEPPcloud
+download endpoint, so each tile pays for remote HTTP round-trips and rasters
+that are not internally tiled are read in full.  The mirror fetches each
+raster once into ``LOADER_DATA_DIR`` and rewrites it as a tiled COG with
+internal overviews, so low-zoom tiles read overviews instead of
+full-resolution pixels.
+
+Layout (``rel_path`` is the path under the run's ``download/`` endpoint)::
+
+    <LOADER_DATA_DIR>/rasters/<runid>/<rel_path>        (the COG)
+    <LOADER_DATA_DIR>/rasters/<runid>/<rel_path>.json   (upstream revision)
+
+The sidecar records the upstream ETag / Last-Modified / Content-Length so a
+re-run only re-downloads rasters whose upstream revision changed.
+"""
+
+from __future__ import annotations
+
+import json
+import logging
+import os
+import tempfile
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Optional
+
+import requests
+
+from server.watershed.loaders.config import get_config, resolve_run_base_url
+
+logger = logging.getLogger("watershed.tiles")
+
+SBS_REL_PATH = "disturbed/sbs_4class.tif"
+
+# Overview resampling: categorical rasters must never blend class codes.
+RESAMPLING_NEAREST = "NEAREST"
+RESAMPLING_AVERAGE = "AVERAGE"
+
+_COG_OPTIONS = {
+    "COMPRESS": "DEFLATE",
+    "PREDICTOR": "YES",
+    "BLOCKSIZE": 256,
+    "OVERVIEWS": "IGNORE_EXISTING",
+    "BIGTIFF": "IF_SAFER",
+}
+
+
+@dataclass
+class MirrorResult:
+    """Outcome of mirroring a single raster."""
+    runid: str
+    rel_path: str
+    status: str  # "mirrored" | "unchanged" | "missing" | "error"
+    path: Optional[Path] = None
+    bytes: int = 0
+    detail: str = ""
+
+
+def mirror_root() -> Path:
+    """Return the directory that holds mirrored rasters."""
+    return get_config().local_data_dir / "rasters"
+
+
+def remote_url(runid: str, rel_path: str) -> str:
+    """Build the WEPPcloud download URL for a run-relative raster path."""
+    return f"{resolve_run_base_url(runid)}/download/{rel_path}"
+
+
+def mirror_path(runid: str, rel_path: str) -> Optional[Path]:
+    """
+    Return the local mirror path for a raster, or None if the path would
+    escape the mirror root (runid / rel_path come from request URLs).
+    """
+    root = mirror_root().resolve()
+    path = (root / runid / rel_path).resolve()
+    if not path.is_relative_to(root):
+        return None
+    return path
+
+
+def get_local_raster(runid: str, rel_path: str) -> Optional[Path]:
+    """Return the mirrored COG for a raster if one exists."""
+    path = mirror_path(runid, rel_path)
+    if path is not None and path.is_file():
+        return path
+    return None
+
+
+def mirrored_or_remote(runid: str, rel_path: str, url: str) -> str:
+    """Return the local COG path when mirrored, otherwise the remote *url*."""
+    local = get_local_raster(runid, rel_path)
+    return str(local) if local is not None else url
+
+
+def read_revision(runid: str, rel_path: str) -> Optional[dict]:
+    """Return the recorded upstream revision for a mirrored raster."""
+    path = mirror_path(runid, rel_path)
+    if path is None:
+        return None
+    sidecar = path.with_name(path.name + ".json")
+    try:
+        return json.loads(sidecar.read_text())
+    except (OSError, ValueError):
+        return None
+
+
+def _upstream_revision(response: requests.Response) -> dict:
+    headers = response.headers
+    return {
+        "etag": headers.get("ETag"),
+        "last_modified": headers.get("Last-Modified"),
+        "content_length": headers.get("Content-Length"),
+    }
+
+
+def _same_revision(recorded: Optional[dict], upstream: dict) -> bool:
+    """Compare revisions by ETag, falling back to Last-Modified + size."""
+    if not recorded:
+        return False
+    if upstream["etag"]:
+        return recorded.get("etag") == upstream["etag"]
+    if upstream["last_modified"] or upstream["content_length"]:
+        return (
+            recorded.get("last_modified") == upstream["last_modified"]
+            and recorded.get("content_length") == upstream["content_length"]
+        )
+    return False
+
+
+def _convert_to_cog(src_path: Path, dst_path: Path, resampling: str) -> None:
+    """Rewrite *src_path* as a tiled COG with internal overviews."""
+    import rasterio.shutil
+
+    rasterio.shutil.copy(
+        str(src_path),
+        str(dst_path),
+        driver="COG",
+        OVERVIEW_RESAMPLING=resampling,
+        **_COG_OPTIONS,
+    )
+
+
+def mirror_raster(
+    runid: str,
+    rel_path: str,
+    session: requests.Session,
+    resampling: str = RESAMPLING_NEAREST,
+    force: bool = False,
+) -> MirrorResult:
+    """
+    Fetch one upstream raster and store it locally as a COG.
+
+    The download is skipped when the upstream ETag (or Last-Modified + size)
+    matches the recorded revision, unless *force* is set.  The COG is
+    written to a temp file and renamed into place so tile requests served
+    concurrently never see a partial file.
+    """
+    path = mirror_path(runid, rel_path)
+    if path is None:
+        return MirrorResult(runid, rel_path, "error", detail="invalid path")
+
+    url = remote_url(runid, rel_path)
+    try:
+        response = session.get(url, timeout=120, stream=True)
+    except requests.RequestException as exc:
+        return MirrorResult(runid, rel_path, "error", detail=str(exc))
+
+    with response:
+        if response.status_code == 404:
+            return MirrorResult(runid, rel_path, "missing")
+        if response.status_code != 200:
+            return MirrorResult(
+                runid, rel_path, "error",
+                detail=f"upstream returned {response.status_code}",
+            )
+
+        upstream = _upstream_revision(response)
+        if not force and path.is_file() and _same_revision(read_revision(runid, rel_path), upstream):
+            return MirrorResult(
+                runid, rel_path, "unchanged", path=path, bytes=path.stat().st_size,
+            )
+
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with tempfile.TemporaryDirectory(dir=path.parent) as tmp_dir:
+            raw_path = Path(tmp_dir) / "upstream.tif"
+            cog_path = Path(tmp_dir) / "cog.tif"
+            try:
+                with open(raw_path, "wb") as fh:
+                    for chunk in response.iter_content(chunk_size=1024 * 1024):
+                        if chunk:
+                            fh.write(chunk)
+                _convert_to_cog(raw_path, cog_path, resampling)
+            except Exception as exc:
+                logger.warning("Failed to mirror %s: %s", url, exc)
+                return MirrorResult(runid, rel_path, "error", detail=str(exc))
+
+            os.replace(cog_path, path)
+
+    revision = {
+        **upstream,
+        "url": url,
+        "mirrored_at": datetime.now(timezone.utc).isoformat(),
+    }
+    sidecar = path.with_name(path.name + ".json")
+    sidecar.write_text(json.dumps(revision, indent=2))
+
+    size = path.stat().st_size
+    logger.info("Mirrored %s -> %s (%d bytes)", url, path, size)
+    return MirrorResult(runid, rel_path, "mirrored", path=path, bytes=size)
+
+
+def list_mirror_targets(runid: str) -> list[tuple[str, str]]:
+    """
+    List ``(rel_path, resampling)`` for every tile-served raster of a run.
+
+    Covers the SBS map, every registered RHESSys spatial input found by
+    discovery (unregistered files are not tile-served), and every discovered
+    RHESSys output scenario/variable.
+    """
+    from server.watershed.rhessys_outputs.discovery import MAPS_SUBPATH, list_output_map_files
+    from server.watershed.rhessys_spatial.discovery import (
+        SPATIAL_INPUTS_SUBPATH,
+        discover_spatial_inputs,
+    )
+    from server.watershed.rhessys_spatial.registry import get_meta
+
+    targets: list[tuple[str, str]] = [(SBS_REL_PATH, RESAMPLING_NEAREST)]
+
+    for f in discover_spatial_inputs(runid) or []:
+        if get_meta(f["filename"]) is None:
+            continue
+        resampling = RESAMPLING_AVERAGE if f["type"] == "continuous" else RESAMPLING_NEAREST
+        targets.append((f"{SPATIAL_INPUTS_SUBPATH}/{f['filename']}", resampling))
+
+    for scenario, filename in list_output_map_files(runid):
+        targets.append((f"{MAPS_SUBPATH}/{scenario}/{filename}", RESAMPLING_AVERAGE))
+
+    return targets
@@ -0,0 +1,251 @@
+"""
+Per-worker pool of open rio-tiler readers.
+
+Opening a GeoTIFF parses its header and IFDs and, for remote rasters,
+negotiates a fresh HTTP connection.  Doing that for every tile is wasted
+work because consecutive tiles almost always come from the same raster, so
+tile renderers borrow an already-open :class:`rio_tiler.io.Reader` from this
+pool and hand it back when done.  A returned reader keeps its parsed header
+and GDAL's block cache stays warm for the next tile.
+
+rasterio dataset handles are not thread-safe, so a reader is lent to exactly
+one thread at a time; a second concurrent request for the same raster opens
+another handle.  Only idle handles are pooled.  They are closed when they
+exceed the idle timeout or when the pool is full (least recently used
+first).
+
+Memory is bounded by the GDAL environment applied once per process by
+:func:`configure_gdal_env`: the global block cache (``GDAL_CACHEMAX``) plus
+at most ``VSI_CACHE_SIZE`` per open handle.
+"""
+
+from __future__ import annotations
+
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Callable, Iterator, Optional
+
+from rio_tiler.errors import RioTilerError
+from rio_tiler.io import Reader
+
+from .config import get_tile_config
+
+logger = logging.getLogger("watershed.tiles")
+
+_gdal_configured = False
+
+
+def configure_gdal_env() -> None:
+    """
+    Apply process-wide GDAL options tuned for tile serving.
+
+    Values already present in the environment win, so operators can override
+    any option in ``.env``.  Must run before GDAL first touches its block
+    cache, which is why the reader pool calls it on construction.
+    """
+    global _gdal_configured
+    if _gdal_configured:
+        return
+
+    cfg = get_tile_config()
+    options = {
+        "GDAL_CACHEMAX": str(cfg.gdal_cachemax_mb),
+        "VSI_CACHE": "TRUE",
+        "VSI_CACHE_SIZE": str(cfg.vsi_cache_mb * 1024 * 1024),
+        # Remote reads: never list the parent directory, only probe .tif
+        # URLs, and fetch neighbouring blocks in a single ranged request.
+        "GDAL_DISABLE_READDIR_ON_OPEN": "EMPTY_DIR",
+        "CPL_VSIL_CURL_ALLOWED_EXTENSIONS": ".tif,.tiff",
+        "GDAL_HTTP_MULTIRANGE": "YES",
+        "GDAL_HTTP_MERGE_CONSECUTIVE_RANGES": "YES",
+    }
+    for name, value in options.items():
+        os.environ.setdefault(name, value)
+    _gdal_configured = True
+
+
+@dataclass
+class _IdleReader:
+    key: tuple
+    reader: Reader
+    last_used: float
+
+
+def _source_key(url: str) -> tuple:
+    """
+    Key a raster source.
+
+    Local files include their mtime so that a raster replaced by the mirror
+    (``os.replace``) is reopened rather than served from the old inode.
+    """
+    if "://" in url:
+        return (url,)
+    try:
+        return (url, os.stat(url).st_mtime_ns)
+    except OSError:
+        return (url,)
+
+
+class ReaderPool:
+    """
+    Thread-safe LRU pool of idle rio-tiler readers keyed by source URL.
+
+    A pool constructed with ``max_handles=0`` is disabled: every borrow opens
+    a fresh reader and closes it afterwards, matching the unpooled behaviour.
+    """
+
+    def __init__(
+        self,
+        max_handles: int,
+        idle_seconds: float,
+        opener: Callable[[str], Reader] = Reader,
+    ):
+        self.max_handles = max_handles
+        self.idle_seconds = idle_seconds
+        self._opener = opener
+        self._idle: OrderedDict[int, _IdleReader] = OrderedDict()
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+        self.hits = 0
+        self.misses = 0
+        self.closed = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_handles > 0
+
+    def _take_idle(self, key: tuple) -> tuple[Optional[Reader], list[Reader]]:
+        """Pop the most recent idle reader for *key* and collect expired ones."""
+        now = time.monotonic()
+        expired: list[Reader] = []
+        found: Optional[Reader] = None
+        with self._lock:
+            if os.getpid() != self._pid:
+                # Forked child: handles belong to the parent process.
+                self._idle.clear()
+                self._pid = os.getpid()
+            for entry_id in list(self._idle):
+                entry = self._idle[entry_id]
+                if now - entry.last_used > self.idle_seconds:
+                    del self._idle[entry_id]
+                    expired.append(entry.reader)
+            for entry_id in reversed(self._idle):
+                if self._idle[entry_id].key == key:
+                    found = self._idle.pop(entry_id).reader
+                    break
+            if found is not None:
+                self.hits += 1
+            else:
+                self.misses += 1
+        return found, expired
+
+    def _give_back(self, key: tuple, reader: Reader) -> None:
+        overflow: list[Reader] = []
+        with self._lock:
+            self._idle[id(reader)] = _IdleReader(key, reader, time.monotonic())
+            while len(self._idle) > self.max_handles:
+                _entry_id, entry = self._idle.popitem(last=False)
+                overflow.append(entry.reader)
+        self._close(overflow)
+
+    def _close(self, readers: list[Reader]) -> None:
+        for reader in readers:
+            try:
+                reader.close()
+            except Exception as exc:
+                logger.debug("Error closing pooled reader: %s", exc)
+        if readers:
+            with self._lock:
+                self.closed += len(readers)
+
+    @contextmanager
+    def reader(self, url: str) -> Iterator[Reader]:
+        """
+        Borrow an open reader for *url* for the duration of the block.
+
+        The reader goes back to the pool if the block succeeds or raises a
+        rio-tiler error (e.g. ``TileOutsideBounds``, which says nothing about
+        the handle).  Any other error discards it, since the handle may be
+        left in a bad state by a failed read.
+        """
+        if not self.enabled:
+            with self._opener(url) as src:
+                yield src
+            return
+
+        configure_gdal_env()
+        key = _source_key(url)
+        src, expired = self._take_idle(key)
+        self._close(expired)
+        if src is None:
+            src = self._opener(url)
+
+        try:
+            yield src
+        except RioTilerError:
+            self._give_back(key, src)
+            raise
+        except BaseException:
+            self._close([src])
+            raise
+        else:
+            self._give_back(key, src)
+
+    def clear(self) -> None:
+        """Close every idle reader."""
+        with self._lock:
+            readers = [entry.reader for entry in self._idle.values()]
+            self._idle.clear()
+        self._close(readers)
+
+    def stats(self) -> dict:
+        """Return this process's reuse counters and idle handle count."""
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "hits": self.hits,
+                "misses": self.misses,
+                "closed": self.closed,
+                "idle": len(self._idle),
+                "max_handles": self.max_handles,
+            }
+
+
+_default_pool: Optional[ReaderPool] = None
+_default_pool_lock = threading.Lock()
+
+
+def get_reader_pool() -> ReaderPool:
+    """
+    Get the process-wide reader pool.
+
+    Lazily initializes from the tile configuration on first call.
+    """
+    global _default_pool
+    if _default_pool is None:
+        with _default_pool_lock:
+            if _default_pool is None:
+                cfg = get_tile_config()
+                _default_pool = ReaderPool(
+                    max_handles=cfg.reader_pool_size,
+                    idle_seconds=cfg.reader_idle_seconds,
+                )
+    return _default_pool
+
+
+def reset_reader_pool() -> None:
+    """Close pooled readers and reset the singleton (useful for testing)."""
+    global _default_pool
+    if _default_pool is not None:
+        _default_pool.clear()
+    _default_pool = None
+
+
+def open_reader(url: str):
+    """Borrow a reader for *url* from the process-wide pool."""
+    return get_reader_pool().reader(url)
@@ -0,0 +1,219 @@
+"""
+Cache of decoded raster tile arrays.
+
+A rendered tile depends on the raster window *and* on how it is coloured
+(SBS color mode, reversed ramp, rescale range), so the rendered tile cache
+misses whenever only the styling changes and the tile is read and warped
+again from the (often remote) GeoTIFF.  This cache stores the decoded
+masked array of each (raster, z, x, y) instead, so every styling of a tile
+after the first one is a pure recolor and encode.
+
+Arrays are stored compressed in a :class:`~.cache.TileCache` of their own
+(``TILE_RAW_CACHE_DIR``), shared by all workers.  Entries are keyed by a
+digest of the source URL and its revision (the upstream revision saved by
+the mirror, or a HEAD probe of remote rasters, see ``source_revision``;
+plus the mtime of mirrored local files), so a replaced raster is read
+again instead of serving stale pixels.
+
+Metatiles: with a metatile size ``N > 1`` a cache miss reads and warps the
+aligned N×N block of tiles around the requested one in a single
+``Reader.part`` call and stores every neighbour in the cache, amortizing the
+remote reads and warp setup over the tiles a map viewport requests anyway.
+Metatiling needs the raw tile cache; without it tiles are read one by one.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import io
+import logging
+import zipfile
+import zlib
+from typing import Optional
+
+import morecantile
+import numpy as np
+from rio_tiler.errors import TileOutsideBounds
+
+from server.watershed.singleflight import single_flight
+from server.watershed.versioning import source_revision
+
+from .cache import TileCache, TileKey
+from .config import get_tile_config
+from .pool import _source_key, open_reader
+
+logger = logging.getLogger("watershed.tiles")
+
+RAW_EXT = "npz"
+
+TILE_SIZE = 256
+
+# zlib level for stored arrays: favour speed, float tiles barely compress.
+_COMPRESS_LEVEL = 1
+
+
+def pack_array(data: np.ma.MaskedArray) -> bytes:
+    """Serialize a masked tile array (data, mask, dtype, shape)."""
+    buf = io.BytesIO()
+    np.savez(buf, data=np.ma.getdata(data), mask=np.ma.getmaskarray(data))
+    return zlib.compress(buf.getvalue(), _COMPRESS_LEVEL)
+
+
+def unpack_array(payload: bytes) -> np.ma.MaskedArray:
+    """Inverse of :func:`pack_array`."""
+    with np.load(io.BytesIO(zlib.decompress(payload)), allow_pickle=False) as npz:
+        return np.ma.MaskedArray(npz["data"], mask=npz["mask"])
+
+
+def raw_tile_key(url: str, z: int, x: int, y: int, revision: Optional[str] = None) -> TileKey:
+    """
+    Return the cache key of the decoded tile (z, x, y) of a raster source.
+
+    *revision* is the source's revision token (see ``source_revision``),
+    looked up when not given.
+    """
+    if revision is None:
+        revision = source_revision(url)
+    digest = hashlib.sha1(repr((_source_key(url), revision)).encode()).hexdigest()
+    return TileKey(digest[:2], digest, "data", z, x, y, RAW_EXT)
+
+
+def read_metatile(src, z: int, x: int, y: int, size: int) -> dict[tuple[int, int], np.ma.MaskedArray]:
+    """
+    Read the aligned ``size``×``size`` block of tiles containing (z, x, y).
+
+    *src* is an open rio-tiler ``Reader``.  Returns ``{(x, y): array}`` for
+    every tile of the block that intersects the raster; raises
+    ``TileOutsideBounds`` if the requested tile itself does not.
+    """
+    if not src.tile_exists(x, y, z):
+        raise TileOutsideBounds(f"Tile(x={x}, y={y}, z={z}) is outside bounds")
+
+    size = max(1, min(size, 1 << z))
+    x0, y0 = x - x % size, y - y % size
+    tiles = [
+        (tx, ty)
+        for ty in range(y0, y0 + size)
+        for tx in range(x0, x0 + size)
+        if src.tile_exists(tx, ty, z)
+    ]
+
+    ul = src.tms.xy_bounds(morecantile.Tile(x0, y0, z))
+    lr = src.tms.xy_bounds(morecantile.Tile(x0 + size - 1, y0 + size - 1, z))
+    img = src.part(
+        (ul.left, lr.bottom, lr.right, ul.top),
+        dst_crs=src.tms.rasterio_crs,
+        bounds_crs=src.tms.rasterio_crs,
+        height=size * TILE_SIZE,
+        width=size * TILE_SIZE,
+        max_size=None,
+    )
+
+    block = img.array
+    result = {}
+    for tx, ty in tiles:
+        row, col = (ty - y0) * TILE_SIZE, (tx - x0) * TILE_SIZE
+        result[(tx, ty)] = block[:, row:row + TILE_SIZE, col:col + TILE_SIZE].copy()
+    return result
+
+
+def read_tile_array(
+    url: str,
+    z: int,
+    x: int,
+    y: int,
+    family: Optional[str] = None,
+) -> np.ma.MaskedArray:
+    """
+    Return the decoded 256×256 masked array for tile (z, x, y) of *url*.
+
+    Served from the raw tile cache when possible; otherwise read through the
+    reader pool and stored, together with its neighbours when the metatile
+    size configured for the layer *family* is greater than one.  Concurrent
+    misses share one read (see ``singleflight.py``).
+    ``TileOutsideBounds`` and read errors propagate and are never cached.
+    """
+    metatile = get_tile_config().metatile_size(family) if family else 1
+    cache = get_raw_tile_cache()
+    revision = source_revision(url) if cache.enabled else ""
+    key = raw_tile_key(url, z, x, y, revision) if cache.enabled else None
+
+    def cached_tile() -> Optional[np.ma.MaskedArray]:
+        payload = cache.get(key) if key is not None else None
+        if payload is None:
+            return None
+        try:
+            return unpack_array(payload)
+        except (ValueError, OSError, KeyError, zlib.error, zipfile.BadZipFile) as exc:
+            logger.warning("Discarding unreadable raw tile %s: %s", key, exc)
+            return None
+
+    def read_tile() -> np.ma.MaskedArray:
+        with open_reader(url) as src:
+            data = src.tile(x, y, z, tilesize=TILE_SIZE).array
+        if key is not None:
+            cache.put(key, pack_array(data))
+        return data
+
+    data = cached_tile()
+    if data is not None:
+        return data
+
+    if key is None or metatile <= 1:
+        return single_flight(
+            f"raw:{url}:{z}/{x}/{y}", read_tile, lookup=cached_tile if key is not None else None,
+        )
+
+    def read_block() -> dict[tuple[int, int], np.ma.MaskedArray]:
+        try:
+            with open_reader(url) as src:
+                block = read_metatile(src, z, x, y, metatile)
+        except TileOutsideBounds:
+            # Other tiles of the block may still exist; let each caller check.
+            return {}
+        for (tx, ty), tile in block.items():
+            neighbour = raw_tile_key(url, z, tx, ty, revision)
+            if (tx, ty) == (x, y) or not cache.path_for(neighbour).exists():
+                cache.put(neighbour, pack_array(tile))
+        return block
+
+    def cached_block() -> Optional[dict[tuple[int, int], np.ma.MaskedArray]]:
+        tile = cached_tile()
+        return {(x, y): tile} if tile is not None else None
+
+    # Concurrent requests for tiles of the same block share one block read.
+    size = max(1, min(metatile, 1 << z))
+    block = single_flight(
+        f"raw:{url}:{z}/{x - x % size}/{y - y % size}@{size}", read_block, lookup=cached_block,
+    )
+    tile = block.get((x, y))
+    if tile is None:
+        # The block was read for another tile of it; ours is in the cache,
+        # or outside the raster (read_tile raises TileOutsideBounds).
+        tile = cached_tile()
+    return tile if tile is not None else read_tile()
+
+
+_default_cache: Optional[TileCache] = None
+
+
+def get_raw_tile_cache() -> TileCache:
+    """
+    Get the process-wide raw tile cache.
+
+    Lazily initializes from the tile configuration on first call.
+    """
+    global _default_cache
+    if _default_cache is None:
+        cfg = get_tile_config()
+        _default_cache = TileCache(
+            root=cfg.raw_cache_dir,
+            max_bytes=cfg.raw_cache_max_mb * 1024 * 1024,
+        )
+    return _default_cache
+
+
+def reset_raw_tile_cache() -> None:
+    """Reset the raw tile cache singleton (useful for testing)."""
+    global _default_cache
+    _default_cache = None
@@ -0,0 +1,187 @@
+"""
+Vectorized lookup-table colorization for raster tiles.
+
+rio-tiler's ``render(colormap=...)`` takes a Python dict and, for anything
+other than a full 256-entry map, loops over the dict building one boolean
+mask per class; continuous layers additionally pay for a separate
+``rescale()`` pass that allocates a new image.  The engine here compiles each
+colormap (and, for continuous layers, the rescale range) into a NumPy
+``uint8`` RGBA lookup table once, then colorizes a masked tile array with a
+single indexed gather.
+
+  - :class:`CategoricalColorizer`: raw pixel values map to entries of a
+    small palette; values without a colour are transparent.  PNG tiles are
+    written as 8-bit paletted images (see ``formats.encode_paletted_png``).
+  - :class:`ContinuousColorizer`: values are clipped to ``[lo, hi]`` and
+    mapped onto a 256-entry palette.
+
+For 8- and 16-bit integer rasters the whole mapping (rescale included) is
+folded into one table indexed by the raw pixel, so no arithmetic runs per
+pixel.  Tables hold packed ``uint32`` RGBA so each pixel is a single gather.
+
+Masked (nodata) pixels are always fully transparent.  Colorizers are safe
+to share between threads (per-dtype tables are built idempotently on first
+use); the tile modules cache them per (colormap, range, reversed, unique
+values).
+"""
+
+from __future__ import annotations
+
+from typing import Mapping
+
+import numpy as np
+from rio_tiler.utils import render as encode_image
+
+from .formats import encode_paletted_png
+
+RGBA = tuple[int, int, int, int]
+
+
+def palette_array(colormap: Mapping[int, RGBA]) -> np.ndarray:
+    """Convert a 256-entry ``{index: RGBA}`` colormap to a (256, 4) array."""
+    table = np.zeros((256, 4), dtype=np.uint8)
+    for idx, rgba in colormap.items():
+        table[idx] = rgba
+    return table
+
+
+def encode_rgba(rgba: np.ndarray, img_format: str = "PNG", **options) -> bytes:
+    """Encode an (H, W, 4) uint8 RGBA array with GDAL."""
+    chw = np.ascontiguousarray(np.moveaxis(rgba, -1, 0))
+    return encode_image(chw[:3], mask=chw[3], img_format=img_format, **options)
+
+
+def _first_band(data: np.ma.MaskedArray) -> tuple[np.ndarray, np.ndarray]:
+    band = data[0] if data.ndim == 3 else data
+    return np.ma.getdata(band), np.ma.getmaskarray(band)
+
+
+def _packed(table: np.ndarray) -> np.ndarray:
+    """View an (N, 4) uint8 RGBA table as N packed uint32 pixels."""
+    return np.ascontiguousarray(table, dtype=np.uint8).view(np.uint32).reshape(-1)
+
+
+class Colorizer:
+    """
+    Base class: turns a masked tile array into RGBA pixels.
+
+    Subclasses implement :meth:`_map_values`, the generic value → packed
+    RGBA mapping.  For 8- and 16-bit integer rasters it is evaluated once
+    over every possible value to build a per-dtype table, after which a
+    tile is colorized by indexing that table with the raw pixels.
+    """
+
+    def __init__(self):
+        self._dtype_luts: dict[tuple[str, np.dtype], np.ndarray] = {}
+
+    def _map_values(self, values: np.ndarray) -> np.ndarray:
+        raise NotImplementedError
+
+    def _lookup(self, values: np.ndarray, mapper) -> np.ndarray:
+        """Apply *mapper* to *values*, through a per-dtype table when possible."""
+        dtype = values.dtype
+        if dtype.kind not in "iu" or dtype.itemsize > 2:
+            return mapper(values)
+        key = (mapper.__name__, dtype)
+        lut = self._dtype_luts.get(key)
+        if lut is None:
+            # Index by bit pattern so signed types need no offset arithmetic.
+            unsigned = np.dtype(f"u{dtype.itemsize}")
+            lut = mapper(np.arange(1 << (8 * dtype.itemsize), dtype=unsigned).view(dtype))
+            self._dtype_luts[key] = lut
+        return lut[values.view(f"u{dtype.itemsize}")]
+
+    def colorize(self, data: np.ma.MaskedArray) -> np.ndarray:
+        """Return an (H, W, 4) uint8 RGBA array for the first band of *data*."""
+        values, invalid = _first_band(data)
+        packed = self._lookup(values, self._map_values)
+        if values.dtype.kind == "f":
+            invalid = invalid | np.isnan(values)
+        if invalid.any():
+            packed[invalid] = 0
+        return packed.view(np.uint8).reshape(*packed.shape, 4)
+
+    def render(self, data: np.ma.MaskedArray, img_format: str = "PNG", **options) -> bytes:
+        """Colorize a tile array and encode it (WebP is always lossless)."""
+        if img_format.upper() == "WEBP":
+            options.setdefault("LOSSLESS", True)
+        return encode_rgba(self.colorize(data), img_format=img_format, **options)
+
+
+class CategoricalColorizer(Colorizer):
+    """
+    Colorizer for class-coded rasters (``{pixel value: RGBA}``).
+
+    Each class gets a palette entry after a transparent entry 0, so with at
+    most 255 classes PNG tiles are written as 8-bit paletted images.
+    """
+
+    def __init__(self, colormap: Mapping[int, RGBA]):
+        super().__init__()
+        keys = [int(k) for k in colormap] or [0]
+        self.offset = min(keys)
+        self.palette = np.zeros((len(colormap) + 1, 4), dtype=np.uint8)
+        index_dtype = np.uint8 if len(self.palette) <= 256 else np.uint16
+        # value - offset → palette index; the extra last row (and every
+        # value without a colour) points at the transparent entry 0.
+        self.index_lut = np.zeros(max(keys) - self.offset + 2, dtype=index_dtype)
+        for i, (value, rgba) in enumerate(colormap.items(), start=1):
+            self.palette[i] = rgba
+            self.index_lut[int(value) - self.offset] = i
+        self._packed_palette = _packed(self.palette)
+
+    @property
+    def paletted(self) -> bool:
+        """True when tiles fit an 8-bit PNG palette."""
+        return self.index_lut.dtype == np.uint8
+
+    def _map_indices(self, values: np.ndarray) -> np.ndarray:
+        missing = len(self.index_lut) - 1
+        with np.errstate(invalid="ignore"):
+            if values.dtype.kind == "f":
+                # Class codes stored in a float raster: only exact integers match.
+                exact = values == np.floor(values)
+                values = np.where(exact, values, self.offset - 1)
+                values = np.nan_to_num(values, nan=self.offset - 1)
+            idx = values.astype(np.int64) - self.offset
+        idx[(idx < 0) | (idx >= missing)] = missing
+        return self.index_lut[idx]
+
+    def _map_values(self, values: np.ndarray) -> np.ndarray:
+        return self._packed_palette[self._map_indices(values)]
+
+    def indices(self, data: np.ma.MaskedArray) -> np.ndarray:
+        """Return the (H, W) palette indices for the first band of *data*."""
+        values, invalid = _first_band(data)
+        idx = self._lookup(values, self._map_indices)
+        if invalid.any():
+            idx[invalid] = 0
+        return idx
+
+    def render(self, data: np.ma.MaskedArray, img_format: str = "PNG", **options) -> bytes:
+        if img_format.upper() == "PNG" and self.paletted and not options:
+            return encode_paletted_png(self.indices(data), self.palette)
+        return super().render(data, img_format=img_format, **options)
+
+
+class ContinuousColorizer(Colorizer):
+    """Colorizer that rescales ``[lo, hi]`` onto a 256-entry palette."""
+
+    def __init__(self, palette: np.ndarray | Mapping[int, RGBA], lo: float, hi: float):
+        super().__init__()
+        if not isinstance(palette, np.ndarray):
+            palette = palette_array(palette)
+        if hi == lo:
+            hi = lo + 1e-10
+        self.palette = _packed(palette)
+        self.lo = float(lo)
+        self.hi = float(hi)
+
+    def _map_values(self, values: np.ndarray) -> np.ndarray:
+        # Same arithmetic as rio-tiler's rescale(): clip, scale, truncate.
+        with np.errstate(invalid="ignore"):
+            scaled = np.clip(values, self.lo, self.hi, dtype=np.float32)
+            scaled -= np.float32(self.lo)
+            scaled *= np.float32(255.0 / (self.hi - self.lo))
+            idx = scaled.astype(np.uint8)
+        return self.palette[idx]
@@ -0,0 +1,11 @@
+from rest_framework import serializers
+
+
+class TileLutResponseSerializer(serializers.Serializer):
+    type = serializers.CharField()
+    dtype = serializers.CharField()
+    scale = serializers.FloatField()
+    offset = serializers.FloatField()
+    nodata = serializers.IntegerField()
+    range = serializers.ListField(child=serializers.FloatField(), required=False)
+    colors = serializers.JSONField()
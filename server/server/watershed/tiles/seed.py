@@ -0,0 +1,230 @@
+"""
+Tile cache pre-seeding.
+
+Renders every raster tile layer of a watershed over the Web Mercator tiles
+that intersect its boundary, for a range of zoom levels, straight into the
+tile cache.  Work is split into :class:`SeedTask` chunks (one layer, one
+zoom, up to ``chunk_size`` tiles) that are picklable so the management
+command can fan them out over a process pool.
+
+Progress is recorded in an append-only state file: a header naming the run
+(data generation, zoom range, layers), then one completed task id per line.
+An interrupted run of the same seed can be restarted and skips finished
+tasks; the file is removed once a run completes, and ignored when the data
+or the arguments changed.  Tiles already present in the cache are skipped
+within a task as well.
+"""
+
+from __future__ import annotations
+
+import logging
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Iterable, Iterator, Optional
+
+import morecantile
+import rasterio.errors
+from rio_tiler.errors import TileOutsideBounds
+
+from .cache import get_tile_cache
+from .footprint import tile_outside_footprint
+from .layers import OUTPUTS, SBS, SPATIAL, TileLayer
+
+logger = logging.getLogger("watershed.tiles")
+
+_WEB_MERCATOR = morecantile.tms.get("WebMercatorQuad")
+
+# Layers whose source raster failed to open in this process; remaining tasks
+# for them are skipped instead of failing tile by tile.
+_failed_layers: set[TileLayer] = set()
+
+
+@dataclass(frozen=True)
+class SeedTask:
+    """A chunk of tiles at one zoom level for one layer."""
+    layer: TileLayer
+    z: int
+    tiles: tuple[tuple[int, int], ...]
+
+    @property
+    def task_id(self) -> str:
+        x0, y0 = self.tiles[0]
+        return (
+            f"{self.layer.runid}|{self.layer.cache_layer}|{self.layer.variant}"
+            f"|{self.z}/{x0}/{y0}+{len(self.tiles)}"
+        )
+
+
+@dataclass
+class SeedResult:
+    """Outcome of one :class:`SeedTask`."""
+    task_id: str
+    rendered: int = 0
+    cached: int = 0
+    empty: int = 0
+    error: str = ""
+
+
+def watershed_tiles(geom, min_zoom: int, max_zoom: int) -> dict[int, list[tuple[int, int]]]:
+    """
+    Return ``{z: [(x, y), ...]}`` for tiles intersecting a watershed geometry.
+
+    *geom* is a GEOS geometry in EPSG:4326 (``Watershed.geom``).  Tiles of
+    the bounding box that miss the boundary itself are dropped, which matters
+    for long, diagonal watersheds.
+    """
+    from django.contrib.gis.geos import Polygon
+
+    prepared = geom.prepared
+    west, south, east, north = geom.extent
+    result: dict[int, list[tuple[int, int]]] = {}
+    for z in range(min_zoom, max_zoom + 1):
+        tiles = []
+        for tile in _WEB_MERCATOR.tiles(west, south, east, north, [z]):
+            b = _WEB_MERCATOR.bounds(tile)
+            bbox = Polygon.from_bbox((b.left, b.bottom, b.right, b.top))
+            if prepared.intersects(bbox):
+                tiles.append((tile.x, tile.y))
+        result[z] = tiles
+    return result
+
+
+def list_seed_layers(runid: str, families: Iterable[str] = (SBS, SPATIAL, OUTPUTS)) -> list[TileLayer]:
+    """
+    List the tile layers to seed for a watershed.
+
+    SBS is seeded in every color mode.  Spatial inputs are limited to
+    registered files that discovery finds for the run, and outputs to the
+    discovered scenario/variable maps with a registered variable.
+    """
+    families = set(families)
+    layers: list[TileLayer] = []
+
+    if SBS in families:
+        from server.watershed.sbs_raster.color_map import ColorMode
+
+        layers.extend(TileLayer.sbs(runid, mode) for mode in ColorMode)
+
+    if SPATIAL in families:
+        from server.watershed.rhessys_spatial.discovery import discover_spatial_inputs
+        from server.watershed.rhessys_spatial.registry import get_meta
+
+        for f in discover_spatial_inputs(runid) or []:
+            if get_meta(f["filename"]) is not None:
+                layers.append(TileLayer.spatial(runid, f["filename"]))
+
+    if OUTPUTS in families:
+        from server.watershed.rhessys_outputs.discovery import list_output_map_files
+        from server.watershed.rhessys_outputs.registry import VARIABLE_BY_FILENAME
+
+        for scenario, filename in list_output_map_files(runid):
+            var_meta = VARIABLE_BY_FILENAME.get(filename)
+            if var_meta is not None:
+                layers.append(TileLayer.output(runid, scenario, var_meta.id))
+
+    return layers
+
+
+def build_tasks(
+    layer: TileLayer,
+    tiles_by_zoom: dict[int, list[tuple[int, int]]],
+    chunk_size: int,
+) -> Iterator[SeedTask]:
+    """Split a layer's tiles into :class:`SeedTask` chunks, low zooms first."""
+    for z in sorted(tiles_by_zoom):
+        tiles = tiles_by_zoom[z]
+        for i in range(0, len(tiles), chunk_size):
+            yield SeedTask(layer, z, tuple(tiles[i:i + chunk_size]))
+
+
+def render_seed_task(task: SeedTask) -> SeedResult:
+    """
+    Render every tile of *task* that is not already cached.
+
+    Runs in a worker process.  Tiles outside the raster or its recorded
+    footprint are counted as empty; a source that cannot be opened ends the
+    task with an error and marks the layer as failed for the rest of this
+    process.
+    """
+    result = SeedResult(task.task_id)
+    if task.layer in _failed_layers:
+        result.error = "source raster unavailable"
+        return result
+
+    cache = get_tile_cache()
+    rel_path = task.layer.rel_path
+    for x, y in task.tiles:
+        if tile_outside_footprint(task.layer.runid, rel_path, task.z, x, y):
+            result.empty += 1
+            continue
+        key = task.layer.key(task.z, x, y)
+        if cache.path_for(key).exists():
+            result.cached += 1
+            continue
+        try:
+            data = task.layer.render(task.z, x, y)
+        except TileOutsideBounds:
+            result.empty += 1
+            continue
+        except (rasterio.errors.RasterioIOError, ValueError) as exc:
+            _failed_layers.add(task.layer)
+            result.error = str(exc)
+            return result
+        cache.put(key, data)
+        result.rendered += 1
+    return result
+
+
+class SeedState:
+    """
+    Append-only record of completed seed task ids.
+
+    *run* identifies the seed (see the module docstring); progress recorded
+    for a different run is discarded.
+    """
+
+    def __init__(self, path: Path, run: str = "", restart: bool = False):
+        self.path = path
+        self.run = run
+        self._done: set[str] = set()
+        if restart:
+            path.unlink(missing_ok=True)
+        elif path.exists():
+            header, *lines = path.read_text().splitlines() or [""]
+            if header == self._header:
+                self._done = {line for line in lines if line}
+            else:
+                path.unlink()
+        self._fh: Optional[object] = None
+
+    @property
+    def _header(self) -> str:
+        return f"# run {self.run}"
+
+    def __len__(self) -> int:
+        return len(self._done)
+
+    def is_done(self, task_id: str) -> bool:
+        return task_id in self._done
+
+    def mark_done(self, task_id: str) -> None:
+        if self._fh is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            new = not self.path.exists()
+            self._fh = open(self.path, "a")
+            if new:
+                self._fh.write(self._header + "\n")
+        self._fh.write(task_id + "\n")
+        self._fh.flush()
+        self._done.add(task_id)
+
+    def close(self) -> None:
+        if self._fh is not None:
+            self._fh.close()
+            self._fh = None
+
+    def finish(self) -> None:
+        """Forget the progress of a completed run."""
+        self.close()
+        self.path.unlink(missing_ok=True)
+        self._done.clear()
@@ -0,0 +1,327 @@
+"""
+Persistent raster statistics.
+
+Continuous layers are colored over the raster's global value range, which
+takes a statistics pass over the raster.  Results are stored in the
+``RasterStatistics`` table keyed by the raster source and its upstream
+revision (see ``versioning.source_revision``), so each revision is scanned
+once for all workers and survives restarts; a changed upstream raster gets
+a new revision and is scanned again.  While the revision is unknown (an
+upstream HEAD probe failed) the latest stored statistics are used.  Entries
+in use are also kept for a few minutes in the shared file cache (see
+``shared_cache.py``), per data generation, to spare the database on every
+tile.
+
+Entries are filled lazily on first use, or ahead of time by
+``mirror_rasters`` for the maps it mirrors.
+
+Approximate statistics
+----------------------
+A first scan reads at most ``TILE_STATS_PIXEL_BUDGET`` pixels: the finest
+overview that fits the budget, or, for rasters without overviews, an evenly
+strided sample of their internal blocks.  Rasters that fit the budget are
+always read in full.  Such entries are flagged ``approximate`` and can be
+replaced with exact values by ``python manage.py refine_raster_stats``.
+
+Accuracy of approximate statistics:
+
+  - ``min``/``max`` are taken from real pixels or overview averages of real
+    pixels, so ``exact.min <= approx.min <= approx.max <= exact.max``: the
+    color range can only narrow, and values outside it clip to the end
+    colors.
+  - Percentiles of ``n`` sampled pixels estimate the true percentile rank to
+    within ``sqrt(ln(2 / a) / (2 n))`` with probability ``1 - a``
+    (Dvoretzky–Kiefer–Wolfowitz) for a uniform random sample: ±0.16
+    percentile points at ``a = 0.01`` for the default budget of 2^20
+    pixels.  Strided blocks are a regular rather than random sample, so
+    treat this as a guide for maps without block-scale periodic patterns.
+  - Averaged overviews sample local means, not pixels: on maps that are
+    smooth at the overview's scale the bound above applies, but pixel-scale
+    noise is averaged out and the range and outer percentiles narrow (on
+    8192² i.i.d. noise, a 1024² average overview kept ~8% of the range).
+    Refine such rasters, or set the budget to 0.
+  - Mean, percentiles and the histogram are accumulated on a
+    ``_FINE_BINS``-bin grid over ``[min, max]``, so percentiles carry an
+    additional error of at most ``(max - min) / 65536`` — the quantization
+    step of raw-data tiles — in both modes.
+"""
+
+from __future__ import annotations
+
+import logging
+import math
+from dataclasses import dataclass, field
+from typing import Iterable, Optional
+
+import numpy as np
+from django.db import DatabaseError
+
+from server.watershed.shared_cache import SharedCache
+from server.watershed.singleflight import single_flight
+
+from .config import get_tile_config
+from .pool import open_reader
+
+logger = logging.getLogger("watershed.tiles")
+
+PERCENTILES = (1, 2, 5, 25, 50, 75, 95, 98, 99)
+HISTOGRAM_BINS = 64
+
+# Resolution of the histogram percentiles are interpolated from; a multiple
+# of HISTOGRAM_BINS so the stored histogram is an exact aggregation of it.
+_FINE_BINS = 65536
+
+# (source, data generation) → stats; the source's revision is re-checked
+# when an entry expires.
+_stats_cache = SharedCache("raster-stats", ttl=300)
+
+
+@dataclass(frozen=True)
+class RasterStats:
+    """Statistics of the first band of a raster."""
+    min: float
+    max: float
+    mean: Optional[float] = None
+    std: Optional[float] = None
+    valid_pixels: int = 0
+    percentiles: dict[str, Optional[float]] = field(default_factory=dict)
+    histogram: dict[str, list] = field(default_factory=dict)
+    approximate: bool = False
+
+    def percentile(self, p: int) -> Optional[float]:
+        return self.percentiles.get(str(p))
+
+
+def _valid_values(block: np.ma.MaskedArray) -> np.ndarray:
+    values = block.compressed().astype(np.float64, copy=False)
+    return values[np.isfinite(values)]
+
+
+def summarize(blocks: Iterable[np.ma.MaskedArray], approximate: bool = False) -> RasterStats:
+    """
+    Compute statistics from masked blocks of a band in two passes: extrema
+    and moments, then a fine histogram that percentiles are read from.
+
+    *blocks* must be re-iterable (a list, or an object whose ``__iter__``
+    re-reads the raster).
+    """
+    lo, hi = math.inf, -math.inf
+    count, total, total_sq = 0, 0.0, 0.0
+    for block in blocks:
+        values = _valid_values(block)
+        if values.size == 0:
+            continue
+        lo = min(lo, float(values.min()))
+        hi = max(hi, float(values.max()))
+        count += values.size
+        total += float(values.sum())
+        total_sq += float(np.square(values).sum())
+    if count == 0:
+        raise ValueError("Raster has no valid pixels")
+
+    mean = total / count
+    std = math.sqrt(max(total_sq / count - mean * mean, 0.0))
+
+    fine = np.zeros(_FINE_BINS, dtype=np.int64)
+    span = hi - lo
+    for block in blocks:
+        values = _valid_values(block)
+        if values.size == 0:
+            continue
+        if span > 0:
+            idx = ((values - lo) * (_FINE_BINS / span)).astype(np.int64)
+            np.clip(idx, 0, _FINE_BINS - 1, out=idx)
+            fine += np.bincount(idx, minlength=_FINE_BINS)
+        else:
+            fine[0] += values.size
+
+    cdf = np.cumsum(fine)
+    width = span / _FINE_BINS
+    percentiles = {}
+    for p in PERCENTILES:
+        rank = p / 100 * count
+        i = int(np.searchsorted(cdf, rank, side="left"))
+        i = min(i, _FINE_BINS - 1)
+        before = cdf[i - 1] if i > 0 else 0
+        inside = (rank - before) / fine[i] if fine[i] else 0.0
+        percentiles[str(p)] = min(hi, lo + (i + inside) * width)
+
+    step = _FINE_BINS // HISTOGRAM_BINS
+    counts = fine.reshape(HISTOGRAM_BINS, step).sum(axis=1)
+    edges = np.linspace(lo, hi, HISTOGRAM_BINS + 1)
+    return RasterStats(
+        min=lo,
+        max=hi,
+        mean=mean,
+        std=std,
+        valid_pixels=count,
+        percentiles=percentiles,
+        histogram={
+            "counts": [int(c) for c in counts],
+            "edges": [float(e) for e in edges],
+        },
+        approximate=approximate,
+    )
+
+
+class _BlockReader:
+    """Re-iterable reader of every internal block of a band (exact statistics)."""
+
+    def __init__(self, dataset):
+        self.dataset = dataset
+
+    def __iter__(self):
+        for _, window in self.dataset.block_windows(1):
+            yield self.dataset.read(1, window=window, masked=True)
+
+
+def _overview_factor(dataset, budget: int) -> Optional[int]:
+    """Finest overview decimation factor whose level fits *budget*."""
+    factors = sorted(dataset.overviews(1))
+    if not factors:
+        return None
+    for factor in factors:
+        if math.ceil(dataset.width / factor) * math.ceil(dataset.height / factor) <= budget:
+            return factor
+    return factors[-1]
+
+
+def _sample_blocks(dataset, budget: int):
+    """Return ``(blocks, approximate)`` to compute statistics from."""
+    if budget <= 0 or dataset.width * dataset.height <= budget:
+        return _BlockReader(dataset), False
+
+    factor = _overview_factor(dataset, budget)
+    if factor is not None:
+        shape = (math.ceil(dataset.height / factor), math.ceil(dataset.width / factor))
+        return [dataset.read(1, out_shape=shape, masked=True)], True
+
+    windows = [w for _, w in dataset.block_windows(1)]
+    block_pixels = max(1, int(windows[0].width * windows[0].height))
+    stride = max(1, math.ceil(len(windows) * block_pixels / budget))
+    return [dataset.read(1, window=w, masked=True) for w in windows[::stride]], stride > 1
+
+
+def compute_raster_stats(source: str, pixel_budget: Optional[int] = None) -> RasterStats:
+    """
+    Scan a raster and return the statistics of its first band.
+
+    Reads at most *pixel_budget* pixels (``TILE_STATS_PIXEL_BUDGET`` by
+    default; 0 reads every pixel), see the module docstring.
+    """
+    if pixel_budget is None:
+        pixel_budget = get_tile_config().stats_pixel_budget
+    with open_reader(source) as src:
+        blocks, approximate = _sample_blocks(src.dataset, pixel_budget)
+        return summarize(blocks, approximate=approximate)
+
+
+def _load_stats(source: str, revision: str) -> Optional[RasterStats]:
+    """
+    Load the stored statistics of (*source*, *revision*); with an unknown
+    revision (``""``, e.g. a failed probe) the latest stored ones.
+    """
+    from server.watershed.models import RasterStatistics
+
+    rows = RasterStatistics.objects.filter(url=source)
+    if revision:
+        rows = rows.filter(revision=revision)
+    try:
+        row = rows.order_by("-updated_at").first()
+    except DatabaseError as exc:
+        logger.warning("Statistics lookup failed for %s: %s", source, exc)
+        return None
+    if row is None:
+        return None
+    return RasterStats(
+        min=row.min,
+        max=row.max,
+        mean=row.mean,
+        std=row.std,
+        valid_pixels=row.valid_pixels,
+        percentiles=row.percentiles,
+        histogram=row.histogram,
+        approximate=row.approximate,
+    )
+
+
+def _store_stats(source: str, revision: str, stats: RasterStats) -> None:
+    from server.watershed.models import RasterStatistics
+
+    try:
+        RasterStatistics.objects.update_or_create(
+            url=source,
+            revision=revision,
+            defaults={
+                "min": stats.min,
+                "max": stats.max,
+                "mean": stats.mean,
+                "std": stats.std,
+                "valid_pixels": stats.valid_pixels,
+                "percentiles": stats.percentiles,
+                "histogram": stats.histogram,
+                "approximate": stats.approximate,
+            },
+        )
+        if revision:
+            # An unknown revision does not mean the stored ones are outdated.
+            RasterStatistics.objects.filter(url=source).exclude(revision=revision).delete()
+    except DatabaseError as exc:
+        # Another worker may have stored the same revision concurrently.
+        logger.warning("Could not store statistics for %s: %s", source, exc)
+
+
+def get_raster_stats(source: str) -> RasterStats:
+    """
+    Return the statistics of a raster source (local path or URL).
+
+    Looked up in memory, then in ``RasterStatistics``; only a revision seen
+    for the first time is scanned, once across concurrent callers of all
+    workers.  Read errors propagate and store nothing.
+    """
+    from server.watershed.versioning import get_generation, source_revision
+
+    # Refined statistics come with a generation bump, which reloads them.
+    key = (source, get_generation())
+    cached = _stats_cache.get(key)
+    if cached is not None:
+        return cached
+
+    revision = source_revision(source)
+    stats = _load_stats(source, revision)
+    if stats is None:
+        def scan() -> RasterStats:
+            scanned = compute_raster_stats(source)
+            _store_stats(source, revision, scanned)
+            return scanned
+
+        stats = single_flight(
+            f"stats:{source}:{revision}", scan, lookup=lambda: _load_stats(source, revision),
+        )
+    _stats_cache.set(key, stats)
+    return stats
+
+
+def refine_raster_stats(source: str, revision: str) -> Optional[tuple[RasterStats, RasterStats]]:
+    """
+    Replace the approximate statistics stored for (*source*, *revision*)
+    with exact ones.
+
+    Returns ``(approximate, exact)``, or None when there is nothing to refine
+    (no approximate entry, or the source has moved on to a newer revision).
+    """
+    from server.watershed.versioning import source_revision
+
+    approximate = _load_stats(source, revision)
+    if approximate is None or not approximate.approximate:
+        return None
+    if source_revision(source) != revision:
+        return None
+    exact = compute_raster_stats(source, pixel_budget=0)
+    _store_stats(source, revision, exact)
+    return approximate, exact
+
+
+def clear_stats_cache() -> None:
+    """Drop statistics kept in memory (useful for testing)."""
+    _stats_cache.clear()
@@ -0,0 +1,1091 @@
+"""
+Tests for the shared raster tile-serving infrastructure.
+
+Covers:
+  - TileCache: hit/miss accounting, LRU eviction and invalidation
+  - Raster mirror: path safety, local/remote source selection, COG conversion
+  - ReaderPool: handle reuse, exclusivity, idle expiry and size limits
+  - RenderPool: process offloading, queue limit and timeouts
+  - TileLayer / seeding: cache keys, tile enumeration, resumable tasks
+  - Raster footprints: valid-data tracing and tile intersection
+  - LUT colorization: parity with rio-tiler colormaps and rescaling
+  - Tile formats: paletted PNG encoding and WebP negotiation
+  - Raw tile arrays: serialization, decode-once caching and metatiles
+  - Raw-data tiles: quantization and LUT metadata
+  - Raster statistics: band statistics and the per-revision store
+"""
+
+import os
+import tempfile
+import threading
+import time
+import unittest
+from pathlib import Path
+from unittest.mock import MagicMock, patch
+
+import numpy as np
+from rio_tiler.errors import TileOutsideBounds
+
+from server.watershed.loaders.config import reset_config
+from server.watershed.tiles.cache import TileCache, TileKey
+from server.watershed.tiles.config import TileConfig
+from server.watershed.tiles.data import Quantization, categorical_lut, continuous_lut
+from server.watershed.tiles.formats import (
+    PNG,
+    TRANSPARENT_PNG,
+    WEBP,
+    encode_paletted_png,
+    negotiate_tile_format,
+    transparent_tile_response,
+)
+from server.watershed.tiles.mirror import (
+    SBS_REL_PATH,
+    mirror_path,
+    mirror_raster,
+    mirrored_or_remote,
+    read_revision,
+)
+from server.watershed.sbs_raster.color_map import ColorMode
+from server.watershed.tiles.footprint import (
+    _footprint_cache,
+    clear_footprint_cache,
+    compute_footprint,
+    tile_outside_footprint,
+)
+from server.watershed.tiles.layers import TileLayer, raster_cache_layer
+from server.watershed.tiles.pool import ReaderPool
+from server.watershed.tiles.raw import (
+    pack_array,
+    raw_tile_key,
+    read_metatile,
+    read_tile_array,
+    unpack_array,
+)
+from server.watershed.tiles.render import CategoricalColorizer, ContinuousColorizer
+from server.watershed.tiles.stats import (
+    HISTOGRAM_BINS,
+    clear_stats_cache,
+    compute_raster_stats,
+    get_raster_stats,
+)
+from server.watershed.tiles.workers import RenderPool, RenderUnavailable
+from server.watershed.tiles.seed import (
+    SeedState,
+    SeedTask,
+    build_tasks,
+    render_seed_task,
+    watershed_tiles,
+)
+from server.watershed.versioning import revision_token, source_revision
+
+
+# ---------------------------------------------------------------------------
+# TileCache
+# ---------------------------------------------------------------------------
+
+class TileCacheTests(unittest.TestCase):
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.root = Path(self._tmp.name)
+        self.cache = TileCache(root=self.root, max_bytes=10_000)
+
+    def tearDown(self):
+        self._tmp.cleanup()
+
+    def _key(self, runid='batch;;nasa-roses-2026-sbs;;OR-20', layer='sbs', z=10, x=1, y=2):
+        return TileKey(runid, layer, 'legacy', z, x, y)
+
+    def test_miss_then_hit(self):
+        key = self._key()
+        self.assertIsNone(self.cache.get(key))
+        self.cache.put(key, b'tile')
+        self.assertEqual(self.cache.get(key), b'tile')
+        stats = self.cache.stats()
+        self.assertEqual(stats['hits'], 1)
+        self.assertEqual(stats['misses'], 1)
+        self.assertEqual(stats['writes'], 1)
+
+    def test_get_or_render_only_renders_once(self):
+        calls = []
+
+        def render():
+            calls.append(1)
+            return b'rendered'
+
+        key = self._key()
+        first, first_hit = self.cache.get_or_render(key, render)
+        second, second_hit = self.cache.get_or_render(key, render)
+
+        self.assertEqual(first, b'rendered')
+        self.assertEqual(second, b'rendered')
+        self.assertFalse(first_hit)
+        self.assertTrue(second_hit)
+        self.assertEqual(len(calls), 1)
+
+    def test_render_errors_are_not_cached(self):
+        key = self._key()
+
+        def boom():
+            raise ValueError('upstream failure')
+
+        with self.assertRaises(ValueError):
+            self.cache.get_or_render(key, boom)
+        self.assertFalse(self.cache.path_for(key).exists())
+
+    def test_disabled_cache_always_renders(self):
+        cache = TileCache(root=None, max_bytes=10_000)
+        key = self._key()
+        cache.put(key, b'tile')
+        self.assertIsNone(cache.get(key))
+        data, hit = cache.get_or_render(key, lambda: b'fresh')
+        self.assertEqual(data, b'fresh')
+        self.assertFalse(hit)
+
+    def test_paths_stay_inside_root(self):
+        key = TileKey('../../etc', '../outputs/..', '..', 1, 2, 3)
+        path = self.cache.path_for(key).resolve()
+        self.assertTrue(str(path).startswith(str(self.root.resolve())))
+
+    def test_invalidate_single_layer(self):
+        sbs = self._key(layer='sbs')
+        lai = self._key(layer='outputs/baseline/lai')
+        self.cache.put(sbs, b'a')
+        self.cache.put(lai, b'b')
+
+        self.cache.invalidate(sbs.runid, 'outputs')
+
+        self.assertEqual(self.cache.get(sbs), b'a')
+        self.assertIsNone(self.cache.get(lai))
+
+    def test_invalidate_whole_watershed(self):
+        a = self._key(runid='run-a')
+        b = self._key(runid='run-b')
+        self.cache.put(a, b'a')
+        self.cache.put(b, b'b')
+
+        self.cache.invalidate('run-a')
+
+        self.assertIsNone(self.cache.get(a))
+        self.assertEqual(self.cache.get(b), b'b')
+
+    def test_eviction_removes_least_recently_used(self):
+        cache = TileCache(root=self.root, max_bytes=2500, low_water=0.8)
+        kept = self._key(x=1)
+        stale = self._key(x=2)
+        cache.put(kept, b'k' * 1000)
+        cache.put(stale, b's' * 1000)
+
+        # Backdate one tile so it is the least recently used.
+        past = time.time() - 100
+        os.utime(cache.path_for(stale), (past, past))
+
+        cache.put(self._key(x=3), b'n' * 1000)
+
+        self.assertIsNone(cache.get(stale))
+        self.assertEqual(cache.get(kept), b'k' * 1000)
+        self.assertGreaterEqual(cache.stats()['evictions'], 1)
+
+
+# ---------------------------------------------------------------------------
+# Raster mirror
+# ---------------------------------------------------------------------------
+
+def _write_geotiff(path, size=512, data=None, nodata=None):
+    """Write a small untiled single-band GeoTIFF in EPSG:3857."""
+    import rasterio
+    from rasterio.transform import from_origin
+
+    if data is None:
+        data = (np.arange(size * size, dtype=np.uint8) % 4).reshape(size, size)
+    with rasterio.open(
+        path, 'w', driver='GTiff', width=size, height=size, count=1,
+        dtype='uint8', crs='EPSG:3857', nodata=nodata,
+        transform=from_origin(-13_000_000, 5_500_000, 30, 30),
+    ) as dst:
+        dst.write(data, 1)
+
+
+def _mock_response(body, status=200, headers=None):
+    response = MagicMock()
+    response.status_code = status
+    response.headers = headers or {}
+    response.iter_content.return_value = [body]
+    response.__enter__.return_value = response
+    return response
+
+
+class RasterMirrorTests(unittest.TestCase):
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.data_dir = Path(self._tmp.name)
+        self._env = patch.dict(os.environ, {'LOADER_DATA_DIR': str(self.data_dir)})
+        self._env.start()
+        reset_config()
+
+    def tearDown(self):
+        self._env.stop()
+        reset_config()
+        self._tmp.cleanup()
+
+    def test_mirror_path_rejects_traversal(self):
+        self.assertIsNone(mirror_path('run-a', '../../etc/passwd'))
+        self.assertIsNone(mirror_path('..', '../outside.tif'))
+        self.assertIsNotNone(mirror_path('run-a', SBS_REL_PATH))
+
+    def test_falls_back_to_remote_url_when_not_mirrored(self):
+        url = 'https://example.org/sbs.tif'
+        self.assertEqual(mirrored_or_remote('run-a', SBS_REL_PATH, url), url)
+
+        local = mirror_path('run-a', SBS_REL_PATH)
+        local.parent.mkdir(parents=True)
+        local.write_bytes(b'cog')
+        self.assertEqual(mirrored_or_remote('run-a', SBS_REL_PATH, url), str(local))
+
+    def test_missing_upstream_raster(self):
+        session = MagicMock()
+        session.get.return_value = _mock_response(b'', status=404)
+
+        result = mirror_raster('run-a', SBS_REL_PATH, session)
+
+        self.assertEqual(result.status, 'missing')
+        self.assertFalse(mirror_path('run-a', SBS_REL_PATH).exists())
+
+    def test_converts_to_cog_and_skips_unchanged(self):
+        import rasterio
+
+        src = self.data_dir / 'upstream.tif'
+        _write_geotiff(src)
+        session = MagicMock()
+        session.get.return_value = _mock_response(
+            src.read_bytes(), headers={'ETag': '"v1"'},
+        )
+
+        first = mirror_raster('run-a', SBS_REL_PATH, session)
+
+        self.assertEqual(first.status, 'mirrored')
+        with rasterio.open(first.path) as ds:
+            self.assertEqual(ds.block_shapes[0], (256, 256))
+            self.assertTrue(ds.overviews(1))
+        self.assertEqual(read_revision('run-a', SBS_REL_PATH)['etag'], '"v1"')
+
+        second = mirror_raster('run-a', SBS_REL_PATH, session)
+        self.assertEqual(second.status, 'unchanged')
+
+        forced = mirror_raster('run-a', SBS_REL_PATH, session, force=True)
+        self.assertEqual(forced.status, 'mirrored')
+
+    def test_remirrored_raster_replaces_cached_tiles(self):
+        import morecantile
+        from django.core.management import call_command
+
+        tms = morecantile.tms.get('WebMercatorQuad')
+        tile = tms.tile(*tms.lnglat(-12_992_000, 5_492_000), 12)
+        cache = TileCache(root=self.data_dir / 'tiles', max_bytes=10_000_000)
+        layer = TileLayer.sbs('run-a', ColorMode.LEGACY)
+        session = MagicMock()
+        session.__enter__.return_value = session
+
+        def mirror(value, etag):
+            src = self.data_dir / f'upstream-{value}.tif'
+            _write_geotiff(src, data=np.full((512, 512), value, dtype=np.uint8))
+            session.get.return_value = _mock_response(src.read_bytes(), headers={'ETag': etag})
+            call_command('mirror_rasters', '--runids', 'run-a', stdout=MagicMock())
+            data, _hit = cache.get_or_render(layer.key(tile.z, tile.x, tile.y), lambda: layer.render(tile.z, tile.x, tile.y))
+            return data
+
+        command = 'server.watershed.management.commands.mirror_rasters'
+        with patch(f'{command}.requests.Session', return_value=session), \
+                patch(f'{command}.list_mirror_targets', return_value=[(SBS_REL_PATH, 'NEAREST')]), \
+                patch(f'{command}.record_raster_revision', return_value=True), \
+                patch(f'{command}.bump_generation'), \
+                patch(f'{command}.has_footprint', return_value=True), \
+                patch(f'{command}.record_footprint'), \
+                patch('server.watershed.tiles.layers.get_tile_cache', return_value=cache):
+            first = mirror(1, '"v1"')
+            second = mirror(3, '"v2"')
+
+        self.assertNotEqual(first, second)
+        self.assertEqual(second, layer.render(tile.z, tile.x, tile.y))
+
+
+# ---------------------------------------------------------------------------
+# ReaderPool
+# ---------------------------------------------------------------------------
+
+class _FakeReader:
+    def __init__(self, url):
+        self.url = url
+        self.closed = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self.closed = True
+
+
+class ReaderPoolTests(unittest.TestCase):
+    def setUp(self):
+        self.opened = []
+
+    def _pool(self, **kwargs):
+        def opener(url):
+            reader = _FakeReader(url)
+            self.opened.append(reader)
+            return reader
+
+        kwargs.setdefault('max_handles', 4)
+        kwargs.setdefault('idle_seconds', 300)
+        return ReaderPool(opener=opener, **kwargs)
+
+    def test_reuses_reader_for_same_url(self):
+        pool = self._pool()
+        with pool.reader('https://example.org/a.tif') as first:
+            pass
+        with pool.reader('https://example.org/a.tif') as second:
+            pass
+
+        self.assertIs(first, second)
+        self.assertEqual(len(self.opened), 1)
+        self.assertFalse(first.closed)
+        self.assertEqual(pool.stats()['hits'], 1)
+
+    def test_concurrent_borrow_opens_separate_handle(self):
+        pool = self._pool()
+        with pool.reader('https://example.org/a.tif') as first:
+            with pool.reader('https://example.org/a.tif') as second:
+                self.assertIsNot(first, second)
+        self.assertEqual(pool.stats()['idle'], 2)
+
+    def test_evicts_least_recently_used_beyond_limit(self):
+        pool = self._pool(max_handles=2)
+        for name in ('a', 'b', 'c'):
+            with pool.reader(f'https://example.org/{name}.tif'):
+                pass
+
+        self.assertTrue(self.opened[0].closed)
+        self.assertFalse(self.opened[2].closed)
+        self.assertEqual(pool.stats()['idle'], 2)
+
+    def test_idle_readers_expire(self):
+        pool = self._pool(idle_seconds=0)
+        with pool.reader('https://example.org/a.tif'):
+            pass
+        time.sleep(0.01)
+        with pool.reader('https://example.org/a.tif'):
+            pass
+
+        self.assertEqual(len(self.opened), 2)
+        self.assertTrue(self.opened[0].closed)
+
+    def test_rio_tiler_errors_keep_handle_other_errors_discard(self):
+        pool = self._pool()
+        with self.assertRaises(TileOutsideBounds):
+            with pool.reader('https://example.org/a.tif'):
+                raise TileOutsideBounds('outside')
+        self.assertFalse(self.opened[0].closed)
+
+        with self.assertRaises(OSError):
+            with pool.reader('https://example.org/a.tif'):
+                raise OSError('read failed')
+        self.assertTrue(self.opened[0].closed)
+        self.assertEqual(pool.stats()['idle'], 0)
+
+    def test_local_file_reopened_after_replace(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = Path(tmp) / 'sbs.tif'
+            path.write_bytes(b'v1')
+            pool = self._pool()
+            with pool.reader(str(path)):
+                pass
+            os.utime(path, ns=(0, time.time_ns() + 1_000_000_000))
+            with pool.reader(str(path)):
+                pass
+
+        self.assertEqual(len(self.opened), 2)
+
+    def test_disabled_pool_closes_after_use(self):
+        pool = self._pool(max_handles=0)
+        with pool.reader('https://example.org/a.tif') as src:
+            pass
+        self.assertTrue(src.closed)
+
+
+# ---------------------------------------------------------------------------
+# RenderPool
+# ---------------------------------------------------------------------------
+
+class RenderPoolTests(unittest.TestCase):
+    def _pool(self, **kwargs):
+        kwargs.setdefault('processes', 1)
+        kwargs.setdefault('queue_depth', 0)
+        kwargs.setdefault('timeout', 30)
+        pool = RenderPool(**kwargs)
+        self.addCleanup(pool.shutdown)
+        return pool
+
+    def test_disabled_pool_renders_inline(self):
+        pool = self._pool(processes=0)
+
+        self.assertEqual(pool.run(os.getpid), os.getpid())
+
+    def test_renders_in_another_process(self):
+        pool = self._pool()
+
+        self.assertNotEqual(pool.run(os.getpid), os.getpid())
+        self.assertEqual(pool.run(pow, 2, 10), 1024)
+
+    def test_render_errors_propagate(self):
+        pool = self._pool()
+
+        with self.assertRaises(ValueError):
+            pool.run(int, 'not a number')
+
+    def test_rejects_renders_beyond_queue_depth(self):
+        pool = self._pool()
+        pool.run(pow, 2, 2)  # start the process
+        busy = threading.Thread(target=pool.run, args=(time.sleep, 0.5))
+        busy.start()
+        time.sleep(0.1)
+
+        with self.assertRaises(RenderUnavailable):
+            pool.run(pow, 2, 2)
+        busy.join()
+
+        self.assertEqual(pool.stats()['rejected'], 1)
+        self.assertEqual(pool.run(pow, 2, 2), 4)
+
+    def test_times_out(self):
+        pool = self._pool()
+        pool.run(pow, 2, 2)  # start the process
+        pool.timeout = 0.2
+
+        with self.assertRaises(RenderUnavailable):
+            pool.run(time.sleep, 1)
+        self.assertEqual(pool.stats()['timeouts'], 1)
+
+
+# ---------------------------------------------------------------------------
+# TileLayer / seeding
+# ---------------------------------------------------------------------------
+
+class TileLayerTests(unittest.TestCase):
+    def test_cache_keys_match_tile_views(self):
+        self.assertEqual(
+            TileLayer.sbs('run-a', ColorMode.SHIFT).key(10, 1, 2),
+            TileKey('run-a', 'sbs', 'shift', 10, 1, 2),
+        )
+        self.assertEqual(
+            TileLayer.spatial('run-a', 'wbt_slope.tif').key(10, 1, 2),
+            TileKey('run-a', 'spatial/wbt_slope.tif', 'default', 10, 1, 2),
+        )
+        self.assertEqual(
+            TileLayer.output('run-a', 'S1', 'lai').key(10, 1, 2),
+            TileKey('run-a', 'outputs/S1/lai', 'default', 10, 1, 2),
+        )
+
+    def test_data_tiles_are_keyed_by_their_quantization(self):
+        layer = TileLayer.output('run-a', 'S1', 'lai')
+        before = layer.data_key(10, 1, 2, Quantization.for_range(0.0, 5.0))
+
+        self.assertEqual(before, layer.data_key(10, 1, 2, Quantization.for_range(0.0, 5.0)))
+        # Refined statistics give a new range: tiles encoded over the old one
+        # must not be served with the new headers.
+        self.assertNotEqual(before, layer.data_key(10, 1, 2, Quantization.for_range(0.0, 6.0)))
+        self.assertEqual((before.runid, before.layer), ('run-a', 'outputs/S1/lai'))
+
+    def test_rasters_map_to_the_cache_layers_rendered_from_them(self):
+        self.assertEqual(raster_cache_layer(SBS_REL_PATH), 'sbs')
+        self.assertEqual(
+            raster_cache_layer('rhessys/spatial_inputs_and_climates/wbt_slope.tif'), 'spatial/wbt_slope.tif',
+        )
+        self.assertEqual(raster_cache_layer('rhessys/maps/S1/lai.tif'), TileLayer.output('run-a', 'S1', 'lai').cache_layer)
+        self.assertIsNone(raster_cache_layer('other/file.tif'))
+
+
+class SeedTests(unittest.TestCase):
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.root = Path(self._tmp.name)
+        self.cache = TileCache(root=self.root / 'tiles', max_bytes=10_000_000)
+        self._patches = [
+            patch('server.watershed.tiles.seed.get_tile_cache', return_value=self.cache),
+            patch('server.watershed.tiles.seed.tile_outside_footprint', return_value=False),
+        ]
+        for p in self._patches:
+            p.start()
+
+    def tearDown(self):
+        for p in self._patches:
+            p.stop()
+        self._tmp.cleanup()
+
+    def test_watershed_tiles_follow_boundary(self):
+        from django.contrib.gis.geos import MultiPolygon, Polygon
+
+        # An L-shaped watershed: the bbox has tiles the boundary never touches.
+        geom = MultiPolygon(
+            Polygon.from_bbox((-117.0, 44.0, -116.9, 44.5)),
+            Polygon.from_bbox((-117.0, 44.0, -116.5, 44.1)),
+            srid=4326,
+        )
+        tiles = watershed_tiles(geom, 10, 11)
+
+        self.assertEqual(sorted(tiles), [10, 11])
+        bbox_tiles = watershed_tiles(geom.envelope, 11, 11)[11]
+        self.assertLess(len(tiles[11]), len(bbox_tiles))
+        self.assertTrue(set(tiles[11]) <= set(bbox_tiles))
+
+    def test_build_tasks_chunks_per_zoom(self):
+        layer = TileLayer.spatial('run-a', 'wbt_slope.tif')
+        tasks = list(build_tasks(layer, {10: [(1, 1), (1, 2), (1, 3)], 11: [(2, 2)]}, 2))
+
+        self.assertEqual([(t.z, len(t.tiles)) for t in tasks], [(10, 2), (10, 1), (11, 1)])
+        self.assertEqual(len({t.task_id for t in tasks}), 3)
+
+    def test_render_seed_task_skips_cached_and_empty_tiles(self):
+        layer = TileLayer.sbs('run-a', ColorMode.LEGACY)
+        self.cache.put(layer.key(10, 1, 1), b'cached')
+
+        def fake_render(z, x, y):
+            if y == 3:
+                raise TileOutsideBounds('outside')
+            return b'png'
+
+        task = SeedTask(layer, 10, ((1, 1), (1, 2), (1, 3)))
+        with patch.object(TileLayer, 'render', side_effect=fake_render):
+            result = render_seed_task(task)
+
+        self.assertEqual((result.rendered, result.cached, result.empty), (1, 1, 1))
+        self.assertEqual(self.cache.get(layer.key(10, 1, 2)), b'png')
+
+    def test_state_resumes_completed_tasks(self):
+        path = self.root / 'seed.state'
+        state = SeedState(path)
+        state.mark_done('a')
+        state.close()
+
+        self.assertTrue(SeedState(path).is_done('a'))
+        self.assertFalse(SeedState(path, restart=True).is_done('a'))
+
+    def test_state_of_another_run_or_a_finished_run_is_discarded(self):
+        path = self.root / 'seed.state'
+        state = SeedState(path, run='generation=1')
+        state.mark_done('a')
+        state.close()
+
+        self.assertTrue(SeedState(path, run='generation=1').is_done('a'))
+        self.assertFalse(SeedState(path, run='generation=2').is_done('a'))
+
+        state = SeedState(path, run='generation=2')
+        state.mark_done('a')
+        state.finish()
+        self.assertFalse(path.exists())
+        self.assertFalse(SeedState(path, run='generation=2').is_done('a'))
+
+
+# ---------------------------------------------------------------------------
+# Raster footprints
+# ---------------------------------------------------------------------------
+
+class RasterFootprintTests(unittest.TestCase):
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.path = Path(self._tmp.name) / 'sbs.tif'
+        clear_footprint_cache()
+
+    def tearDown(self):
+        clear_footprint_cache()
+        self._tmp.cleanup()
+
+    def test_footprint_covers_only_valid_data(self):
+        # Valid data only in the top-left quadrant of a 15 km square.
+        data = np.full((512, 512), 255, dtype=np.uint8)
+        data[:256, :256] = 1
+        _write_geotiff(self.path, data=data, nodata=255)
+
+        bounds, footprint = compute_footprint(str(self.path))
+
+        self.assertEqual(footprint.srid, 4326)
+        self.assertTrue(bounds.contains(footprint.centroid))
+        self.assertLess(footprint.area, bounds.area * 0.4)
+        self.assertGreater(footprint.area, bounds.area * 0.2)
+
+    def test_empty_raster_has_empty_footprint(self):
+        _write_geotiff(self.path, data=np.full((512, 512), 255, dtype=np.uint8), nodata=255)
+        _bounds, footprint = compute_footprint(str(self.path))
+        self.assertTrue(footprint.empty)
+
+    def test_tile_outside_footprint(self):
+        _write_geotiff(self.path)
+        _bounds, footprint = compute_footprint(str(self.path))
+        _footprint_cache.set(('run-a', SBS_REL_PATH), footprint)
+
+        lon, lat = footprint.centroid.coords
+        inside = _tile_for(lon, lat, 12)
+        far_away = _tile_for(lon + 10, lat, 12)
+
+        self.assertFalse(tile_outside_footprint('run-a', SBS_REL_PATH, 12, *inside))
+        self.assertTrue(tile_outside_footprint('run-a', SBS_REL_PATH, 12, *far_away))
+
+    def test_unindexed_raster_is_never_skipped(self):
+        _footprint_cache.set(('run-a', SBS_REL_PATH), None)
+        self.assertFalse(tile_outside_footprint('run-a', SBS_REL_PATH, 12, 0, 0))
+
+
+def _tile_for(lon, lat, z):
+    import morecantile
+
+    tile = morecantile.tms.get('WebMercatorQuad').tile(lon, lat, z)
+    return tile.x, tile.y
+
+
+# ---------------------------------------------------------------------------
+# LUT colorization
+# ---------------------------------------------------------------------------
+
+def _ramp_palette():
+    """Palette whose red channel equals the palette index."""
+    palette = np.zeros((256, 4), dtype=np.uint8)
+    palette[:, 0] = np.arange(256)
+    palette[:, 3] = 255
+    return palette
+
+
+class ColorizerTests(unittest.TestCase):
+    def test_categorical_matches_rio_tiler_colormap(self):
+        from rio_tiler.colormap import apply_cmap
+
+        colormap = {3: (10, 20, 30, 255), 6: (40, 50, 60, 255), 9: (70, 80, 90, 128)}
+        values = np.array([[3, 6, 9, 4], [0, 9, 6, 250]], dtype=np.uint8)
+        data = np.ma.MaskedArray(values[np.newaxis], mask=False)
+
+        rgba = CategoricalColorizer(colormap).colorize(data)
+        expected, alpha = apply_cmap(values[np.newaxis], colormap)
+
+        np.testing.assert_array_equal(rgba[..., :3], np.moveaxis(expected, 0, -1))
+        np.testing.assert_array_equal(rgba[..., 3], alpha)
+        # Values without a colour (4, 0, 250) are transparent.
+        self.assertEqual(rgba[0, 3, 3], 0)
+        self.assertEqual(rgba[1, 0, 3], 0)
+
+    def test_masked_pixels_are_transparent(self):
+        values = np.full((1, 2, 2), 1, dtype=np.uint8)
+        mask = np.array([[[True, False], [False, True]]])
+        rgba = CategoricalColorizer({1: (255, 0, 0, 255)}).colorize(
+            np.ma.MaskedArray(values, mask=mask)
+        )
+        np.testing.assert_array_equal(rgba[..., 3], [[0, 255], [255, 0]])
+
+    def test_categorical_float_codes_match_exact_integers_only(self):
+        values = np.array([[1.0, 1.5, np.nan, 2.0]], dtype=np.float32)
+        colorizer = CategoricalColorizer({1: (1, 1, 1, 255), 2: (2, 2, 2, 255)})
+        rgba = colorizer.colorize(np.ma.MaskedArray(values, mask=False))
+        np.testing.assert_array_equal(rgba[0, :, 0], [1, 0, 0, 2])
+        np.testing.assert_array_equal(rgba[0, :, 3], [255, 0, 0, 255])
+
+    def test_continuous_matches_rio_tiler_rescale(self):
+        from rio_tiler.models import ImageData
+
+        rng = np.random.default_rng(0)
+        values = rng.uniform(-0.5, 1.5, (1, 64, 64)).astype(np.float32)
+        data = np.ma.MaskedArray(values, mask=False)
+
+        rgba = ContinuousColorizer(_ramp_palette(), 0.0, 1.0).colorize(data)
+        rescaled = ImageData(data.copy()).rescale(in_range=((0.0, 1.0),), out_range=((0, 255),))
+
+        np.testing.assert_array_equal(rgba[..., 0], rescaled.array[0])
+
+    def test_integer_lut_matches_float_path(self):
+        values = np.arange(-200, 2600, dtype=np.int16).reshape(1, 40, 70)
+        colorizer = ContinuousColorizer(_ramp_palette(), 800.0, 2400.0)
+
+        from_int = colorizer.colorize(np.ma.MaskedArray(values, mask=False))
+        from_float = colorizer.colorize(np.ma.MaskedArray(values.astype(np.float32), mask=False))
+
+        np.testing.assert_array_equal(from_int, from_float)
+
+    def test_continuous_nan_is_transparent_and_flat_range_is_safe(self):
+        values = np.array([[[np.nan, 5.0]]], dtype=np.float32)
+        rgba = ContinuousColorizer(_ramp_palette(), 5.0, 5.0).colorize(
+            np.ma.MaskedArray(values, mask=False)
+        )
+        np.testing.assert_array_equal(rgba[0, :, 3], [0, 255])
+
+    def test_categorical_render_is_paletted_png(self):
+        data = np.ma.MaskedArray(np.ones((1, 8, 8), dtype=np.uint8), mask=False)
+        png = CategoricalColorizer({1: (255, 0, 0, 255)}).render(data)
+        self.assertTrue(png.startswith(b'\x89PNG'))
+        self.assertEqual(png[25], 3)  # IHDR colour type: indexed
+
+    def test_continuous_render_webp_is_lossless(self):
+        values = np.linspace(0, 1, 64, dtype=np.float32).reshape(1, 8, 8)
+        data = np.ma.MaskedArray(values, mask=False)
+        colorizer = ContinuousColorizer(_ramp_palette(), 0.0, 1.0)
+        webp = colorizer.render(data, img_format='WEBP')
+        self.assertTrue(webp.startswith(b'RIFF'))
+        decoded = _decode(webp)
+        np.testing.assert_array_equal(
+            np.moveaxis(decoded[:3], 0, -1), colorizer.colorize(data)[..., :3],
+        )
+
+
+def _decode(payload):
+    from rasterio.io import MemoryFile
+
+    with MemoryFile(payload) as memfile, memfile.open() as ds:
+        return ds.read()
+
+
+# ---------------------------------------------------------------------------
+# Tile formats
+# ---------------------------------------------------------------------------
+
+class TileFormatTests(unittest.TestCase):
+    def test_paletted_png_round_trips(self):
+        palette = np.array(
+            [(0, 0, 0, 0), (255, 0, 0, 255), (0, 0, 255, 128)], dtype=np.uint8,
+        )
+        indices = np.array([[0, 1, 2], [2, 1, 0]], dtype=np.uint8)
+        png = encode_paletted_png(indices, palette)
+
+        from rasterio.io import MemoryFile
+
+        with MemoryFile(png) as memfile, memfile.open() as ds:
+            np.testing.assert_array_equal(ds.read(1), indices)
+            colormap = ds.colormap(1)
+        self.assertEqual(colormap[1], (255, 0, 0, 255))
+        self.assertEqual(colormap[2], (0, 0, 255, 128))
+        self.assertEqual(colormap[0][3], 0)
+
+    def test_paletted_png_rejects_oversized_palette(self):
+        with self.assertRaises(ValueError):
+            encode_paletted_png(np.zeros((1, 1), np.uint8), np.zeros((300, 4), np.uint8))
+
+    def test_transparent_tile_in_each_format(self):
+        png, webp = transparent_tile_response(PNG), transparent_tile_response(WEBP)
+
+        self.assertEqual((png['Content-Type'], png.content), ('image/png', TRANSPARENT_PNG))
+        self.assertEqual(webp['Content-Type'], 'image/webp')
+        from rasterio.io import MemoryFile
+
+        with MemoryFile(webp.content) as memfile, memfile.open() as ds:
+            self.assertEqual((ds.width, ds.height), (256, 256))
+            self.assertFalse(ds.dataset_mask().any())
+        self.assertEqual(png['Vary'], 'Accept')
+        self.assertEqual(webp['Vary'], 'Accept')
+
+    def test_negotiation(self):
+        enabled = TileConfig(webp_enabled=True)
+        with patch('server.watershed.tiles.formats.get_tile_config', return_value=enabled):
+            self.assertIs(negotiate_tile_format('image/webp,*/*;q=0.8'), WEBP)
+            self.assertIs(negotiate_tile_format('image/png, image/webp;q=0.5'), WEBP)
+            self.assertIs(negotiate_tile_format('image/webp;q=0'), PNG)
+            self.assertIs(negotiate_tile_format('*/*'), PNG)
+            self.assertIs(negotiate_tile_format(''), PNG)
+        with patch('server.watershed.tiles.formats.get_tile_config', return_value=TileConfig()):
+            self.assertIs(negotiate_tile_format('image/webp'), PNG)
+
+
+# ---------------------------------------------------------------------------
+# Raw tile arrays
+# ---------------------------------------------------------------------------
+
+class RawTileArrayTests(unittest.TestCase):
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.cache = TileCache(root=Path(self._tmp.name), max_bytes=10_000_000)
+        self.reads = 0
+        values = np.arange(256 * 256, dtype=np.float32).reshape(1, 256, 256)
+        self.array = np.ma.MaskedArray(values, mask=values % 7 == 0)
+
+    def tearDown(self):
+        self._tmp.cleanup()
+
+    def _open_reader(self, url):
+        test = self
+
+        class _Reader:
+            def tile(self, x, y, z, tilesize):
+                test.reads += 1
+                return MagicMock(array=test.array)
+
+        reader = MagicMock()
+        reader.__enter__.return_value = _Reader()
+        return reader
+
+    def test_pack_round_trip(self):
+        restored = unpack_array(pack_array(self.array))
+        self.assertEqual(restored.dtype, np.float32)
+        np.testing.assert_array_equal(restored.data, self.array.data)
+        np.testing.assert_array_equal(restored.mask, self.array.mask)
+
+    def test_tile_is_decoded_once(self):
+        with patch('server.watershed.tiles.raw.get_raw_tile_cache', return_value=self.cache), \
+                patch('server.watershed.tiles.raw.source_revision', return_value='r1'), \
+                patch('server.watershed.tiles.raw.open_reader', side_effect=self._open_reader):
+            first = read_tile_array('https://example.com/a.tif', 10, 1, 2)
+            second = read_tile_array('https://example.com/a.tif', 10, 1, 2)
+            read_tile_array('https://example.com/b.tif', 10, 1, 2)
+
+        self.assertEqual(self.reads, 2)
+        np.testing.assert_array_equal(second.mask, first.mask)
+
+    def test_disabled_cache_always_reads(self):
+        disabled = TileCache(root=None, max_bytes=0)
+        with patch('server.watershed.tiles.raw.get_raw_tile_cache', return_value=disabled), \
+                patch('server.watershed.tiles.raw.open_reader', side_effect=self._open_reader):
+            read_tile_array('https://example.com/a.tif', 10, 1, 2)
+            read_tile_array('https://example.com/a.tif', 10, 1, 2)
+        self.assertEqual(self.reads, 2)
+
+    def test_replaced_local_raster_gets_new_key(self):
+        path = Path(self._tmp.name) / 'sbs.tif'
+        path.write_bytes(b'one')
+        before = raw_tile_key(str(path), 10, 1, 2)
+        os.utime(path, ns=(0, 1_000_000_000))
+        self.assertNotEqual(raw_tile_key(str(path), 10, 1, 2), before)
+
+    def test_changed_remote_revision_gets_new_key(self):
+        url = 'https://example.com/a.tif'
+        with patch('server.watershed.tiles.raw.source_revision', side_effect=['r1', 'r1', 'r2']):
+            first = raw_tile_key(url, 10, 1, 2)
+            self.assertEqual(raw_tile_key(url, 10, 1, 2), first)
+            self.assertNotEqual(raw_tile_key(url, 10, 1, 2), first)
+
+
+class MetatileTests(unittest.TestCase):
+    """Metatile reads against a small class-coded UTM raster."""
+
+    def setUp(self):
+        import rasterio
+        from rasterio.transform import from_origin
+        from rasterio.warp import transform
+
+        self._tmp = tempfile.TemporaryDirectory()
+        self.path = str(Path(self._tmp.name) / 'classes.tif')
+        size = 1024
+        data = (np.add.outer(np.arange(size) // 64, np.arange(size) // 64) % 4).astype(np.uint8)
+        data[:100] = 255
+        with rasterio.open(
+            self.path, 'w', driver='GTiff', width=size, height=size, count=1,
+            dtype='uint8', crs='EPSG:32611', nodata=255,
+            transform=from_origin(500_000, 5_200_000, 30, 30),
+        ) as dst:
+            dst.write(data, 1)
+        lon, lat = transform('EPSG:32611', 'EPSG:4326', [500_000 + size * 15], [5_200_000 - size * 15])
+        self.z = 13
+        self.x, self.y = _tile_for(lon[0], lat[0], self.z)
+
+    def tearDown(self):
+        self._tmp.cleanup()
+
+    def test_metatile_matches_single_tile_reads(self):
+        from rio_tiler.io import Reader
+
+        with Reader(self.path) as src:
+            block = read_metatile(src, self.z, self.x, self.y, 4)
+            self.assertIn((self.x, self.y), block)
+            self.assertEqual(len(block), 16)
+            for (x, y), tile in block.items():
+                single = src.tile(x, y, self.z).array
+                self.assertEqual(tile.shape, single.shape)
+                # Nearest-neighbour warps of a larger window may shift class
+                # boundaries by a fraction of a pixel; nothing more.
+                same = np.ma.filled(tile, 0) == np.ma.filled(single, 0)
+                self.assertGreater(same.mean(), 0.99)
+
+    def test_metatile_outside_raster_raises(self):
+        from rio_tiler.io import Reader
+
+        with Reader(self.path) as src, self.assertRaises(TileOutsideBounds):
+            read_metatile(src, self.z, self.x + 100, self.y, 4)
+
+    def test_neighbours_are_cached(self):
+        from rio_tiler.io import Reader
+
+        cache = TileCache(root=Path(self._tmp.name) / 'raw', max_bytes=100_000_000)
+        config = TileConfig(metatile_sbs=2)
+        with patch('server.watershed.tiles.raw.get_raw_tile_cache', return_value=cache), \
+                patch('server.watershed.tiles.raw.get_tile_config', return_value=config), \
+                patch('server.watershed.tiles.raw.open_reader', side_effect=lambda url: Reader(url)):
+            read_tile_array(self.path, self.z, self.x, self.y, family='sbs')
+
+        x0, y0 = self.x - self.x % 2, self.y - self.y % 2
+        for x, y in [(x0, y0), (x0 + 1, y0), (x0, y0 + 1), (x0 + 1, y0 + 1)]:
+            self.assertTrue(cache.path_for(raw_tile_key(self.path, self.z, x, y)).exists())
+
+
+# ---------------------------------------------------------------------------
+# Raw-data tiles
+# ---------------------------------------------------------------------------
+
+class QuantizationTests(unittest.TestCase):
+    def test_categorical_codes_stored_as_is(self):
+        q = Quantization.for_categories(13)
+        values = np.array([[[3, 6, 13, 0]]], dtype=np.int16)
+        mask = np.array([[[False, False, False, True]]])
+        stored = np.frombuffer(q.encode(np.ma.MaskedArray(values, mask=mask)), dtype='<u1')
+        np.testing.assert_array_equal(stored, [3, 6, 13, 255])
+
+    def test_categorical_float_codes(self):
+        q = Quantization.for_categories(300)
+        self.assertEqual(q.dtype, 'uint16')
+        values = np.array([[[300.0, 1.5, np.nan, -1.0]]], dtype=np.float32)
+        stored = np.frombuffer(q.encode(np.ma.MaskedArray(values, mask=False)), dtype='<u2')
+        np.testing.assert_array_equal(stored, [300, 65535, 65535, 65535])
+
+    def test_continuous_round_trip(self):
+        q = Quantization.for_range(-2.0, 3.0)
+        values = np.array([[[-2.0, 0.123456, 3.0, 10.0]]], dtype=np.float32)
+        stored = np.frombuffer(q.encode(np.ma.MaskedArray(values, mask=False)), dtype='<u2')
+        decoded = stored * q.scale + q.offset
+        np.testing.assert_allclose(decoded[:3], values[0, 0, :3], atol=q.scale / 2 + 1e-6)
+        self.assertEqual(decoded[3], 3.0)  # clipped to the layer range
+        self.assertNotIn(q.nodata, stored)
+
+    def test_empty_tile_and_headers(self):
+        q = Quantization.for_range(0.0, 1.0)
+        self.assertEqual(q.empty_tile(), b'\xff' * (2 * 256 * 256))
+        headers = q.headers()
+        self.assertEqual(headers['X-Tile-Dtype'], 'uint16')
+        self.assertEqual(float(headers['X-Tile-Scale']), q.scale)
+
+    def test_lut_metadata(self):
+        q = Quantization.for_categories(3)
+        lut = categorical_lut({0: (255, 0, 0, 255), 3: (0, 0, 255, 0)}, q)
+        self.assertEqual(lut['colors'], {'0': '#FF0000FF', '3': '#0000FF00'})
+        self.assertEqual(lut['nodata'], 255)
+
+        palette = {i: (i, 0, 0, 255) for i in range(256)}
+        lut = continuous_lut(palette, 1.0, 5.0, Quantization.for_range(0.0, 6.0))
+        self.assertEqual(len(lut['colors']), 256)
+        self.assertEqual(lut['colors'][255], '#FF0000FF')
+        self.assertEqual(lut['range'], [1.0, 5.0])
+
+    def test_spatial_quantization_covers_group_range(self):
+        from server.watershed.rhessys_spatial.registry import get_meta
+        from server.watershed.rhessys_spatial.tile import get_quantization
+
+        q = get_quantization(get_meta('canopy_cover_2021.tif'))
+        self.assertEqual(q.offset, 0.0)
+        self.assertAlmostEqual(q.scale * 65534, 1.05)
+        self.assertEqual(get_quantization(get_meta('fillna_surface_texture.tif')).dtype, 'uint8')
+
+
+# ---------------------------------------------------------------------------
+# Raster statistics store
+# ---------------------------------------------------------------------------
+
+class RasterStatsTests(unittest.TestCase):
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.path = Path(self._tmp.name) / 'map.tif'
+        data = np.zeros((512, 512), dtype=np.uint8)
+        data[:, 256:] = 200
+        data[:16] = 255
+        _write_geotiff(self.path, data=data, nodata=255)
+        clear_stats_cache()
+
+    def tearDown(self):
+        clear_stats_cache()
+        self._tmp.cleanup()
+
+    def test_compute_band_statistics(self):
+        stats = compute_raster_stats(str(self.path))
+
+        self.assertEqual((stats.min, stats.max), (0.0, 200.0))
+        self.assertAlmostEqual(stats.mean, 100.0)
+        # Percentiles are exact up to one fine histogram bin.
+        self.assertAlmostEqual(stats.percentile(2), 0.0, delta=200 / 65536)
+        self.assertAlmostEqual(stats.percentile(98), 200.0, delta=200 / 65536)
+        self.assertEqual(len(stats.histogram['counts']), HISTOGRAM_BINS)
+        self.assertEqual(sum(stats.histogram['counts']), stats.valid_pixels)
+        self.assertEqual(stats.valid_pixels, 496 * 512)
+        self.assertFalse(stats.approximate)
+
+    def test_large_raster_without_overviews_samples_blocks(self):
+        exact = compute_raster_stats(str(self.path), pixel_budget=0)
+        approx = compute_raster_stats(str(self.path), pixel_budget=512 * 64)
+
+        self.assertTrue(approx.approximate)
+        self.assertLess(approx.valid_pixels, exact.valid_pixels)
+        self.assertLessEqual(exact.min, approx.min)
+        self.assertLessEqual(approx.max, exact.max)
+        self.assertAlmostEqual(approx.mean, exact.mean, delta=5)
+
+    def test_large_raster_with_overviews_reads_an_overview(self):
+        import rasterio
+        from rasterio.enums import Resampling
+
+        with rasterio.open(self.path, 'r+') as dst:
+            dst.build_overviews([2, 4, 8], Resampling.average)
+
+        stats = compute_raster_stats(str(self.path), pixel_budget=128 * 128)
+
+        self.assertTrue(stats.approximate)
+        self.assertLessEqual(stats.valid_pixels, 128 * 128)
+        self.assertGreaterEqual(stats.min, 0.0)
+        self.assertLessEqual(stats.max, 200.0)
+        self.assertAlmostEqual(stats.mean, 100.0, delta=5)
+
+    def test_raster_within_budget_is_read_in_full(self):
+        stats = compute_raster_stats(str(self.path), pixel_budget=512 * 512)
+        self.assertFalse(stats.approximate)
+        self.assertEqual(stats.valid_pixels, 496 * 512)
+
+    def test_each_revision_is_scanned_once(self):
+        stored = {}
+
+        def load(source, revision):
+            return stored.get((source, revision))
+
+        def store(source, revision, stats):
+            stored[(source, revision)] = stats
+
+        with patch('server.watershed.tiles.stats._load_stats', side_effect=load), \
+                patch('server.watershed.tiles.stats._store_stats', side_effect=store), \
+                patch('server.watershed.tiles.stats.compute_raster_stats',
+                      wraps=compute_raster_stats) as compute:
+            first = get_raster_stats(str(self.path))
+            clear_stats_cache()  # e.g. a restarted worker
+            second = get_raster_stats(str(self.path))
+            self.assertEqual(compute.call_count, 1)
+            self.assertEqual(first, second)
+
+            # A re-mirrored raster has a new revision and is scanned again.
+            self.path.with_name('map.tif.json').write_text('{"etag": "\\"v2\\""}')
+            clear_stats_cache()
+            get_raster_stats(str(self.path))
+            self.assertEqual(compute.call_count, 2)
+
+    def test_unknown_revision_reuses_stored_statistics(self):
+        stored = {('https://example.com/a.tif', 'r1'): 'stats of r1'}
+
+        def load(source, revision):
+            if not revision:
+                return next((v for (s, _), v in stored.items() if s == source), None)
+            return stored.get((source, revision))
+
+        with patch('server.watershed.versioning.probe_revision', return_value=None), \
+                patch('server.watershed.versioning._source_revision_cache') as revisions, \
+                patch('server.watershed.tiles.stats._load_stats', side_effect=load), \
+                patch('server.watershed.tiles.stats.compute_raster_stats') as compute:
+            revisions.get.return_value = None
+            stats = get_raster_stats('https://example.com/a.tif')
+
+        self.assertEqual(stats, 'stats of r1')
+        compute.assert_not_called()
+        # The failed probe is retried soon rather than cached for an hour.
+        revisions.set.assert_called_once_with('https://example.com/a.tif', '', ttl=60)
+
+    def test_source_revision_of_local_files(self):
+        token = source_revision(str(self.path))
+        self.assertTrue(token)
+
+        self.path.with_name('map.tif.json').write_text('{"etag": "\\"abc\\""}')
+        self.assertEqual(source_revision(str(self.path)), revision_token({'etag': '"abc"'}))
+        self.assertEqual(source_revision(str(Path(self._tmp.name) / 'missing.tif')), '')
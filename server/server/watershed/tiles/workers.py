@@ -0,0 +1,208 @@
+"""
+Process pool for CPU-bound tile rendering.
+
+Reading, warping, colorizing and encoding a tile is mostly NumPy and GDAL
+work, but enough of it holds the GIL that rendering in a gthread request
+thread slows down every other request of the worker (GeoJSON serialization
+in particular).  With ``TILE_RENDER_PROCESSES`` > 0 the tile views hand the
+render to a pool of that many processes per gunicorn worker and wait for
+the encoded bytes, so raster work spreads over the cores while request
+threads stay responsive.
+
+  - At most ``TILE_RENDER_PROCESSES + TILE_RENDER_QUEUE`` renders are in
+    flight per worker; beyond that a tile request fails fast with ``503``
+    instead of queueing indefinitely.
+  - A render that does not finish within ``TILE_RENDER_TIMEOUT`` seconds
+    (default 30) also answers ``503``; the process finishes it in the
+    background.
+  - A render process that dies (e.g. a GDAL crash) only fails the renders
+    it was running; the pool is rebuilt for the next request.
+
+Render processes are started with ``spawn`` (forking a threaded gunicorn
+worker is unsafe) and run ``django.setup()`` before their first render.  They
+share the raw tile cache, raster statistics and the shared cache with the
+request workers, but have their own reader pool and GDAL block cache.  Their
+fills only coalesce within the process (see ``singleflight.py``): the
+request thread already holds the tile's cross-worker lock, and a render
+waiting on another lock stripe could outlast ``TILE_RENDER_TIMEOUT``.
+Rendered bytes are stored in the tile cache by the calling worker, as
+before.  With ``TILE_RENDER_PROCESSES=0`` (the default) tiles render in the
+request thread.
+"""
+
+from __future__ import annotations
+
+import logging
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from typing import Callable, Optional, TypeVar
+
+import django
+from rest_framework.exceptions import APIException
+
+logger = logging.getLogger("watershed.tiles")
+
+T = TypeVar("T")
+
+
+class RenderUnavailable(APIException):
+    """The render pool is saturated, timed out or lost a process."""
+    status_code = 503
+    default_detail = "Tile rendering is temporarily unavailable; retry shortly."
+    default_code = "render_unavailable"
+
+
+def _init_render_process() -> None:
+    """
+    Set up Django in a new render process.
+
+    Referenced by name in the child, so this module must not import models
+    (``.config`` pulls them in through the loaders) before Django is set up.
+    The calling request thread holds the tile's cross-worker lock for the
+    whole render, so fills in the render process (raw arrays, statistics)
+    must not wait on lock stripes themselves.
+    """
+    django.setup()
+
+    from server.watershed.singleflight import mark_nested
+
+    mark_nested()
+
+
+class RenderPool:
+    """
+    Bounded pool of render processes.
+
+    ``processes=0`` disables it: :meth:`run` calls the function inline.
+    """
+
+    def __init__(self, processes: int, queue_depth: int, timeout: float):
+        self.processes = processes
+        self.queue_depth = queue_depth
+        self.timeout = timeout
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._slots = threading.BoundedSemaphore(processes + queue_depth) if processes > 0 else None
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+        self.rejected = 0
+        self.timeouts = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.processes > 0
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._executor is None or self._pid != os.getpid():
+                # A forked child must not reuse the parent's processes.
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.processes,
+                    mp_context=multiprocessing.get_context("spawn"),
+                    initializer=_init_render_process,
+                )
+                self._pid = os.getpid()
+            return self._executor
+
+    def _discard_executor(self, executor: ProcessPoolExecutor) -> None:
+        with self._lock:
+            if self._executor is executor:
+                self._executor = None
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    def run(self, fn: Callable[..., T], *args, **kwargs) -> T:
+        """
+        Return ``fn(*args, **kwargs)`` computed in a render process.
+
+        *fn* must be a module-level function and its arguments picklable.
+        Exceptions raised by *fn* propagate unchanged; a saturated pool, a
+        timeout or a crashed process raise :class:`RenderUnavailable`.
+        """
+        if not self.enabled:
+            return fn(*args, **kwargs)
+
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self.rejected += 1
+            raise RenderUnavailable("Too many tiles are being rendered; retry shortly.")
+
+        executor = self._get_executor()
+        try:
+            future = executor.submit(fn, *args, **kwargs)
+        except BrokenProcessPool:
+            self._slots.release()
+            self._discard_executor(executor)
+            raise RenderUnavailable()
+        # The slot is held until the process is done, even if we stop waiting.
+        future.add_done_callback(lambda _future: self._slots.release())
+
+        try:
+            return future.result(timeout=self.timeout)
+        except FutureTimeoutError:
+            future.cancel()
+            with self._lock:
+                self.timeouts += 1
+            logger.warning("Tile render %s%r timed out after %ss", fn.__name__, args, self.timeout)
+            raise RenderUnavailable("Tile rendering timed out; retry shortly.")
+        except BrokenProcessPool:
+            logger.error("A tile render process died; restarting the render pool")
+            self._discard_executor(executor)
+            raise RenderUnavailable()
+
+    def shutdown(self) -> None:
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True, cancel_futures=True)
+
+    def stats(self) -> dict:
+        """Return this process's pool settings and rejection counters."""
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "processes": self.processes,
+                "queue_depth": self.queue_depth,
+                "rejected": self.rejected,
+                "timeouts": self.timeouts,
+            }
+
+
+_default_pool: Optional[RenderPool] = None
+_default_pool_lock = threading.Lock()
+
+
+def get_render_pool() -> RenderPool:
+    """
+    Get the process-wide render pool.
+
+    Lazily initializes from the tile configuration on first call.
+    """
+    global _default_pool
+    if _default_pool is None:
+        with _default_pool_lock:
+            if _default_pool is None:
+                from .config import get_tile_config
+
+                cfg = get_tile_config()
+                _default_pool = RenderPool(
+                    processes=cfg.render_processes,
+                    queue_depth=cfg.render_queue_depth,
+                    timeout=cfg.render_timeout,
+                )
+    return _default_pool
+
+
+def reset_render_pool() -> None:
+    """Stop the render processes and reset the singleton (useful for testing)."""
+    global _default_pool
+    if _default_pool is not None:
+        _default_pool.shutdown()
+    _default_pool = None
+
+
+def render_in_pool(fn: Callable[..., T], *args, **kwargs) -> T:
+    """Run a tile render through the process-wide render pool."""
+    return get_render_pool().run(fn, *args, **kwargs)
@@ -0,0 +1,254 @@
+"""
+Shared HTTP client for upstream (WEPPcloud) requests.
+
+Discovery scrapes, the geometry proxy, revision probes and the data loader
+all talk to the same few hosts.  Routing them through one process-wide
+``requests.Session`` keeps connections alive between calls, so repeated
+requests skip the TCP and TLS handshakes.  The client also provides:
+
+  - per-host connection limits: at most ``UPSTREAM_MAX_CONNECTIONS_PER_HOST``
+    connections per host (default 8; callers beyond it wait for a free
+    connection), for up to ``UPSTREAM_MAX_HOSTS`` hosts (default 10);
+  - gzip negotiation (``Accept-Encoding: gzip, deflate``), decoded
+    transparently;
+  - consistent timeouts: ``UPSTREAM_CONNECT_TIMEOUT`` (default 5 s) to
+    connect and ``UPSTREAM_READ_TIMEOUT`` (default 30 s) between bytes,
+    unless a call passes its own;
+  - per-host metrics: requests, errors, new connections, connect time,
+    time to first byte and transfer time (see :func:`get_upstream_metrics`),
+    with a DEBUG log line per request on the ``watershed.upstream`` logger.
+
+The session is created lazily in each process, so gunicorn workers never
+share sockets inherited from the master.
+"""
+
+from __future__ import annotations
+
+import logging
+import os
+import threading
+import time
+from dataclasses import asdict, dataclass
+from typing import Optional
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+from server.watershed.loaders.config import _get_env_float, _get_env_int
+
+logger = logging.getLogger("watershed.upstream")
+
+
+@dataclass
+class UpstreamConfig:
+    """
+    Configuration for the shared upstream HTTP client.
+
+    Attributes:
+        max_hosts: Hosts whose connection pools are kept
+        max_connections_per_host: Connections kept open (and in use) per host
+        connect_timeout: Seconds to establish a connection
+        read_timeout: Seconds to wait between received bytes
+    """
+    max_hosts: int = 10
+    max_connections_per_host: int = 8
+    connect_timeout: float = 5.0
+    read_timeout: float = 30.0
+
+    @classmethod
+    def from_environment(cls) -> "UpstreamConfig":
+        """Create config from environment variables."""
+        return cls(
+            max_hosts=max(1, _get_env_int("UPSTREAM_MAX_HOSTS", cls.max_hosts)),
+            max_connections_per_host=max(
+                1, _get_env_int("UPSTREAM_MAX_CONNECTIONS_PER_HOST", cls.max_connections_per_host),
+            ),
+            connect_timeout=_get_env_float("UPSTREAM_CONNECT_TIMEOUT", cls.connect_timeout),
+            read_timeout=_get_env_float("UPSTREAM_READ_TIMEOUT", cls.read_timeout),
+        )
+
+    @property
+    def timeout(self) -> tuple[float, float]:
+        return (self.connect_timeout, self.read_timeout)
+
+
+@dataclass
+class HostMetrics:
+    """Cumulative request metrics for one upstream host."""
+    requests: int = 0
+    errors: int = 0
+    connections: int = 0
+    connect_seconds: float = 0.0
+    ttfb_seconds: float = 0.0
+    transfer_seconds: float = 0.0
+    bytes: int = 0
+
+
+# Connection setup time of the current request, filled in by the connection
+# classes below (connections are opened on the requesting thread).
+_connect_timing = threading.local()
+
+
+def _record_connect(seconds: float) -> None:
+    _connect_timing.count = getattr(_connect_timing, "count", 0) + 1
+    _connect_timing.seconds = getattr(_connect_timing, "seconds", 0.0) + seconds
+
+
+class _TimedHTTPConnection(HTTPConnection):
+    def connect(self):
+        start = time.perf_counter()
+        super().connect()
+        _record_connect(time.perf_counter() - start)
+
+
+class _TimedHTTPSConnection(HTTPSConnection):
+    def connect(self):
+        # Includes the TLS handshake.
+        start = time.perf_counter()
+        super().connect()
+        _record_connect(time.perf_counter() - start)
+
+
+class _TimedHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = _TimedHTTPConnection
+
+
+class _TimedHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = _TimedHTTPSConnection
+
+
+class _PooledAdapter(HTTPAdapter):
+    """HTTPAdapter whose connections report their setup time."""
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            "http": _TimedHTTPConnectionPool,
+            "https": _TimedHTTPSConnectionPool,
+        }
+
+
+_config: Optional[UpstreamConfig] = None
+_session: Optional[requests.Session] = None
+_session_pid: Optional[int] = None
+_metrics: dict[str, HostMetrics] = {}
+_lock = threading.Lock()
+
+
+def get_upstream_config() -> UpstreamConfig:
+    """
+    Get the default upstream client configuration.
+
+    Lazily initializes from environment on first call.
+    """
+    global _config
+    if _config is None:
+        _config = UpstreamConfig.from_environment()
+    return _config
+
+
+def _new_session(config: UpstreamConfig) -> requests.Session:
+    session = requests.Session()
+    adapter = _PooledAdapter(
+        pool_connections=config.max_hosts,
+        pool_maxsize=config.max_connections_per_host,
+        pool_block=True,
+    )
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    session.headers["Accept-Encoding"] = "gzip, deflate"
+    return session
+
+
+def get_session() -> requests.Session:
+    """Return this process's shared upstream session."""
+    global _session, _session_pid
+    with _lock:
+        if _session is None or _session_pid != os.getpid():
+            _session = _new_session(get_upstream_config())
+            _session_pid = os.getpid()
+        return _session
+
+
+def _record(host: str, seconds: dict, size: int, connections: int, failed: bool) -> None:
+    with _lock:
+        metrics = _metrics.setdefault(host, HostMetrics())
+        metrics.requests += 1
+        metrics.errors += failed
+        metrics.connections += connections
+        metrics.connect_seconds += seconds["connect"]
+        metrics.ttfb_seconds += seconds["ttfb"]
+        metrics.transfer_seconds += seconds["transfer"]
+        metrics.bytes += size
+
+
+def request(method: str, url: str, **kwargs) -> requests.Response:
+    """
+    Send a request through the shared session and record its metrics.
+
+    Takes the arguments of ``requests.request``; ``timeout`` defaults to the
+    configured connect/read timeouts.  Raises ``requests.RequestException``
+    like ``requests`` does.  Responses with ``stream=True`` are recorded up
+    to their headers only.
+    """
+    kwargs.setdefault("timeout", get_upstream_config().timeout)
+    host = urlsplit(url).netloc.lower()
+
+    _connect_timing.count, _connect_timing.seconds = 0, 0.0
+    start = time.perf_counter()
+    try:
+        response = get_session().request(method, url, **kwargs)
+    except requests.RequestException:
+        total = time.perf_counter() - start
+        _record(host, {"connect": _connect_timing.seconds, "ttfb": 0.0, "transfer": total},
+                0, _connect_timing.count, failed=True)
+        raise
+    total = time.perf_counter() - start
+
+    # ``elapsed`` runs from sending the request to parsing the headers.
+    ttfb = min(response.elapsed.total_seconds(), total)
+    seconds = {
+        "connect": _connect_timing.seconds,
+        "ttfb": ttfb,
+        "transfer": total - ttfb,
+    }
+    size = 0 if kwargs.get("stream") else len(response.content)
+    _record(host, seconds, size, _connect_timing.count, failed=response.status_code >= 500)
+    logger.debug(
+        "%s %s -> %d (%s connect=%.3fs ttfb=%.3fs transfer=%.3fs bytes=%d)",
+        method, url, response.status_code,
+        "new connection" if _connect_timing.count else "reused connection",
+        seconds["connect"], seconds["ttfb"], seconds["transfer"], size,
+    )
+    return response
+
+
+def get(url: str, **kwargs) -> requests.Response:
+    """GET *url* through the shared session (see :func:`request`)."""
+    return request("GET", url, **kwargs)
+
+
+def head(url: str, **kwargs) -> requests.Response:
+    """HEAD *url* through the shared session (see :func:`request`)."""
+    return request("HEAD", url, **kwargs)
+
+
+def get_upstream_metrics() -> dict[str, dict]:
+    """Return a snapshot of the per-host metrics of this process."""
+    with _lock:
+        return {host: asdict(m) for host, m in _metrics.items()}
+
+
+def reset_upstream() -> None:
+    """Close the session and drop configuration and metrics (useful for testing)."""
+    global _config, _session, _session_pid
+    with _lock:
+        if _session is not None:
+            _session.close()
+        _config = None
+        _session = None
+        _session_pid = None
+        _metrics.clear()
@@ -1,9 +1,27 @@
 from rest_framework import routers
 from django.urls import path, include
-from server.watershed.views import WatershedViewSet, WatershedSubcatchmentListView, WatershedChannelListView
-from server.watershed.sbs_raster.views import SbsColormapView, SbsRasterTileView
-from server.watershed.rhessys_spatial.views import RhessysSpatialListView, RhessysSpatialTileView
-from server.watershed.rhessys_outputs.views import RhessysOutputListView, RhessysOutputTileView, RhessysOutputGeometryView
+from server.watershed.views import (
+    WatershedChannelListView,
+    WatershedChannelTileView,
+    WatershedSubcatchmentListView,
+    WatershedSubcatchmentTileView,
+    WatershedTileView,
+    WatershedViewSet,
+)
+from server.watershed.sbs_raster.views import SbsColormapView, SbsLutView, SbsRasterDataTileView, SbsRasterTileView
+from server.watershed.rhessys_spatial.views import (
+    RhessysSpatialDataTileView,
+    RhessysSpatialListView,
+    RhessysSpatialLutView,
+    RhessysSpatialTileView,
+)
+from server.watershed.rhessys_outputs.views import (
+    RhessysOutputDataTileView,
+    RhessysOutputGeometryView,
+    RhessysOutputListView,
+    RhessysOutputLutView,
+    RhessysOutputTileView,
+)
 
 # Use router to automatically manage API endpoints based on registered viewsets
 router = routers.DefaultRouter()
@@ -11,23 +29,56 @@ router.register('', WatershedViewSet, basename='watershed')
 
 # Make router routes accessible to project URL configuration
 urlpatterns = [
+    path('tiles/<int:z>/<int:x>/<int:y>.mvt', WatershedTileView.as_view(), name='watershed-tiles'),
     path('', include(router.urls)),
     path('<str:runid>/subcatchments', WatershedSubcatchmentListView.as_view(), name='watershed-subcatchments'),
+    path(
+        '<str:runid>/subcatchments/tiles/<int:z>/<int:x>/<int:y>.mvt',
+        WatershedSubcatchmentTileView.as_view(),
+        name='watershed-subcatchments-tiles',
+    ),
     path('<str:runid>/channels', WatershedChannelListView.as_view(), name='watershed-channels'),
+    path(
+        '<str:runid>/channels/tiles/<int:z>/<int:x>/<int:y>.mvt',
+        WatershedChannelTileView.as_view(),
+        name='watershed-channels-tiles',
+    ),
     path('sbs/colormap', SbsColormapView.as_view(), name='sbs-colormap'),
+    path('sbs/lut', SbsLutView.as_view(), name='sbs-lut'),
     path('<str:runid>/sbs/tiles/<int:z>/<int:x>/<int:y>.png', SbsRasterTileView.as_view(), name='sbs-tile'),
+    path('<str:runid>/sbs/tiles/<int:z>/<int:x>/<int:y>.bin', SbsRasterDataTileView.as_view(), name='sbs-data-tile'),
     path('<str:runid>/rhessys/spatial-inputs', RhessysSpatialListView.as_view(), name='rhessys-spatial-list'),
     path(
         '<str:runid>/rhessys/spatial-inputs/<str:filename>/tiles/<int:z>/<int:x>/<int:y>.png',
         RhessysSpatialTileView.as_view(),
         name='rhessys-spatial-tile',
     ),
+    path(
+        '<str:runid>/rhessys/spatial-inputs/<str:filename>/tiles/<int:z>/<int:x>/<int:y>.bin',
+        RhessysSpatialDataTileView.as_view(),
+        name='rhessys-spatial-data-tile',
+    ),
+    path(
+        '<str:runid>/rhessys/spatial-inputs/<str:filename>/lut',
+        RhessysSpatialLutView.as_view(),
+        name='rhessys-spatial-lut',
+    ),
     path('<str:runid>/rhessys/outputs', RhessysOutputListView.as_view(), name='rhessys-outputs-list'),
     path(
         '<str:runid>/rhessys/outputs/<str:scenario>/<str:variable>/tiles/<int:z>/<int:x>/<int:y>.png',
         RhessysOutputTileView.as_view(),
         name='rhessys-outputs-tile',
     ),
+    path(
+        '<str:runid>/rhessys/outputs/<str:scenario>/<str:variable>/tiles/<int:z>/<int:x>/<int:y>.bin',
+        RhessysOutputDataTileView.as_view(),
+        name='rhessys-outputs-data-tile',
+    ),
+    path(
+        '<str:runid>/rhessys/outputs/<str:scenario>/<str:variable>/lut',
+        RhessysOutputLutView.as_view(),
+        name='rhessys-outputs-lut',
+    ),
     path(
         '<str:runid>/rhessys/outputs/geometry/<str:scale>',
         RhessysOutputGeometryView.as_view(),
@@ -19,6 +19,7 @@ class LoadPhase(Enum):
     LOADING_CHANNELS = "loading_channels"
     LOADING_PARQUET = "loading_parquet"
     SIMPLIFYING_GEOMETRY = "simplifying_geometry"
+    SEEDING_TILES = "seeding_tiles"
     COMPLETE = "complete"
 
 
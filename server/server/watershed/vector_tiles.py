@@ -0,0 +1,151 @@
+"""
+Mapbox Vector Tiles for the watershed, subcatchment and channel layers.
+
+The GeoJSON endpoints send every feature of a layer at full detail.  Vector
+tiles are cut by PostGIS instead: for tile (z, x, y) the query
+
+  - selects only features whose geometry overlaps the tile (``&&`` on the
+    GiST index of the geometry column);
+  - simplifies them in Web Mercator to one tile unit (``ST_Simplify``) and
+    clips and quantizes them to the tile (``ST_AsMVTGeom``, 4096 units per
+    side with a 64-unit buffer);
+  - encodes the result with ``ST_AsMVT`` in one round-trip.
+
+Feature properties are the same lists the GeoJSON views select.  An integer
+id field becomes the MVT feature id; any other id field (the watershed
+``runid``) is sent as a property.
+
+The geometry can be read from another expression than the indexed field,
+e.g. a stored level of detail (see ``geometry_levels.py``), so low-zoom
+tiles of the national map never touch the full-resolution boundaries.
+"""
+
+import math
+
+from django.contrib.gis.db.models import GeometryField
+from django.contrib.gis.db.models.functions import Transform
+from django.contrib.gis.geos import Polygon
+from django.db import connections, models
+from django.db.models import Func, Value
+from django.db.models.functions import Cast
+from django.http import HttpResponse
+
+MVT_CONTENT_TYPE = "application/vnd.mapbox-vector-tile"
+
+# Tile coordinate space and clipping buffer, in tile units.
+EXTENT = 4096
+BUFFER = 64
+
+MAX_ZOOM = 22
+
+_WEB_MERCATOR = 3857
+_EARTH_CIRCUMFERENCE = 2 * math.pi * 6378137
+
+# Geometry alias in the row passed to ST_AsMVT.
+_GEOM_ALIAS = "_mvt_geom"
+
+
+def tile_exists(z: int, x: int, y: int) -> bool:
+    """True for a valid Web Mercator tile address up to ``MAX_ZOOM``."""
+    return 0 <= z <= MAX_ZOOM and 0 <= x < (1 << z) and 0 <= y < (1 << z)
+
+
+def tile_bounds(z: int, x: int, y: int) -> tuple[float, float, float, float]:
+    """Return the (west, south, east, north) bounds of a tile in EPSG:4326."""
+    n = 1 << z
+
+    def lat(row: int) -> float:
+        return math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * row / n))))
+
+    return (x / n * 360 - 180, lat(y + 1), (x + 1) / n * 360 - 180, lat(y))
+
+
+def _unit_meters(z: int) -> float:
+    """Size of one tile unit at zoom *z* in Web Mercator meters."""
+    return _EARTH_CIRCUMFERENCE / (1 << z) / EXTENT
+
+
+def _int(value: int) -> Cast:
+    return Cast(Value(value), models.IntegerField())
+
+
+def _mvt_geometry(source, z: int, x: int, y: int) -> Func:
+    """``ST_AsMVTGeom`` of *source* simplified and clipped for tile (z, x, y)."""
+    geometry = GeometryField(srid=_WEB_MERCATOR)
+    envelope = Func(_int(z), _int(x), _int(y), function="ST_TileEnvelope", output_field=geometry)
+    simplified = Func(
+        Transform(source, _WEB_MERCATOR),
+        Value(_unit_meters(z)),
+        Value(True),
+        function="ST_Simplify",
+        output_field=geometry,
+    )
+    return Func(
+        simplified,
+        envelope,
+        _int(EXTENT),
+        _int(BUFFER),
+        Value(True),
+        function="ST_AsMVTGeom",
+        output_field=geometry,
+    )
+
+
+def mvt_tile(
+    queryset,
+    layer,
+    z,
+    x,
+    y,
+    geo_field="geom",
+    id_field=None,
+    properties=(),
+    source=None,
+):
+    """
+    Return the encoded vector tile (z, x, y) of *queryset* as bytes.
+
+    Features are selected by *geo_field*; their geometry is taken from
+    *source* (a field name or geometry expression, default *geo_field*).
+    A tile without features is empty (``b""``), which clients treat as a
+    blank tile.
+    """
+    meta = queryset.model._meta
+    if id_field is None:
+        id_field = meta.pk.name
+
+    if source is None:
+        source = geo_field
+    if isinstance(source, str):
+        source = models.F(source)
+
+    bbox = Polygon.from_bbox(tile_bounds(z, x, y))
+    bbox.srid = 4326
+
+    id_is_integer = isinstance(meta.get_field(id_field), (models.IntegerField, models.AutoField))
+    fields = list(dict.fromkeys([id_field, *properties]))
+    rows = (
+        queryset
+        .filter(**{f"{geo_field}__bboverlaps": bbox})
+        .annotate(**{_GEOM_ALIAS: _mvt_geometry(source, z, x, y)})
+        .values(*fields, _GEOM_ALIAS)
+    )
+    sql, params = rows.query.sql_with_params()
+
+    # ST_AsMVT(row, layer name, extent, geometry column[, feature id column])
+    args = [layer, EXTENT, _GEOM_ALIAS]
+    if id_is_integer:
+        args.append(meta.get_field(id_field).column)
+    placeholders = ", ".join(["%s"] * len(args))
+    with connections[queryset.db].cursor() as cursor:
+        cursor.execute(
+            f"SELECT ST_AsMVT(t, {placeholders}) FROM ({sql}) AS t WHERE t.{_GEOM_ALIAS} IS NOT NULL",
+            [*args, *params],
+        )
+        row = cursor.fetchone()
+    return bytes(row[0]) if row and row[0] is not None else b""
+
+
+def mvt_response(queryset, layer, z, x, y, **kwargs):
+    """Build a vector tile response (see :func:`mvt_tile`)."""
+    return HttpResponse(mvt_tile(queryset, layer, z, x, y, **kwargs), content_type=MVT_CONTENT_TYPE)
@@ -0,0 +1,292 @@
+"""
+Data versioning for conditional HTTP caching.
+
+Every GeoJSON and tile response carries a version token derived from:
+
+  - the data *generation*: a counter in ``DataGeneration`` bumped by the
+    loader after each load and by ``mirror_rasters`` whenever a raster
+    changes (``bump_data_version`` bumps it by hand, e.g. after a deploy
+    that changes tile styling);
+  - for raster tiles, the raster's upstream *revision* (ETag, or
+    Last-Modified + size), recorded in ``RasterRevision`` when the raster
+    is discovered or mirrored.
+
+The token becomes a strong ``ETag`` (suffixed with the representation, e.g.
+``png`` or ``webp``), so revalidating clients get a ``304 Not Modified``
+before anything is rendered or queried.  Responses are ``Cache-Control:
+no-cache`` (always revalidate) unless the request URL is stamped with the
+current token (``?v=<token>``, as returned in ``X-Data-Version`` and by the
+discovery endpoints), in which case they are cacheable for a year and
+marked ``immutable``: a new version always comes with a new URL.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Optional
+
+import requests
+from django.db import DatabaseError, transaction
+from django.db.models import F
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response, patch_cache_control
+
+from server.watershed import upstream
+from server.watershed.shared_cache import SharedCache
+from server.watershed.tiles.mirror import read_revision
+
+logger = logging.getLogger("watershed.versioning")
+
+DATA_SCOPE = "data"
+
+VERSION_PARAM = "v"
+VERSION_HEADER = "X-Data-Version"
+
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+
+# Workers share the cached generation and a bump on this host drops it, so
+# the TTL only bounds how long other hosts (or a manual database edit) go
+# unnoticed.
+_GENERATION_TTL = 5
+
+_generation_cache = SharedCache("generation", ttl=_GENERATION_TTL)
+
+# (runid, rel_path) → revision token, or "" when none is recorded.
+_revision_cache = SharedCache("raster-revision", ttl=300)
+
+# Remote raster URL → revision token from a HEAD request.
+_source_revision_cache = SharedCache("source-revision", ttl=3600)
+
+# A failed probe is retried after this many seconds instead of an hour.
+_FAILED_PROBE_TTL = 60
+
+
+def get_generation(scope: str = DATA_SCOPE) -> int:
+    """Return the current generation of *scope* (0 before the first bump)."""
+    cached = _generation_cache.get(scope)
+    if cached is not None:
+        return cached
+
+    from server.watershed.models import DataGeneration
+
+    try:
+        value = (
+            DataGeneration.objects
+            .filter(scope=scope)
+            .values_list("value", flat=True)
+            .first()
+        )
+    except DatabaseError as exc:
+        logger.warning("Generation lookup failed for %s: %s", scope, exc)
+        return 0
+
+    value = value or 0
+    _generation_cache.set(scope, value)
+    return value
+
+
+def bump_generation(scope: str = DATA_SCOPE) -> int:
+    """Atomically increment the generation of *scope* and return the new value."""
+    from server.watershed.models import DataGeneration
+
+    with transaction.atomic():
+        DataGeneration.objects.get_or_create(scope=scope)
+        DataGeneration.objects.filter(scope=scope).update(value=F("value") + 1)
+        value = DataGeneration.objects.get(scope=scope).value
+    _generation_cache.delete(scope)
+    return value
+
+
+def revision_token(revision: Optional[dict]) -> str:
+    """
+    Reduce an upstream revision (``etag``, ``last_modified``,
+    ``content_length``) to a short token, or ``""`` if it identifies nothing.
+    """
+    if not revision:
+        return ""
+    if revision.get("etag"):
+        basis = f"etag:{revision['etag']}"
+    elif revision.get("last_modified") or revision.get("content_length"):
+        basis = f"lm:{revision.get('last_modified')}:{revision.get('content_length')}"
+    else:
+        return ""
+    return hashlib.sha1(basis.encode()).hexdigest()[:16]
+
+
+def probe_revision(url: str, timeout: float = 5) -> Optional[dict]:
+    """Read the upstream revision of a remote raster with a HEAD request."""
+    try:
+        resp = upstream.head(url, timeout=timeout, allow_redirects=True)
+    except requests.RequestException as exc:
+        logger.info("Revision probe failed for %s: %s", url, exc)
+        return None
+    if resp.status_code != 200:
+        return None
+    headers = resp.headers
+    return {
+        "etag": headers.get("ETag"),
+        "last_modified": headers.get("Last-Modified"),
+        "content_length": headers.get("Content-Length"),
+    }
+
+
+def record_raster_revision(runid: str, rel_path: str, revision: Optional[dict]) -> bool:
+    """
+    Store the upstream revision of a raster.
+
+    Returns True if it differs from the one recorded before (including when
+    none was); revisions that identify nothing are not stored.
+    """
+    from server.watershed.models import RasterRevision
+
+    token = revision_token(revision)
+    if not token:
+        return False
+    try:
+        _, created = RasterRevision.objects.get_or_create(
+            runid=runid, rel_path=rel_path, defaults={"revision": token},
+        )
+        changed = created or RasterRevision.objects.filter(
+            runid=runid, rel_path=rel_path,
+        ).exclude(revision=token).update(revision=token) > 0
+    except DatabaseError as exc:
+        logger.warning("Could not record revision of %s %s: %s", runid, rel_path, exc)
+        return False
+    _revision_cache.set((runid, rel_path), token)
+    return changed
+
+
+def record_discovered_revision(runid: str, rel_path: str, url: str) -> None:
+    """
+    Record the revision of a raster found by a discovery scan: the one
+    saved by ``mirror_rasters`` for mirrored rasters, a HEAD request for
+    remote ones.  When it differs from the recorded one (or none was), the
+    raster's cached tiles are dropped, so a raster replaced upstream is
+    re-rendered once its catalog entry is refreshed.
+    """
+    revision = read_revision(runid, rel_path) or probe_revision(url)
+    if record_raster_revision(runid, rel_path, revision):
+        # Tiles cached under another (or no) revision may be of other bytes.
+        from server.watershed.tiles.layers import invalidate_raster
+
+        invalidate_raster(runid, rel_path)
+
+
+def raster_revision(runid: str, rel_path: str) -> str:
+    """Return the recorded revision token of a raster, or ``""``."""
+    key = (runid, rel_path)
+    cached = _revision_cache.get(key)
+    if cached is not None:
+        return cached
+
+    from server.watershed.models import RasterRevision
+
+    try:
+        token = (
+            RasterRevision.objects
+            .filter(runid=runid, rel_path=rel_path)
+            .values_list("revision", flat=True)
+            .first()
+        )
+    except DatabaseError as exc:
+        logger.warning("Revision lookup failed for %s %s: %s", runid, rel_path, exc)
+        return ""
+
+    token = token or ""
+    _revision_cache.set(key, token)
+    return token
+
+
+def source_revision(source: str) -> str:
+    """
+    Return the revision token of a raster source (local path or URL).
+
+    Mirrored files use the upstream revision saved next to them by
+    ``mirror_rasters``, falling back to their mtime and size; remote URLs
+    are probed with a HEAD request at most once an hour (once a minute
+    while the probe fails).  ``""`` means the revision is unknown.
+    """
+    if "://" not in source:
+        path = Path(source)
+        try:
+            token = revision_token(json.loads(path.with_name(path.name + ".json").read_text()))
+        except (OSError, ValueError):
+            token = ""
+        if token:
+            return token
+        try:
+            st = path.stat()
+        except OSError:
+            return ""
+        return revision_token({
+            "last_modified": str(st.st_mtime_ns),
+            "content_length": str(st.st_size),
+        })
+
+    cached = _source_revision_cache.get(source)
+    if cached is not None:
+        return cached
+    token = revision_token(probe_revision(source))
+    _source_revision_cache.set(source, token, ttl=None if token else _FAILED_PROBE_TTL)
+    return token
+
+
+def forget_source_revision(source: str) -> None:
+    """Probe a remote raster source again on the next :func:`source_revision`."""
+    _source_revision_cache.delete(source)
+
+
+@dataclass(frozen=True)
+class DataVersion:
+    """The version of one served resource, and its HTTP caching policy."""
+    token: str
+
+    def etag(self, variant: str = "") -> str:
+        """Strong ETag of the *variant* representation (e.g. ``"png"``)."""
+        return f'"{self.token}.{variant}"' if variant else f'"{self.token}"'
+
+    def not_modified(self, request, variant: str = "") -> Optional[HttpResponse]:
+        """
+        Return the 304 (or 412) response for a conditional request that
+        matches this version, or None if the resource must be sent.
+        """
+        response = get_conditional_response(request, etag=self.etag(variant))
+        if response is not None:
+            self.apply(request, response, variant)
+        return response
+
+    def apply(self, request, response: HttpResponse, variant: str = "") -> HttpResponse:
+        """Set the ETag, version and Cache-Control headers on *response*."""
+        response["ETag"] = self.etag(variant)
+        response[VERSION_HEADER] = self.token
+        if request.GET.get(VERSION_PARAM) == self.token:
+            patch_cache_control(response, public=True, max_age=IMMUTABLE_MAX_AGE, immutable=True)
+        else:
+            patch_cache_control(response, public=True, no_cache=True)
+        return response
+
+
+def _version(*parts) -> DataVersion:
+    basis = ":".join(str(p) for p in parts)
+    return DataVersion(hashlib.sha1(basis.encode()).hexdigest()[:16])
+
+
+def data_version() -> DataVersion:
+    """Version of the loaded vector data (watersheds, subcatchments, channels)."""
+    return _version(get_generation())
+
+
+def raster_version(runid: str, rel_path: str) -> DataVersion:
+    """Version of the tiles of a raster."""
+    return _version(get_generation(), raster_revision(runid, rel_path))
+
+
+def clear_version_caches() -> None:
+    """Drop cached generations and revisions (useful for testing)."""
+    _generation_cache.clear()
+    _revision_cache.clear()
+    _source_revision_cache.clear()
@@ -1,7 +1,30 @@
+from django.utils.cache import patch_vary_headers
 from rest_framework import viewsets
+from rest_framework.exceptions import NotFound
 from rest_framework.views import APIView
 from server.watershed.models import Watershed, Subcatchment, Channel
-from server.watershed.geojson import geojson_response, geojson_feature_response
+from server.watershed.filters import filter_features, paginate, parse_page
+from server.watershed.geojson import (
+    DEFAULT_PRECISION,
+    POSTGRES_ENGINE,
+    accepts_gzip,
+    geojson_aggregate_response,
+    geojson_feature_response,
+    geojson_response,
+    geojson_stream_response,
+    get_geojson_config,
+)
+from server.watershed.geometry_levels import level_for_zoom, level_from_query
+from server.watershed.precomputed import (
+    SIMPLIFIED_WATERSHEDS,
+    WATERSHEDS,
+    blob_response,
+    channels_key,
+    subcatchments_key,
+)
+from server.watershed.vector_tiles import mvt_response, tile_exists
+from server.watershed.versioning import VERSION_PARAM, data_version
+from drf_spectacular.types import OpenApiTypes
 from drf_spectacular.utils import extend_schema, OpenApiParameter, OpenApiResponse
 from server.watershed.schema_serializers import (
     WatershedFeatureCollectionSerializer,
@@ -12,69 +35,231 @@ from server.watershed.schema_serializers import (
     SchemaPlaceholderSerializer,
 )
 
+# Feature properties of each layer, shared by the GeoJSON and vector tile views.
+WATERSHED_PROPERTIES = (
+    'pws_name',
+    'county_nam',
+    'shape_area',
+    'srcname',
+    'srctype',
+    'owner_type',
+    'pop_group',
+    'treat_type',
+    'huc10_utility_count',
+    'huc10_pws_names',
+)
+
+SUBCATCHMENT_PROPERTIES = (
+    'topazid',
+    'weppid',
+    'slope_scalar',
+    'length',
+    'width',
+    'aspect',
+    'hillslope_area',
+    'simple_texture',
+)
+
+CHANNEL_PROPERTIES = (
+    'topazid',
+    'weppid',
+    'order',
+)
+
+_GEOMETRY_LEVEL_PARAMETERS = [
+    OpenApiParameter(name='simplified_geom', description='Use simplified geometry', required=False, type=bool),
+    OpenApiParameter(
+        name='zoom',
+        description='Web map zoom the geometry is displayed at; selects the coarsest level of detail that looks identical',
+        required=False,
+        type=int,
+    ),
+    OpenApiParameter(
+        name='tolerance',
+        description='Largest acceptable simplification in degrees; selects the coarsest level of detail within it',
+        required=False,
+        type=float,
+    ),
+]
+
+# Attribute filters accepted by each list endpoint.
+WATERSHED_FILTERS = ('state', 'county_nam', 'srctype', 'owner_type', 'pop_group', 'huc10_id')
+SUBCATCHMENT_FILTERS = ('topazid', 'weppid', 'simple_texture')
+CHANNEL_FILTERS = ('topazid', 'weppid', 'order')
+
+_FILTER_PARAMETERS = [
+    OpenApiParameter(
+        name='bbox',
+        description='Only features intersecting west,south,east,north (EPSG:4326 degrees)',
+        required=False,
+        type=str,
+    ),
+    OpenApiParameter(name='limit', description='Page size (enables paging, at most 5000)', required=False, type=int),
+    OpenApiParameter(name='offset', description='Features to skip when paging', required=False, type=int),
+]
+
+
+def _attribute_parameters(names):
+    return [
+        OpenApiParameter(name=name, description=f'Only features with this {name} (repeat for any of several)', required=False, type=str)
+        for name in names
+    ]
+
+
+_MVT_RESPONSES = {
+    (200, 'application/vnd.mapbox-vector-tile'): OpenApiResponse(
+        response=OpenApiTypes.BINARY,
+        description='Mapbox Vector Tile (empty when no feature intersects the tile)',
+    ),
+}
+
+
+def _geometry_source(request):
+    """Return ``(geo_field, precision)`` for the requested level of detail."""
+    level = level_from_query(request.query_params)
+    if level is not None:
+        return level.expression, level.precision
+    simplified = request.query_params.get('simplified_geom', '').lower() == 'true'
+    return ('simplified_geom' if simplified else 'geom'), DEFAULT_PRECISION
+
+
+# Query parameters that still select a precomputed collection.
+_PRECOMPUTED_PARAMETERS = {'simplified_geom', VERSION_PARAM}
+
+
+def _precomputed(request, key):
+    """Stored body of an unfiltered collection, or None to build it."""
+    if not get_geojson_config().precomputed or set(request.query_params) - _PRECOMPUTED_PARAMETERS:
+        return None
+    return blob_response(request, key)
+
+
+def _collection_variant(request):
+    """
+    ETag variant of a collection response.  Clients accepting gzip may be
+    sent a gzip-encoded body (precomputed or streamed), which must not share
+    the ETag of the identity body.
+    """
+    return 'gz' if accepts_gzip(request) else ''
+
+
+def _collection_not_modified(request, version):
+    """304 response to a conditional collection request, or None."""
+    not_modified = version.not_modified(request, _collection_variant(request))
+    if not_modified is not None:
+        patch_vary_headers(not_modified, ('Accept-Encoding',))
+    return not_modified
+
+
+def _apply_collection_version(request, version, response):
+    """Set the version headers of a collection response."""
+    patch_vary_headers(response, ('Accept-Encoding',))
+    return version.apply(request, response, _collection_variant(request))
+
+
+def _feature_collection(request, queryset, attributes, order_by, **kwargs):
+    """GeoJSON response of the filtered (and, if requested, paged) *queryset*."""
+    queryset = filter_features(queryset, request.query_params, attributes=attributes)
+    page = parse_page(request.query_params)
+    members = None
+    if page is not None:
+        queryset, members = paginate(request, queryset, page, order_by)
+
+    config = get_geojson_config()
+    if config.stream:
+        return geojson_stream_response(
+            queryset,
+            members=members,
+            chunk_size=config.chunk_size,
+            compress=config.compress_for(request),
+            **kwargs,
+        )
+    if config.engine == POSTGRES_ENGINE:
+        return geojson_aggregate_response(queryset, members=members, **kwargs)
+    return geojson_response(queryset, members=members, **kwargs)
+
+
+def _vector_tile(request, queryset, layer, z, x, y, **kwargs):
+    """Versioned vector tile response shared by the *TileView classes."""
+    if not tile_exists(z, x, y):
+        raise NotFound("Tile coordinates are out of range.")
+
+    version = data_version()
+    not_modified = version.not_modified(request, 'mvt')
+    if not_modified is not None:
+        return not_modified
+
+    response = mvt_response(queryset, layer, z, x, y, **kwargs)
+    return version.apply(request, response, 'mvt')
+
 
 class WatershedViewSet(viewsets.ReadOnlyModelViewSet):
     """
     Provides read-only access to watersheds.
     """
-    _properties = (
-        'pws_name',
-        'county_nam',
-        'shape_area',
-        'srcname',
-        'srctype',
-        'owner_type',
-        'pop_group',
-        'treat_type',
-        'huc10_utility_count',
-        'huc10_pws_names',
-    )
+    _properties = WATERSHED_PROPERTIES
     serializer_class = SchemaPlaceholderSerializer
 
-    # No logic changes, only decorating for documentation
     @extend_schema(
         operation_id='watershed_list',
         summary='List watersheds',
-        parameters=[
-            OpenApiParameter(name='simplified_geom', description='Use simplified geometry', required=False, type=bool),
-        ],
+        parameters=_GEOMETRY_LEVEL_PARAMETERS + _FILTER_PARAMETERS + _attribute_parameters(WATERSHED_FILTERS),
         responses={
             200: OpenApiResponse(response=WatershedFeatureCollectionSerializer, description='GeoJSON FeatureCollection of watersheds'),
         },
     )
     def list(self, request, *args, **kwargs):
-        """Gets all the available watersheds with the original or simplified geometries (depending on simplified_geom query parameter)"""
+        """Gets all the available watersheds at the level of detail selected by the zoom, tolerance or simplified_geom query parameter"""
+        version = data_version()
+        not_modified = _collection_not_modified(request, version)
+        if not_modified is not None:
+            return not_modified
+
         simplified = request.query_params.get('simplified_geom', '').lower() == 'true'
-        geo_field = 'simplified_geom' if simplified else 'geom'
-        return geojson_response(
+        response = _precomputed(request, SIMPLIFIED_WATERSHEDS if simplified else WATERSHEDS)
+        if response is not None:
+            return _apply_collection_version(request, version, response)
+
+        geo_field, precision = _geometry_source(request)
+        response = _feature_collection(
+            request,
             Watershed.objects.all(),
+            WATERSHED_FILTERS,
+            'runid',
             geo_field=geo_field,
             id_field='runid',
             properties=self._properties,
+            precision=precision,
         )
+        return _apply_collection_version(request, version, response)
     
-    # No logic changes, only decorating for documentation
     @extend_schema(
         operation_id='watershed_retrieve',
         summary='Retrieve watershed',
-        parameters=[
-            OpenApiParameter(name='simplified_geom', description='Use simplified geometry', required=False, type=bool),
-        ],
+        parameters=_GEOMETRY_LEVEL_PARAMETERS,
         responses={
             200: OpenApiResponse(response=WatershedFeatureSerializer, description='GeoJSON Feature for the requested watershed'),
             404: OpenApiResponse(response=NotFoundSerializer, description='Watershed was not found'),
         },
     )
     def retrieve(self, request, *args, **kwargs):
-        """Gets the specified watershed with the original or simplified geometries (depending on simplified_geom query parameter)"""
-        simplified = request.query_params.get('simplified_geom', '').lower() == 'true'
-        geo_field = 'simplified_geom' if simplified else 'geom'
-        return geojson_feature_response(
+        """Gets the specified watershed at the level of detail selected by the zoom, tolerance or simplified_geom query parameter"""
+        version = data_version()
+        not_modified = version.not_modified(request)
+        if not_modified is not None:
+            return not_modified
+
+        geo_field, precision = _geometry_source(request)
+        response = geojson_feature_response(
             Watershed.objects.filter(pk=kwargs['pk']),
             geo_field=geo_field,
             id_field='runid',
             properties=self._properties,
+            precision=precision,
         )
+        if response.status_code != 200:
+            return response
+        return version.apply(request, response)
 
 class WatershedSubcatchmentListView(APIView):
     """
@@ -83,26 +268,31 @@ class WatershedSubcatchmentListView(APIView):
     @extend_schema(
         operation_id='watershed_subcatchments_list',
         summary='List watershed subcatchments',
+        parameters=_FILTER_PARAMETERS + _attribute_parameters(SUBCATCHMENT_FILTERS),
         responses={
             200: OpenApiResponse(response=SubcatchmentFeatureCollectionSerializer, description='GeoJSON FeatureCollection of subcatchments'),
         },
     )
     def get(self, request, runid):
+        version = data_version()
+        not_modified = _collection_not_modified(request, version)
+        if not_modified is not None:
+            return not_modified
+
+        response = _precomputed(request, subcatchments_key(runid))
+        if response is not None:
+            return _apply_collection_version(request, version, response)
+
         qs = Subcatchment.objects.filter(watershed_id=runid)
-        return geojson_response(
+        response = _feature_collection(
+            request,
             qs,
+            SUBCATCHMENT_FILTERS,
+            'id',
             geo_field='geom',
-            properties=(
-                'topazid',
-                'weppid',
-                'slope_scalar',
-                'length',
-                'width',
-                'aspect',
-                'hillslope_area',
-                'simple_texture',
-            ),
+            properties=SUBCATCHMENT_PROPERTIES,
         )
+        return _apply_collection_version(request, version, response)
     
 class WatershedChannelListView(APIView):
     """
@@ -111,18 +301,96 @@ class WatershedChannelListView(APIView):
     @extend_schema(
         operation_id='watershed_channels_list',
         summary='List watershed channels',
+        parameters=_FILTER_PARAMETERS + _attribute_parameters(CHANNEL_FILTERS),
         responses={
             200: OpenApiResponse(response=ChannelFeatureCollectionSerializer, description='GeoJSON FeatureCollection of channels'),
         },
     )
     def get(self, request, runid):
+        version = data_version()
+        not_modified = _collection_not_modified(request, version)
+        if not_modified is not None:
+            return not_modified
+
+        response = _precomputed(request, channels_key(runid))
+        if response is not None:
+            return _apply_collection_version(request, version, response)
+
         qs = Channel.objects.filter(watershed_id=runid)
-        return geojson_response(
+        response = _feature_collection(
+            request,
             qs,
+            CHANNEL_FILTERS,
+            'id',
             geo_field='geom',
-            properties=(
-                'topazid',
-                'weppid',
-                'order',
-            ),
-        )
\ No newline at end of file
+            properties=CHANNEL_PROPERTIES,
+        )
+        return _apply_collection_version(request, version, response)
+
+
+class WatershedTileView(APIView):
+    """
+    Vector tiles of all watershed boundaries, e.g.:
+        /api/watershed/tiles/{z}/{x}/{y}.mvt
+
+    The tile's single layer, "watersheds", carries the list endpoint's
+    properties plus ``runid``.  Each zoom is cut from the coarsest stored
+    level of detail that looks identical (see geometry_levels.py).
+    """
+    @extend_schema(
+        operation_id='watershed_tiles_mvt_retrieve',
+        summary='Get watershed vector tile',
+        responses=_MVT_RESPONSES,
+    )
+    def get(self, request, z: int, x: int, y: int):
+        return _vector_tile(
+            request,
+            Watershed.objects.all(),
+            'watersheds',
+            z, x, y,
+            id_field='runid',
+            properties=WATERSHED_PROPERTIES,
+            source=level_for_zoom(z).expression,
+        )
+
+
+class WatershedSubcatchmentTileView(APIView):
+    """
+    Vector tiles of the subcatchments of a watershed (layer "subcatchments",
+    feature id = subcatchment id), e.g.:
+        /api/watershed/{runid}/subcatchments/tiles/{z}/{x}/{y}.mvt
+    """
+    @extend_schema(
+        operation_id='watershed_subcatchments_tiles_mvt_retrieve',
+        summary='Get watershed subcatchment vector tile',
+        responses=_MVT_RESPONSES,
+    )
+    def get(self, request, runid, z: int, x: int, y: int):
+        return _vector_tile(
+            request,
+            Subcatchment.objects.filter(watershed_id=runid),
+            'subcatchments',
+            z, x, y,
+            properties=SUBCATCHMENT_PROPERTIES,
+        )
+
+
+class WatershedChannelTileView(APIView):
+    """
+    Vector tiles of the channels of a watershed (layer "channels", feature
+    id = channel id), e.g.:
+        /api/watershed/{runid}/channels/tiles/{z}/{x}/{y}.mvt
+    """
+    @extend_schema(
+        operation_id='watershed_channels_tiles_mvt_retrieve',
+        summary='Get watershed channel vector tile',
+        responses=_MVT_RESPONSES,
+    )
+    def get(self, request, runid, z: int, x: int, y: int):
+        return _vector_tile(
+            request,
+            Channel.objects.filter(watershed_id=runid),
+            'channels',
+            z, x, y,
+            properties=CHANNEL_PROPERTIES,
+        )